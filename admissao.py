@@ -0,0 +1,134 @@
+"""
+Controle de admissão das requisições do aplicativo.py, por faixa de rotas.
+
+Cada faixa tem um limite de requisições em andamento e uma fila curta. Uma
+requisição que chega com a faixa cheia espera na fila, em ordem de chegada,
+até espera_max_s segundos; é recusada na hora (com o tempo sugerido para
+tentar de novo) se a fila está cheia ou se a espera estimada, pela duração
+média recente das requisições da faixa, já passa do prazo. Requisições na
+fila ocupam uma thread do worker, então limite + fila de uma faixa lenta
+deve ficar abaixo das threads, deixando as restantes para as outras faixas.
+"""
+import math
+import time
+import itertools
+import threading
+from collections import deque
+
+# Peso de cada nova duração na média móvel exponencial da faixa
+PESO_MEDIA = 0.2
+
+
+class Recusada(Exception):
+    def __init__(self, faixa, motivo, tentar_em_s):
+        super().__init__(f"Faixa {faixa} recusou a requisição ({motivo}).")
+        self.faixa = faixa
+        self.motivo = motivo
+        self.tentar_em_s = tentar_em_s
+
+
+class Faixa:
+    def __init__(self, nome, limite, fila_max=0, espera_max_s=1.0):
+        self.nome = nome
+        self.limite = limite
+        self.fila_max = fila_max
+        self.espera_max_s = espera_max_s
+        self.em_andamento = 0
+        self.duracao_media_s = None
+        self._fila = deque()
+        self._senhas = itertools.count()
+        self._cond = threading.Condition()
+        self.estatisticas = {'admitidas': 0, 'enfileiradas': 0, 'fila_cheia': 0, 'espera_estimada': 0,
+                             'prazo_esgotado': 0, 'maximo_fila': 0, 'espera_total_s': 0.0}
+
+    def _estimar_espera(self, posicao):
+        """
+        Segundos até a posicao-ésima requisição da fila (0 = a próxima) ser
+        admitida: com a faixa cheia, uma vaga abre a cada duracao_media_s / limite.
+        """
+        if self.duracao_media_s is None:
+            return None
+        return (posicao + 1) * self.duracao_media_s / self.limite
+
+    def _recusar(self, motivo, tentar_em_s):
+        self.estatisticas[motivo] += 1
+        return Recusada(self.nome, motivo, max(1, math.ceil(tentar_em_s)))
+
+    def entrar(self):
+        """Admite a requisição (retorna o instante da admissão) ou levanta Recusada."""
+        with self._cond:
+            if self.em_andamento < self.limite and not self._fila:
+                self.em_andamento += 1
+                self.estatisticas['admitidas'] += 1
+                return time.monotonic()
+            estimativa = self._estimar_espera(len(self._fila))
+            if len(self._fila) >= self.fila_max:
+                raise self._recusar('fila_cheia', estimativa or self.espera_max_s)
+            if estimativa is not None and estimativa > self.espera_max_s:
+                raise self._recusar('espera_estimada', estimativa)
+            senha = next(self._senhas)
+            self._fila.append(senha)
+            self.estatisticas['enfileiradas'] += 1
+            self.estatisticas['maximo_fila'] = max(self.estatisticas['maximo_fila'], len(self._fila))
+            chegada = time.monotonic()
+            limite = chegada + self.espera_max_s
+            while not (self._fila[0] == senha and self.em_andamento < self.limite):
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._fila.remove(senha)
+                    # A próxima da fila pode ter ficado à frente
+                    self._cond.notify_all()
+                    raise self._recusar('prazo_esgotado', self._estimar_espera(len(self._fila)) or self.espera_max_s)
+                self._cond.wait(restante)
+            self._fila.popleft()
+            self.em_andamento += 1
+            agora = time.monotonic()
+            self.estatisticas['admitidas'] += 1
+            self.estatisticas['espera_total_s'] += agora - chegada
+            self._cond.notify_all()
+            return agora
+
+    def sair(self, admitida_em):
+        with self._cond:
+            self.em_andamento -= 1
+            duracao = time.monotonic() - admitida_em
+            if self.duracao_media_s is None:
+                self.duracao_media_s = duracao
+            else:
+                self.duracao_media_s += PESO_MEDIA * (duracao - self.duracao_media_s)
+            self._cond.notify_all()
+
+    def metricas(self):
+        with self._cond:
+            enfileiradas = self.estatisticas['enfileiradas']
+            return {
+                'limite': self.limite,
+                'em_andamento': self.em_andamento,
+                'fila': len(self._fila),
+                'fila_max': self.fila_max,
+                'espera_max_s': self.espera_max_s,
+                'duracao_media_s': round(self.duracao_media_s, 3) if self.duracao_media_s is not None else None,
+                'admitidas': self.estatisticas['admitidas'],
+                'enfileiradas': enfileiradas,
+                'espera_media_s': round(self.estatisticas['espera_total_s'] / enfileiradas, 3) if enfileiradas else 0.0,
+                'maximo_fila': self.estatisticas['maximo_fila'],
+                'recusadas': {motivo: self.estatisticas[motivo]
+                              for motivo in ('fila_cheia', 'espera_estimada', 'prazo_esgotado')},
+            }
+
+
+class ControleAdmissao:
+    def __init__(self, faixas, rotas):
+        """
+        faixas: {nome: Faixa}; rotas: {endpoint do Flask: nome da faixa}.
+        Endpoints fora de rotas não passam pelo controle.
+        """
+        self.faixas = faixas
+        self.rotas = rotas
+
+    def faixa(self, endpoint):
+        nome = self.rotas.get(endpoint)
+        return self.faixas[nome] if nome is not None else None
+
+    def metricas(self):
+        return {nome: faixa.metricas() for nome, faixa in self.faixas.items()}
@@ -1,21 +1,30 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, g
 from flask_cors import CORS
 import os
 import logging
-from langchain.memory import ConversationBufferMemory
-from langchain.schema import AIMessage, HumanMessage
-from groq import Groq
-from langchain_mongodb import MongoDBAtlasVectorSearch
+import threading
+import time
+from langchain_core.embeddings import Embeddings
 from dotenv import load_dotenv
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
 import datetime
-import urllib.parse
-import cohere
-from langchain.embeddings.base import Embeddings
+import random
 import subprocess
 import sys
 import json
+import hmac
+import uuid
+from contextlib import contextmanager, ExitStack
+import embeddings_compactos
+import busca_hibrida
+import travas
+import cache_conversas
+import perfilador
+import admissao
+from perfilador import etapa
+from mensagens import Mensagem, Conversa, HUMANA, IA
+
+# groq, cohere and pymongo (bson included) are imported on first use: they add
+# seconds to worker startup and most requests need only some of them
 
 # Load environment variables from .env file
 load_dotenv()
@@ -26,81 +35,222 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 app = Flask(__name__)
 CORS(app)  # Initialize CORS to allow cross-origin requests
 
-# Initialize the Groq client with the API key
-api_key = os.getenv("GROQ_API_KEY")
-if not api_key:
-    raise ValueError("A chave de API do Groq não foi encontrada. Verifique se está definida no arquivo .env.")
-client = Groq(api_key=api_key)
-
-# Initialize the Cohere API key
-cohere_api_key = os.getenv("COHERE_API_KEY")
-if not cohere_api_key:
-    raise ValueError("A chave de API do Cohere não foi encontrada. Verifique se está definida no arquivo .env.")
-
 # Create the embeddings class using Cohere API
 class CohereEmbeddings(Embeddings):
-    def __init__(self, api_key, model="embed-multilingual-v2.0", truncate="RIGHT"):
-        self.client = cohere.Client(api_key)
+    def __init__(self, api_key, model=embeddings_compactos.MODELO_PADRAO, truncate="RIGHT"):
+        self.client = embeddings_compactos.cliente_cohere(api_key)
         self.model = model
         self.truncate = truncate
 
+    def _embed(self, texts, input_type):
+        # v3+ models need to know whether they embed documents or queries
+        return embeddings_compactos.embedar(self.client, texts, self.model, input_type, self.truncate)
+
     def embed_documents(self, texts):
-        response = self.client.embed(
-            texts=texts,
-            model=self.model,
-            truncate=self.truncate,
-        )
-        return response.embeddings
+        return self._embed(texts, 'search_document')
 
     def embed_query(self, text):
-        response = self.client.embed(
-            texts=[text],
-            model=self.model,
-            truncate=self.truncate,
-        )
-        return response.embeddings[0]
-
-# Initialize the embeddings model with Cohere
-embedding_model = CohereEmbeddings(
-    api_key=cohere_api_key,
-    model="embed-multilingual-v2.0",  # Ensure the model name is correct
-)
-
-# Load MongoDB credentials
-MONGODB_USERNAME = os.getenv('MONGODB_USERNAME')
-MONGODB_PASSWORD = os.getenv('MONGODB_PASSWORD')
-
-if not MONGODB_USERNAME or not MONGODB_PASSWORD:
-    raise ValueError("Nome de usuário ou senha do MongoDB não encontrados no arquivo .env.")
-
-username = urllib.parse.quote_plus(MONGODB_USERNAME)
-password = urllib.parse.quote_plus(MONGODB_PASSWORD)
-
-cluster_host = 'hackathonmeta.pvjrb.mongodb.net'
-
-uri = f"mongodb+srv://{username}:{password}@{cluster_host}/?retryWrites=true&w=majority&appName=HackathonMeta&tls=true"
-
-client_mongo = MongoClient(uri, server_api=ServerApi('1'))
-
-try:
-    client_mongo.admin.command('ping')
-    logging.info("Conexão bem-sucedida com o MongoDB.")
-except Exception as e:
-    logging.error(f"Erro ao conectar ao MongoDB: {e}")
-    raise
-
-db = client_mongo['DadosUsuários']
-collection_contexto = db['Contexto']
-collection_historico = db['HistoricoConversa']
-collection_oportunidades = db['Oportunidades']  # Collection for opportunities
+        return self._embed([text], 'search_query')[0]
+
+# Clients are created once per process, on first use
+_clientes = {}
+_clientes_lock = threading.RLock()
+
+def _obter_cliente(nome, criar):
+    cliente = _clientes.get(nome)
+    if cliente is None:
+        with _clientes_lock:
+            cliente = _clientes.get(nome)
+            if cliente is None:
+                cliente = _clientes[nome] = criar()
+    return cliente
+
+def _instalar_cassete():
+    # CASSETE_MODO records or replays the Groq and Cohere calls (src/crew/cassettes.py)
+    if not os.getenv('CASSETE_MODO'):
+        return
+    diretorio_crew = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src', 'crew')
+    if diretorio_crew not in sys.path:
+        sys.path.append(diretorio_crew)
+    import cassettes
+
+    cassettes.install_from_env(os.path.join(diretorio_crew, 'cassetes', 'aplicativo.json'), targets=('groq', 'cohere'))
+
+def _criar_cliente_groq():
+    from groq import Groq
+
+    _instalar_cassete()
+
+    # Initialize the Groq client with the API key
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise ValueError("A chave de API do Groq não foi encontrada. Verifique se está definida no arquivo .env.")
+    return Groq(api_key=api_key)
+
+def _criar_embedding_model(modelo):
+    _instalar_cassete()
+    cohere_api_key = os.getenv("COHERE_API_KEY")
+    if not cohere_api_key:
+        raise ValueError("A chave de API do Cohere não foi encontrada. Verifique se está definida no arquivo .env.")
+    return CohereEmbeddings(api_key=cohere_api_key, model=modelo)
+
+def _criar_db():
+    import conexao_mongo
+
+    # Connect to MongoDB (MONGODB_URI overrides the Atlas credentials)
+    return conexao_mongo.conectar()[conexao_mongo.NOME_BANCO]
+
+def obter_cliente_groq():
+    return _obter_cliente('groq', _criar_cliente_groq)
+
+# Completions on the user's turn: per-call deadline, a hedged copy after the
+# recent p95 and failover to the secondary provider/model (cliente_llm.py)
+LLM_MODELO = os.getenv('LLM_MODELO', 'llama-3.2-90b-text-preview')
+LLM_PRAZO_S = float(os.getenv('LLM_PRAZO_S', 20))
+LLM_HEDGE_PERCENTIL = float(os.getenv('LLM_HEDGE_PERCENTIL', 95))
+LLM_HEDGE_MAX_FRACAO = float(os.getenv('LLM_HEDGE_MAX_FRACAO', 0.1))
+LLM_DISJUNTOR_FALHAS = int(os.getenv('LLM_DISJUNTOR_FALHAS', 5))
+LLM_DISJUNTOR_PAUSA_S = float(os.getenv('LLM_DISJUNTOR_PAUSA_S', 30))
+
+def _criar_cliente_completions():
+    import cliente_llm
+
+    def disjuntor():
+        return cliente_llm.Disjuntor(LLM_DISJUNTOR_FALHAS, LLM_DISJUNTOR_PAUSA_S)
+
+    # Retries are decided by ClienteCompletions, within the deadline
+    primario = obter_cliente_groq().with_options(max_retries=0)
+    provedores = [cliente_llm.Provedor('groq', lambda: primario, LLM_MODELO, disjuntor())]
+    url_secundario = os.getenv('LLM_SECUNDARIO_URL')
+    modelo_secundario = os.getenv('LLM_SECUNDARIO_MODELO')
+    if url_secundario or modelo_secundario:
+        secundario = primario
+        if url_secundario:
+            from groq import Groq
+
+            chave = os.getenv('LLM_SECUNDARIO_API_KEY') or os.getenv('GROQ_API_KEY')
+            secundario = Groq(api_key=chave, base_url=url_secundario, max_retries=0)
+        provedores.append(cliente_llm.Provedor(
+            'secundario', lambda: secundario, modelo_secundario or LLM_MODELO, disjuntor()
+        ))
+    hedge_s = os.getenv('LLM_HEDGE_S')
+    return cliente_llm.ClienteCompletions(
+        provedores,
+        prazo_s=LLM_PRAZO_S,
+        atraso_hedge_s=float(hedge_s) if hedge_s else None,
+        percentil_hedge=LLM_HEDGE_PERCENTIL,
+        fracao_max_hedges=LLM_HEDGE_MAX_FRACAO,
+    )
 
-vectorstore = MongoDBAtlasVectorSearch(
-    collection=collection_contexto,
-    embedding=embedding_model,
-    index_name='contexto',
-    text_key='content',
-    embedding_key='embedding'
-)
+def obter_cliente_completions():
+    return _obter_cliente('completions', _criar_cliente_completions)
+
+def obter_embedding_model(modelo=None):
+    # Defaults to the model of the active Contexto configuration
+    modelo = modelo or obter_configuracao_embeddings()['modelo']
+    return _obter_cliente(('embeddings', modelo), lambda: _criar_embedding_model(modelo))
+
+def obter_db():
+    return _obter_cliente('db', _criar_db)
+
+def obter_colecao(nome):
+    # Collections: Contexto, HistoricoConversa, Oportunidades
+    return obter_db()[nome]
+
+# Active Contexto collection/model/format, re-read every EMBEDDINGS_CONFIG_TTL
+# seconds so a switch made by migrar_embeddings.py reaches running workers
+EMBEDDINGS_CONFIG_TTL = float(os.getenv('EMBEDDINGS_CONFIG_TTL', 30))
+_configuracao_embeddings = (0.0, None)
+
+def obter_configuracao_embeddings():
+    global _configuracao_embeddings
+    lida_em, configuracao = _configuracao_embeddings
+    if configuracao is None or time.monotonic() - lida_em > EMBEDDINGS_CONFIG_TTL:
+        configuracao = embeddings_compactos.configuracao_ativa(obter_db())
+        _configuracao_embeddings = (time.monotonic(), configuracao)
+    return configuracao
+
+# Concurrent requests of the same user wait in a per-user queue:
+# TRAVA_USUARIO=processo (threads of this worker), mongo (all workers, via
+# the TravasUsuario collection) or nenhuma. Without the lock, or when the
+# wait times out, the conversation version still prevents lost writes
+TRAVA_USUARIO = os.getenv('TRAVA_USUARIO', 'processo')
+TRAVA_USUARIO_ESPERA_S = float(os.getenv('TRAVA_USUARIO_ESPERA_S', 30))
+TRAVA_USUARIO_PRAZO_S = float(os.getenv('TRAVA_USUARIO_PRAZO_S', 300))
+HISTORICO_TENTATIVAS = int(os.getenv('HISTORICO_TENTATIVAS', 8))
+
+def _criar_travas_usuario():
+    if TRAVA_USUARIO == 'mongo':
+        return travas.TravasMongo(obter_colecao('TravasUsuario'), prazo_s=TRAVA_USUARIO_PRAZO_S)
+    return travas.TravasLocais()
+
+def obter_travas_usuario():
+    if TRAVA_USUARIO == 'nenhuma':
+        return None
+    return _obter_cliente('travas_usuario', _criar_travas_usuario)
+
+@contextmanager
+def trava_usuario(user_id):
+    travas_usuario = obter_travas_usuario()
+    if travas_usuario is None:
+        yield
+        return
+    with travas_usuario.trava(user_id, TRAVA_USUARIO_ESPERA_S) as obtida:
+        if not obtida:
+            logging.warning(f"Sem a trava do usuário {user_id} após {TRAVA_USUARIO_ESPERA_S:.0f}s; "
+                            f"seguindo com a verificação de versão.")
+        yield
+
+def descartar_clientes():
+    """
+    Forgets clients created in this process, e.g. in a pre-fork master.
+    MongoClient and the HTTP pools must not be shared across a fork.
+    """
+    global _clientes_lock, _configuracao_embeddings
+    _clientes.clear()
+    _clientes_lock = threading.RLock()
+    _configuracao_embeddings = (0.0, None)
+
+def aquecer():
+    """
+    Creates the clients and opens their connections before the worker takes
+    traffic (called by gunicorn.conf.py after the fork). Set AQUECER_APIS=0
+    to skip the calls to Groq and Cohere.
+    """
+    inicio = time.perf_counter()
+    obter_db().command('ping')
+    configuracao = obter_configuracao_embeddings()
+    embedding_model = obter_embedding_model(configuracao['modelo'])
+    cliente_groq = obter_cliente_groq()
+    obter_cliente_completions()
+    _garantir_indice_historico()
+    if os.getenv('AQUECER_APIS', '1') == '1':
+        for nome, chamada in (
+            ('Groq', lambda: cliente_groq.models.list()),
+            ('Cohere', lambda: embedding_model.embed_documents(['aquecimento'])),
+        ):
+            try:
+                chamada()
+            except Exception as e:
+                logging.warning(f"Aquecimento da conexão com {nome} falhou: {e}")
+    logging.info(f"Worker {os.getpid()} aquecido em {time.perf_counter() - inicio:.2f}s.")
+
+# Long-term memory: only the most recent messages go verbatim to the model;
+# older facts come from a user_id-filtered search over Contexto
+MEMORIA_MENSAGENS_RECENTES = int(os.getenv('MEMORIA_MENSAGENS_RECENTES', 6))
+MEMORIA_TOP_K = int(os.getenv('MEMORIA_TOP_K', 5))
+MEMORIA_MAX_CARACTERES = int(os.getenv('MEMORIA_MAX_CARACTERES', 1500))
+# hibrida fuses a user_id-filtered keyword search (busca_hibrida) with the
+# vector search; vetorial uses the vectors only
+MEMORIA_BUSCA = os.getenv('MEMORIA_BUSCA', 'hibrida')
+# With compact (int8/float16) embeddings, re-embed the best candidates at full
+# precision and re-order them by the exact cosine: better recall, one extra
+# Cohere call per search
+EMBEDDINGS_RERANQUEAR = os.getenv('EMBEDDINGS_RERANQUEAR', '0') == '1'
+# Disabled after the first failure (cluster without Atlas Search, local MongoDB)
+_vector_search_atlas_disponivel = True
+# Contexto collections whose (user_id, palavras) index was already ensured
+_indices_palavras = set()
 
 system_prompt = (
     "Você é um assistente especializado em ajudar usuários a encontrar oportunidades de desenvolvimento profissional. "
@@ -126,68 +276,258 @@ def load_users():
         users = json.load(f)
     return users
 
+def _mensagens_do_documento(documento):
+    messages = (Mensagem.do_documento(msg) for msg in (documento or {}).get('messages', []))
+    return [msg for msg in messages if msg is not None]
+
+# One conversation document per user_id; with the unique index a racing
+# first insert fails instead of creating a second document
+_indice_historico_criado = False
+
+def _garantir_indice_historico():
+    global _indice_historico_criado
+    if _indice_historico_criado:
+        return
+    try:
+        obter_colecao('HistoricoConversa').create_index([('user_id', 1)], unique=True, name='user_id_unico')
+    except Exception as e:
+        logging.warning(f"Não foi possível criar o índice único de HistoricoConversa.user_id: {e}")
+    _indice_historico_criado = True
+
 def carregar_memoria(user_id):
     logging.info(f"Carregando memória da conversa do MongoDB para o usuário {user_id}...")
-    conversa = collection_historico.find_one({'user_id': user_id})
-    if conversa and 'messages' in conversa:
-        messages_data = conversa['messages']
-        messages = []
-        for msg in messages_data:
-            if msg['type'] == 'human':
-                messages.append(HumanMessage(content=msg['content']))
-            elif msg['type'] == 'ai':
-                messages.append(AIMessage(content=msg['content']))
+    documento = obter_colecao('HistoricoConversa').find_one({'user_id': user_id})
+    if documento and 'messages' in documento:
         logging.info("Memória carregada com sucesso.")
-        return messages
     else:
         logging.info("Nenhuma memória anterior encontrada para este usuário.")
-        return []
-
-def salvar_memoria(user_id, messages):
-    logging.info(f"Salvando memória da conversa no MongoDB para o usuário {user_id}...")
-    messages_data = []
-    for msg in messages:
-        if isinstance(msg, HumanMessage):
-            msg_type = 'human'
-        elif isinstance(msg, AIMessage):
-            msg_type = 'ai'
-        else:
-            continue
-        messages_data.append({
-            'type': msg_type,
-            'content': msg.content,
-            'timestamp': datetime.datetime.utcnow()
-        })
-    conversa = {
-        'user_id': user_id,
-        'messages': messages_data,
-        'last_updated': datetime.datetime.utcnow()
-    }
-    collection_historico.update_one(
-        {'user_id': user_id},
-        {'$set': conversa},
-        upsert=True
+    # Documents written before the version field existed count as version 0
+    return Conversa(user_id, _mensagens_do_documento(documento), (documento or {}).get('versao', 0))
+
+def salvar_memoria(conversa):
+    """
+    Appends the messages added since the conversation was read, as long as
+    nobody else wrote in between (compare-and-set on `versao`). On a conflict
+    the stored messages are reloaded, ours go after them and the write is
+    retried, so concurrent turns of the same user are never overwritten.
+    """
+    with conversa.lock:
+        return _salvar_memoria(conversa)
+
+def _salvar_memoria(conversa):
+    novas = conversa.messages[conversa.persistidas:]
+    if not novas:
+        return True
+    logging.info(f"Salvando memória da conversa no MongoDB para o usuário {conversa.user_id}...")
+    from pymongo.errors import DuplicateKeyError
+
+    _garantir_indice_historico()
+    colecao = obter_colecao('HistoricoConversa')
+    for tentativa in range(HISTORICO_TENTATIVAS):
+        agora = datetime.datetime.utcnow()
+        messages_data = [msg.documento() for msg in novas]
+        filtro = {'user_id': conversa.user_id}
+        # {'versao': None} also matches documents without the field
+        filtro['versao'] = conversa.versao if conversa.versao else {'$in': [0, None]}
+        try:
+            resultado = colecao.update_one(
+                filtro,
+                {'$push': {'messages': {'$each': messages_data}},
+                 '$inc': {'versao': 1},
+                 '$set': {'last_updated': agora}},
+                # Only a conversation read as empty may create the document; a racing
+                # insert of the same user_id is rejected by the unique index
+                upsert=conversa.persistidas == 0,
+            )
+            gravado = resultado.matched_count == 1 or resultado.upserted_id is not None
+        except DuplicateKeyError:
+            gravado = False
+        if gravado:
+            conversa.versao += 1
+            conversa.persistidas = len(conversa.messages)
+            logging.info("Memória da conversa salva no MongoDB.")
+            return True
+
+        logging.info(f"Conversa de {conversa.user_id} alterada por outra requisição "
+                     f"(tentativa {tentativa + 1}); recarregando.")
+        documento = colecao.find_one({'user_id': conversa.user_id})
+        conversa.mesclar(_mensagens_do_documento(documento), (documento or {}).get('versao', 0))
+        novas = conversa.messages[conversa.persistidas:]
+        time.sleep(random.uniform(0, 0.02 * 2 ** tentativa))
+    logging.error(f"Memória de {conversa.user_id} não salva: conflitos em {HISTORICO_TENTATIVAS} tentativas.")
+    return False
+
+# Live conversations stay in memory between turns (see cache_conversas.py);
+# CACHE_CONVERSAS=0 reads and writes on every turn. Each change is written to
+# MongoDB before the response returns, and with CACHE_CONVERSAS_VALIDAR=1 a
+# cache hit reads the stored version (one field) and reloads the conversation
+# another worker wrote, so a user's turns served by different workers see each other.
+# Writing behind (up to CACHE_CONVERSAS_IDADE_SUJA_S later) is only safe when
+# all turns of a user reach the same worker and never overlap across workers:
+# it needs sticky sessions at the load balancer (CACHE_CONVERSAS_ROTEAMENTO_FIXO=1)
+# and the cross-worker lock (TRAVA_USUARIO=mongo)
+CACHE_CONVERSAS = int(os.getenv('CACHE_CONVERSAS', 1000))
+CACHE_CONVERSAS_OCIOSO_S = float(os.getenv('CACHE_CONVERSAS_OCIOSO_S', 900))
+CACHE_CONVERSAS_IDADE_SUJA_S = float(os.getenv('CACHE_CONVERSAS_IDADE_SUJA_S', 5))
+CACHE_CONVERSAS_VALIDAR = os.getenv('CACHE_CONVERSAS_VALIDAR', '1') == '1'
+CACHE_CONVERSAS_ROTEAMENTO_FIXO = os.getenv('CACHE_CONVERSAS_ROTEAMENTO_FIXO', '0') == '1'
+CACHE_CONVERSAS_ADIAR = CACHE_CONVERSAS_ROTEAMENTO_FIXO and TRAVA_USUARIO == 'mongo'
+if CACHE_CONVERSAS_ROTEAMENTO_FIXO and not CACHE_CONVERSAS_ADIAR:
+    logging.warning("CACHE_CONVERSAS_ROTEAMENTO_FIXO=1 sem TRAVA_USUARIO=mongo: "
+                    "as conversas continuam gravadas antes de cada resposta.")
+
+def _versao_gravada(user_id):
+    documento = obter_colecao('HistoricoConversa').find_one({'user_id': user_id}, {'_id': 0, 'versao': 1})
+    return (documento or {}).get('versao', 0)
+
+def _criar_cache_conversas():
+    return cache_conversas.CacheConversas(
+        carregar_memoria, salvar_memoria,
+        versao_atual=_versao_gravada if CACHE_CONVERSAS_VALIDAR else None,
+        maximo=CACHE_CONVERSAS,
+        ocioso_s=CACHE_CONVERSAS_OCIOSO_S,
+        idade_max_suja_s=CACHE_CONVERSAS_IDADE_SUJA_S,
     )
-    logging.info("Memória da conversa salva no MongoDB.")
 
-def gerar_resposta_groq(messages):
+def obter_cache_conversas():
+    if CACHE_CONVERSAS <= 0:
+        return None
+    return _obter_cliente('cache_conversas', _criar_cache_conversas)
+
+def obter_conversa(user_id):
+    cache = obter_cache_conversas()
+    return cache.obter(user_id) if cache is not None else carregar_memoria(user_id)
+
+def registrar_alteracao(conversa):
+    cache = obter_cache_conversas()
+    if cache is None:
+        salvar_memoria(conversa)
+        return
+    cache.marcar_suja(conversa)
+    if not CACHE_CONVERSAS_ADIAR:
+        # Written now, so a turn served next by another worker finds it stored
+        cache.descarregar(conversa.user_id)
+
+def descarregar_conversas(user_id=None):
+    """
+    Writes pending conversation changes now: before another process reads
+    the conversation and when the worker exits.
+    """
+    cache = _clientes.get('cache_conversas')
+    return cache.descarregar(user_id) if cache is not None else 0
+
+def _busca_vetorial(configuracao, colecao, user_id, vetor_consulta, limite):
+    """
+    Uses $vectorSearch on Atlas when the embeddings are stored as floats and
+    falls back to scoring the user's documents locally otherwise.
+    """
+    global _vector_search_atlas_disponivel
+    if configuracao['formato'] == 'float' and _vector_search_atlas_disponivel:
+        try:
+            return [
+                ({'_id': doc['_id'], 'content': doc['content']}, doc['score'])
+                for doc in colecao.aggregate([
+                    {'$vectorSearch': {
+                        'index': configuracao['indice'],
+                        'path': 'embedding',
+                        'queryVector': [float(v) for v in vetor_consulta],
+                        'numCandidates': limite * 10,
+                        'limit': limite,
+                        'filter': {'user_id': {'$eq': user_id}},
+                    }},
+                    {'$project': {'content': 1, 'score': {'$meta': 'vectorSearchScore'}}},
+                ])
+            ]
+        except Exception as e:
+            logging.warning(f"$vectorSearch indisponível, usando busca local no Contexto: {e}")
+            _vector_search_atlas_disponivel = False
+    embedding_model = None
+    if EMBEDDINGS_RERANQUEAR and configuracao['formato'] != 'float':
+        embedding_model = obter_embedding_model(configuracao['modelo'])
+    return embeddings_compactos.buscar(colecao, vetor_consulta, user_id, k=limite, embedding_model=embedding_model)
+
+def _indice_palavras(configuracao, colecao):
+    indice = busca_hibrida.IndiceMongo(
+        colecao, lambda user_id, vetor, limite: _busca_vetorial(configuracao, colecao, user_id, vetor, limite)
+    )
+    if configuracao['colecao'] not in _indices_palavras:
+        try:
+            indice.garantir_indice()
+        except Exception as e:
+            logging.warning(f"Não foi possível criar o índice de palavras em {configuracao['colecao']}: {e}")
+        _indices_palavras.add(configuracao['colecao'])
+    return indice
+
+def recuperar_memoria_relevante(user_id, vetor_consulta, ignorar=(), texto_consulta=None):
+    """
+    Past user statements most relevant to the current message, filtered by user_id.
+
+    With MEMORIA_BUSCA=hibrida the vector ranking is fused with a BM25 keyword
+    ranking (busca_hibrida), so exact terms such as course names, cities and
+    certifications are found even when their embeddings are not the closest.
+    Models that embed queries differently get the text re-embedded as a query.
+    """
+    configuracao = obter_configuracao_embeddings()
+    colecao = obter_colecao(configuracao['colecao'])
+    if texto_consulta and embeddings_compactos.exige_input_type(configuracao['modelo']):
+        vetor_consulta = obter_embedding_model(configuracao['modelo']).embed_query(texto_consulta)
+    ignorar = set(ignorar)
+    limite = MEMORIA_TOP_K + len(ignorar)
+    if MEMORIA_BUSCA == 'hibrida' and texto_consulta:
+        # Both rankings get extra candidates: fusion promotes documents found by both
+        resultados = _indice_palavras(configuracao, colecao).buscar(
+            user_id, texto_consulta, vetor_consulta, k=limite, candidatos=limite * 4
+        )
+    else:
+        resultados = _busca_vetorial(configuracao, colecao, user_id, vetor_consulta, limite)
+
+    trechos, total = [], 0
+    for documento, _ in resultados:
+        content = documento['content']
+        if content in ignorar or content in trechos:
+            continue
+        if total + len(content) > MEMORIA_MAX_CARACTERES or len(trechos) >= MEMORIA_TOP_K:
+            break
+        trechos.append(content)
+        total += len(content)
+    return trechos
+
+def gerar_resposta_groq(conversa, user_id=None, vetor_consulta=None):
     logging.info("Gerando resposta do modelo Groq...")
     model_messages = [{"role": "system", "content": system_prompt}]
-    for msg in messages:
-        if isinstance(msg, HumanMessage):
-            model_messages.append({"role": "user", "content": msg.content})
-        elif isinstance(msg, AIMessage):
-            model_messages.append({"role": "assistant", "content": msg.content})
+    recentes = None
+    if user_id and vetor_consulta is not None and len(conversa.messages) > MEMORIA_MENSAGENS_RECENTES:
+        recentes = MEMORIA_MENSAGENS_RECENTES
+        try:
+            recentes_usuario = [m.conteudo for m in conversa.messages[-recentes:] if m.humana]
+            with etapa('memoria_longo_prazo'):
+                trechos = recuperar_memoria_relevante(
+                    user_id, vetor_consulta, ignorar=recentes_usuario,
+                    texto_consulta=recentes_usuario[-1] if recentes_usuario else None,
+                )
+        except Exception as e:
+            logging.error(f"Erro ao recuperar a memória de longo prazo: {e}")
+            trechos = []
+        if trechos:
+            model_messages.append({
+                "role": "system",
+                "content": "Informações que o usuário já compartilhou anteriormente nesta conversa:\n"
+                           + "\n".join(f"- {t}" for t in trechos),
+            })
+    # Role dicts are built once per message and reused across turns
+    with etapa('montar_mensagens'):
+        model_messages.extend(conversa.papeis(recentes))
     try:
-        response = client.chat.completions.create(
-            model="llama-3.2-90b-text-preview",
-            messages=model_messages,
-            temperature=0.7,
-            max_tokens=820,
-            top_p=1,
-            stream=False,
-            stop=None,
-        )
+        with etapa('llm'):
+            response = obter_cliente_completions().completar(
+                model_messages,
+                operacao='resposta',
+                temperature=0.7,
+                max_tokens=820,
+                top_p=1,
+                stream=False,
+                stop=None,
+            )
         resposta = response.choices[0].message.content.strip()
         logging.info("Resposta gerada com sucesso.")
         return resposta
@@ -196,14 +536,28 @@ def gerar_resposta_groq(messages):
         return "Houve um erro ao processar sua solicitação."
 
 def armazenar_mensagem_no_vectorstore(role, content, user_id):
+    """
+    Embeds and stores a user message in Contexto, returning its embedding
+    (reused as the query vector for the long-term memory search).
+    """
     if role == 'user':
-        metadata = {"role": role, "user_id": user_id}
-        vectorstore.add_texts([content], metadatas=[metadata])
+        configuracao = obter_configuracao_embeddings()
+        metadata = {"role": role, "user_id": user_id, "criado_em": datetime.datetime.utcnow(),
+                    "modelo_embedding": configuracao['modelo']}
+        # Same document layout MongoDBAtlasVectorSearch.add_texts writes in the float format
+        vetor = obter_embedding_model(configuracao['modelo']).embed_documents([content])[0]
+        documento = {'content': content, **metadata}
+        documento.update(embeddings_compactos.compactar(vetor, configuracao['formato']))
+        # Words for the keyword half of the hybrid memory search (busca_hibrida)
+        documento.update(busca_hibrida.campos_lexicos(content))
+        obter_colecao(configuracao['colecao']).insert_one(documento)
         logging.info("Mensagem do usuário armazenada no vectorstore.")
+        return vetor
     else:
         logging.info("Mensagem do assistente não armazenada no vectorstore.")
+        return None
 
-def validar_contexto_suficiente(messages):
+def validar_contexto_suficiente(conversa):
     logging.info("Validando se o contexto é suficiente para gerar recomendações.")
     validation_prompt = (
         "Dada a seguinte conversa entre o assistente e o usuário:\n"
@@ -217,15 +571,11 @@ def validar_contexto_suficiente(messages):
         "6. Limitações de tempo ou recursos que possam afetar o aproveitamento das oportunidades.\n"
         "Se todas essas informações foram coletadas, responda 'Sim'. Caso contrário, responda 'Não'."
     )
-    conversation_text = ""
-    for msg in messages:
-        role = "Assistente" if isinstance(msg, AIMessage) else "Usuário"
-        conversation_text += f"{role}: {msg.content}\n"
-    formatted_prompt = validation_prompt.format(conversation=conversation_text)
+    formatted_prompt = validation_prompt.format(conversation=conversa.transcricao())
     try:
-        response = client.chat.completions.create(
-            model="llama-3.2-90b-text-preview",
-            messages=[{"role": "system", "content": formatted_prompt}],
+        response = obter_cliente_completions().completar(
+            [{"role": "system", "content": formatted_prompt}],
+            operacao='validacao',
             temperature=0.0,
             max_tokens=10,
             top_p=1,
@@ -239,31 +589,42 @@ def validar_contexto_suficiente(messages):
         logging.error(f"Erro ao validar contexto com o Groq: {e}")
         return False
 
+# Crew runs: attempts per trigger, and the pause before each retry (doubled every time)
+CREW_TENTATIVAS = int(os.getenv('CREW_TENTATIVAS', 3))
+CREW_PAUSA_S = float(os.getenv('CREW_PAUSA_S', 5))
+
 def acionar_agentes(user_id):
     logging.info("Iniciando o processo dos agentes do Crew AI.")
-    try:
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        src_dir = os.path.join(current_dir, 'src')
-        main_py_path = os.path.join(src_dir, 'crew', 'main.py')
-        if not os.path.isfile(main_py_path):
-            logging.error(f"main.py não encontrado no caminho: {main_py_path}")
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    src_dir = os.path.join(current_dir, 'src')
+    main_py_path = os.path.join(src_dir, 'crew', 'main.py')
+    if not os.path.isfile(main_py_path):
+        logging.error(f"main.py não encontrado no caminho: {main_py_path}")
+        return
+    # main.py resumes the user's unfinished run with the same context, so a retry
+    # only executes the tasks the failed attempt did not complete (CrewCheckpoints)
+    for tentativa in range(1, CREW_TENTATIVAS + 1):
+        try:
+            logging.debug(f"Executando o arquivo: {main_py_path} com user_id: {user_id}")
+            subprocess.run(
+                [sys.executable, main_py_path, user_id],
+                check=True,
+                cwd=src_dir
+            )
+            logging.info("Processo dos agentes concluído com sucesso.")
             return
-        logging.debug(f"Executando o arquivo: {main_py_path} com user_id: {user_id}")
-        subprocess.run(
-            [sys.executable, main_py_path, user_id],
-            check=True,
-            cwd=src_dir
-        )
-        logging.info("Processo dos agentes concluído com sucesso.")
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Erro ao executar os agentes do Crew AI: {e}")
-    except Exception as e:
-        logging.error(f"Erro inesperado: {e}")
-    logging.info("Chain of agent execution:")
+        except subprocess.CalledProcessError as e:
+            logging.error(f"Erro ao executar os agentes do Crew AI (tentativa {tentativa} de {CREW_TENTATIVAS}): {e}")
+        except Exception as e:
+            logging.error(f"Erro inesperado: {e}")
+            return
+        if tentativa < CREW_TENTATIVAS:
+            time.sleep(CREW_PAUSA_S * 2 ** (tentativa - 1))
+    logging.error(f"Crew AI falhou após {CREW_TENTATIVAS} tentativas; a próxima execução retoma do último checkpoint.")
 
-def adicionar_mensagem_ia(message, user_id, memory):
-    memory.chat_memory.add_ai_message(message)
-    salvar_memoria(user_id, memory.chat_memory.messages)
+def adicionar_mensagem_ia(message, conversa):
+    conversa.adicionar(Mensagem(IA, message))
+    registrar_alteracao(conversa)
     logging.info(f"Mensagem da IA adicionada ao histórico: {message}")
 
 def detectar_intencao_ai(usuario_resposta, contexto):
@@ -275,9 +636,9 @@ def detectar_intencao_ai(usuario_resposta, contexto):
         f"Responda apenas com 'sim' se a intenção do usuário for receber recomendações. Caso contrário, responda 'não'."
     )
     try:
-        response = client.chat.completions.create(
-            model="llama-3.2-90b-text-preview",
-            messages=[{"role": "system", "content": prompt}],
+        response = obter_cliente_completions().completar(
+            [{"role": "system", "content": prompt}],
+            operacao='intencao',
             temperature=0.0,
             max_tokens=10,
             top_p=1,
@@ -291,6 +652,168 @@ def detectar_intencao_ai(usuario_resposta, contexto):
         logging.error(f"Erro ao detectar intenção com o Groq: {e}")
         return False
 
+# On-demand profiling (perfilador.py): a request is profiled when it carries
+# X-Perfil: 1 with the admin token, comes from a user in PERFIL_USUARIOS, or
+# falls in the PERFIL_AMOSTRAGEM fraction. Profiles are read back from /perfis.
+PERFIL_TOKEN = os.getenv('PERFIL_TOKEN')
+PERFIL_AMOSTRAGEM = float(os.getenv('PERFIL_AMOSTRAGEM', 0))
+PERFIL_USUARIOS = frozenset(u for u in os.getenv('PERFIL_USUARIOS', '').split(',') if u)
+PERFIL_INTERVALO_MS = float(os.getenv('PERFIL_INTERVALO_MS', 5))
+PERFIL_DIRETORIO = os.getenv('PERFIL_DIRETORIO', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perfis'))
+PERFIL_MAX = int(os.getenv('PERFIL_MAX', 200))
+armazem_perfis = perfilador.ArmazemPerfis(PERFIL_DIRETORIO, PERFIL_MAX)
+
+def _admin_autorizado():
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(PERFIL_TOKEN) and hmac.compare_digest(token.encode('utf-8'), PERFIL_TOKEN.encode('utf-8'))
+
+@app.before_request
+def _iniciar_perfil():
+    if request.endpoint in ('listar_perfis', 'obter_perfil', 'metricas_admissao', 'saude'):
+        return
+    user_id = None
+    if PERFIL_USUARIOS and request.is_json:
+        user_id = (request.get_json(silent=True) or {}).get('user_id')
+    if not ((request.headers.get('X-Perfil') == '1' and _admin_autorizado())
+            or user_id in PERFIL_USUARIOS
+            or (PERFIL_AMOSTRAGEM > 0 and random.random() < PERFIL_AMOSTRAGEM)):
+        return
+    # The id is always generated here (a client-chosen one could overwrite
+    # another profile); the client reads it from X-Perfil-Id
+    id_requisicao = uuid.uuid4().hex
+    if user_id is None and request.is_json:
+        user_id = (request.get_json(silent=True) or {}).get('user_id')
+    perfilador.iniciar(id_requisicao, request.path, request.method, PERFIL_INTERVALO_MS / 1000, user_id)
+
+def _salvar_perfil(documento):
+    try:
+        armazem_perfis.salvar(documento)
+        logging.info(f"Perfil {documento['id']} salvo: {request.path} em {documento['duracao_ms']:.0f}ms.")
+    except Exception as e:
+        logging.error(f"Erro ao salvar o perfil {documento['id']}: {e}")
+
+@app.after_request
+def _encerrar_perfil(response):
+    documento = perfilador.encerrar(response.status_code)
+    if documento is not None:
+        _salvar_perfil(documento)
+        response.headers['X-Perfil-Id'] = documento['id']
+    return response
+
+@app.teardown_request
+def _descartar_perfil(erro=None):
+    # A request that raised skips after_request: its profile is saved here
+    documento = perfilador.encerrar(500, erro)
+    if documento is not None:
+        _salvar_perfil(documento)
+
+@app.route('/perfis', methods=['GET'])
+def listar_perfis():
+    if not _admin_autorizado():
+        return jsonify({'erro': 'Não autorizado.'}), 403
+    try:
+        limite = int(request.args.get('limite', 50))
+    except ValueError:
+        limite = 0
+    if limite < 1:
+        return jsonify({'erro': 'limite deve ser um inteiro positivo.'}), 400
+    return jsonify({'perfis': armazem_perfis.listar(limite)})
+
+@app.route('/perfis/<id_requisicao>', methods=['GET'])
+def obter_perfil(id_requisicao):
+    if not _admin_autorizado():
+        return jsonify({'erro': 'Não autorizado.'}), 403
+    documento = armazem_perfis.carregar(id_requisicao)
+    if documento is None:
+        return jsonify({'erro': 'Perfil não encontrado.'}), 404
+    # folded: input of flamegraph.pl and speedscope
+    if request.args.get('formato') == 'folded':
+        return Response(perfilador.folded(documento), mimetype='text/plain')
+    return jsonify(documento)
+
+# Admission control (admissao.py): /mensagem, which waits on the LLM, may use
+# at most limit + queue of the worker's threads; the cheap routes have their
+# own lane, so a slow upstream only queues (and then sheds) chat turns.
+# /conversa moves to the chat lane when it has to generate the opening message.
+# Routes not listed (/saude, /perfis, /metricas) are never queued.
+ADMISSAO = os.getenv('ADMISSAO', '1') == '1'
+_threads_worker = int(os.getenv('GUNICORN_THREADS', 8))
+ADMISSAO_MENSAGEM_LIMITE = int(os.getenv('ADMISSAO_MENSAGEM_LIMITE', max(1, _threads_worker // 2)))
+ADMISSAO_MENSAGEM_FILA = int(os.getenv('ADMISSAO_MENSAGEM_FILA', max(1, _threads_worker // 4)))
+ADMISSAO_MENSAGEM_ESPERA_S = float(os.getenv('ADMISSAO_MENSAGEM_ESPERA_S', 2))
+ADMISSAO_LEVE_LIMITE = int(os.getenv('ADMISSAO_LEVE_LIMITE', _threads_worker))
+ADMISSAO_LEVE_FILA = int(os.getenv('ADMISSAO_LEVE_FILA', _threads_worker))
+ADMISSAO_LEVE_ESPERA_S = float(os.getenv('ADMISSAO_LEVE_ESPERA_S', 1))
+controle_admissao = admissao.ControleAdmissao(
+    {
+        'mensagem': admissao.Faixa('mensagem', ADMISSAO_MENSAGEM_LIMITE, ADMISSAO_MENSAGEM_FILA,
+                                   ADMISSAO_MENSAGEM_ESPERA_S),
+        'leve': admissao.Faixa('leve', ADMISSAO_LEVE_LIMITE, ADMISSAO_LEVE_FILA, ADMISSAO_LEVE_ESPERA_S),
+    },
+    {'mensagem': 'mensagem', 'login': 'leve', 'conversa': 'leve', 'oportunidades': 'leve'},
+)
+
+def _entrar_na_faixa(faixa):
+    """
+    Admits the request in `faixa`, or returns the 429 response when the lane refuses it.
+    """
+    try:
+        with etapa('fila_admissao'):
+            g.admissao = (faixa, faixa.entrar())
+    except admissao.Recusada as e:
+        logging.warning(f"{request.path} recusada: {e} Tentar de novo em {e.tentar_em_s}s.")
+        resposta = jsonify({
+            'erro': 'Servidor ocupado.',
+            'resposta': "Estou recebendo muitas mensagens agora. Tente de novo em alguns segundos.",
+        })
+        resposta.status_code = 429
+        resposta.headers['Retry-After'] = str(e.tentar_em_s)
+        return resposta
+
+@app.before_request
+def _admitir():
+    faixa = controle_admissao.faixa(request.endpoint) if ADMISSAO else None
+    if faixa is None:
+        return
+    return _entrar_na_faixa(faixa)
+
+def _liberar_admissao():
+    admitida = g.pop('admissao', None)
+    if admitida is not None:
+        faixa, admitida_em = admitida
+        faixa.sair(admitida_em)
+
+def _trocar_faixa(nome):
+    """
+    Moves a request admitted in a cheap lane to the `nome` lane before it
+    waits on the LLM. Returns the 429 response if that lane refuses it.
+    """
+    if not ADMISSAO or 'admissao' not in g:
+        return None
+    _liberar_admissao()
+    return _entrar_na_faixa(controle_admissao.faixas[nome])
+
+@app.teardown_request
+def _encerrar_admissao(erro=None):
+    _liberar_admissao()
+
+@app.route('/metricas/admissao', methods=['GET'])
+def metricas_admissao():
+    if not _admin_autorizado():
+        return jsonify({'erro': 'Não autorizado.'}), 403
+    cliente_completions = _clientes.get('completions')
+    return jsonify({
+        'pid': os.getpid(),
+        'ativo': ADMISSAO,
+        'faixas': controle_admissao.metricas(),
+        'llm': dict(cliente_completions.estatisticas) if cliente_completions is not None else None,
+    })
+
+# Liveness/readiness check for load balancers (no external calls)
+@app.route('/saude', methods=['GET'])
+def saude():
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
 # Route for login
 @app.route('/login', methods=['POST'])
 def login():
@@ -311,18 +834,22 @@ def conversa():
     user_id = data.get('user_id')
     if not user_id:
         return jsonify({'messages': []})
-    messages = carregar_memoria(user_id)
-    if not messages:
-        logging.info("Nenhuma mensagem encontrada. Gerando mensagem inicial.")
-        memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-        resposta_inicial = gerar_resposta_groq(memory.chat_memory.messages)
-        memory.chat_memory.add_ai_message(resposta_inicial)
-        salvar_memoria(user_id, memory.chat_memory.messages)
-        messages = memory.chat_memory.messages
-    messages_to_return = []
-    for msg in messages:
-        role = 'user' if isinstance(msg, HumanMessage) else 'bot'
-        messages_to_return.append({'role': role, 'content': msg.content})
+    conversa = obter_conversa(user_id)
+    if not conversa.messages:
+        # The opening message is an LLM call: it waits in the chat lane, not the cheap one
+        recusada = _trocar_faixa('mensagem')
+        if recusada is not None:
+            return recusada
+        with trava_usuario(user_id):
+            # Another request may have created the conversation while we waited
+            conversa = obter_conversa(user_id)
+            if not conversa.messages:
+                logging.info("Nenhuma mensagem encontrada. Gerando mensagem inicial.")
+                resposta_inicial = gerar_resposta_groq(conversa)
+                adicionar_mensagem_ia(resposta_inicial, conversa)
+    messages_to_return = [
+        {'role': 'user' if msg.humana else 'bot', 'content': msg.conteudo} for msg in conversa.messages
+    ]
     return jsonify({'messages': messages_to_return})
 
 # Route to send message to chatbot
@@ -333,49 +860,61 @@ def mensagem():
     user_id = data.get('user_id')
     if not user_id or not mensagem_usuario:
         return jsonify({'resposta': 'Dados inválidos.'})
-    messages = carregar_memoria(user_id)
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-    memory.chat_memory.messages = messages
-    memory.chat_memory.add_user_message(mensagem_usuario)
-    armazenar_mensagem_no_vectorstore('user', mensagem_usuario, user_id)
-    salvar_memoria(user_id, memory.chat_memory.messages)
-    resposta_chatbot = gerar_resposta_groq(memory.chat_memory.messages)
-    memory.chat_memory.add_ai_message(resposta_chatbot)
-    salvar_memoria(user_id, memory.chat_memory.messages)
-    contexto = "\n".join(
-        f"{'Usuário' if isinstance(msg, HumanMessage) else 'Assistente'}: {msg.content}"
-        for msg in memory.chat_memory.messages
-    )
-    if detectar_intencao_ai(mensagem_usuario, contexto):
-        logging.info("Intenção de receber recomendações detectada pela IA.")
-        if validar_contexto_suficiente(memory.chat_memory.messages):
-            mensagem_ia = "Certo, processando suas recomendações."
-            memory.chat_memory.add_ai_message(mensagem_ia)
-            salvar_memoria(user_id, memory.chat_memory.messages)
+    # Turns of the same user run one at a time; the crew runs after the lock is released
+    # Stages are timed when the request is profiled (perfilador.etapa)
+    executar_agentes = False
+    with ExitStack() as travado:
+        with etapa('trava_usuario'):
+            travado.enter_context(trava_usuario(user_id))
+        with etapa('carregar_conversa'):
+            conversa = obter_conversa(user_id)
+            conversa.adicionar(Mensagem(HUMANA, mensagem_usuario))
+        with etapa('armazenar_mensagem'):
+            vetor_mensagem = armazenar_mensagem_no_vectorstore('user', mensagem_usuario, user_id)
+            registrar_alteracao(conversa)
+        with etapa('gerar_resposta'):
+            resposta_chatbot = gerar_resposta_groq(conversa, user_id, vetor_mensagem)
+            adicionar_mensagem_ia(resposta_chatbot, conversa)
+        mensagem_ia = None
+        with etapa('detectar_intencao'):
+            quer_recomendacoes = detectar_intencao_ai(mensagem_usuario, conversa.transcricao())
+        if quer_recomendacoes:
+            logging.info("Intenção de receber recomendações detectada pela IA.")
+            with etapa('validar_contexto'):
+                contexto_suficiente = validar_contexto_suficiente(conversa)
+            if contexto_suficiente:
+                mensagem_ia = "Certo, processando suas recomendações."
+                executar_agentes = True
+            else:
+                mensagem_ia = "Ainda preciso de mais algumas informações antes de enviar as recomendações. Vamos continuar nossa conversa."
+            adicionar_mensagem_ia(mensagem_ia, conversa)
+    if mensagem_ia is None:
+        return jsonify({'resposta': resposta_chatbot, 'mostrar_oportunidades': False})
+    if executar_agentes:
+        # The crew run takes minutes: it must not hold a chat slot nor count
+        # in the lane's average duration
+        _liberar_admissao()
+        # The crew reads the conversation from MongoDB
+        with etapa('acionar_agentes'):
+            descarregar_conversas(user_id)
             acionar_agentes(user_id)
-            mostrar_oportunidades = True
-        else:
-            mensagem_ia = "Ainda preciso de mais algumas informações antes de enviar as recomendações. Vamos continuar nossa conversa."
-            memory.chat_memory.add_ai_message(mensagem_ia)
-            salvar_memoria(user_id, memory.chat_memory.messages)
-            mostrar_oportunidades = False
-        return jsonify({'resposta': resposta_chatbot + "\n" + mensagem_ia, 'mostrar_oportunidades': mostrar_oportunidades})
-    else:
-        mostrar_oportunidades = False
-        return jsonify({'resposta': resposta_chatbot, 'mostrar_oportunidades': mostrar_oportunidades})
+    return jsonify({'resposta': resposta_chatbot + "\n" + mensagem_ia, 'mostrar_oportunidades': executar_agentes})
 
 # Route to fetch opportunities
 @app.route('/oportunidades', methods=['POST'])
 def oportunidades():
     data = request.get_json()
     user_id = data.get('user_id')
-    oportunidades = collection_oportunidades.find({'user_id': user_id})
+    # Most relevant first (relevancia is set by the crew's reranking stage)
+    oportunidades = obter_colecao('Oportunidades').find({'user_id': user_id}).sort('relevancia', -1)
     oportunidades_list = []
     for oportunidade in oportunidades:
         oportunidades_list.append({
             'titulo': oportunidade.get('titulo'),
             'descricao': oportunidade.get('descricao'),
-            'link': oportunidade.get('link')
+            'link': oportunidade.get('link'),
+            'tipo': oportunidade.get('tipo'),
+            'relevancia': oportunidade.get('relevancia'),
         })
     return jsonify({'oportunidades': oportunidades_list})
 
@@ -7,8 +7,8 @@ from langchain.prompts import PromptTemplate
 from langchain.memory import ConversationBufferMemory
 from langchain.schema import AIMessage, HumanMessage
 from groq import Groq
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
+import threading
+from memoria_arquivo import ArmazemSessoes
 
 app = Flask(__name__)
 CORS(app)  # Ativa o CORS para permitir requisições do frontend
@@ -28,9 +28,38 @@ VECTORSTORE_DIR = 'vectorstore_data'
 os.makedirs(MEMORY_DIR, exist_ok=True)
 os.makedirs(VECTORSTORE_DIR, exist_ok=True)
 
-# Inicializa o modelo de embeddings e o banco vetorial com persistência
-embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-vectorstore = Chroma(embedding_function=embedding_model, persist_directory=VECTORSTORE_DIR)
+# Memória das conversas: snapshot + log só de acréscimo por sessão (ver memoria_arquivo.py)
+armazem_memoria = ArmazemSessoes(
+    MEMORY_DIR,
+    limite_compactacao=int(os.getenv('MEMORIA_LIMITE_COMPACTACAO', 256 * 1024)),
+    sessoes_em_memoria=int(os.getenv('MEMORIA_SESSOES_EM_MEMORIA', 256)),
+)
+
+# O modelo de embeddings roda num serviço compartilhado entre os workers
+# (servico_embeddings.py), e o banco vetorial só é aberto no primeiro uso
+_vectorstore = None
+_vectorstore_lock = threading.Lock()
+
+def obter_vectorstore():
+    global _vectorstore
+    if _vectorstore is None:
+        with _vectorstore_lock:
+            if _vectorstore is None:
+                from langchain_chroma import Chroma
+                from servico_embeddings import EmbeddingsServico
+
+                _vectorstore = Chroma(embedding_function=EmbeddingsServico(), persist_directory=VECTORSTORE_DIR)
+    return _vectorstore
+
+# Função para armazenar a mensagem do usuário no banco vetorial
+def armazenar_mensagem_no_vectorstore(mensagem_usuario, session_id):
+    try:
+        obter_vectorstore().add_texts([mensagem_usuario], metadatas=[{'role': 'user', 'session_id': session_id}])
+        logging.info("Mensagem do usuário armazenada no vectorstore.")
+    except Exception as e:
+        # O vectorstore não participa da resposta: um serviço de embeddings
+        # ocupado ou fora do ar não deve derrubar a conversa
+        logging.error(f"Erro ao armazenar a mensagem no vectorstore: {e}")
 
 # Prompt do sistema para guiar a conversa
 system_prompt = (
@@ -49,26 +78,22 @@ system_prompt = (
 
 # Função para carregar a memória da conversa
 def carregar_memoria(session_id):
-    memory_file = os.path.join(MEMORY_DIR, f'memoria_{session_id}.json')
     logging.info(f"Carregando memória da conversa para a sessão {session_id}...")
-    if os.path.exists(memory_file):
-        with open(memory_file, 'r', encoding='utf-8') as f:
-            messages_data = json.load(f)
-            messages = []
-            for msg in messages_data:
-                if msg['type'] == 'human':
-                    messages.append(HumanMessage(content=msg['content']))
-                elif msg['type'] == 'ai':
-                    messages.append(AIMessage(content=msg['content']))
-            logging.info("Memória carregada com sucesso.")
-            return messages
-    else:
+    messages_data = armazem_memoria.carregar(session_id)
+    if not messages_data:
         logging.info("Nenhuma memória anterior encontrada. Iniciando nova conversa.")
         return []
-
-# Função para salvar a memória da conversa
+    messages = []
+    for msg in messages_data:
+        if msg['type'] == 'human':
+            messages.append(HumanMessage(content=msg['content']))
+        elif msg['type'] == 'ai':
+            messages.append(AIMessage(content=msg['content']))
+    logging.info("Memória carregada com sucesso.")
+    return messages
+
+# Função para salvar a memória da conversa (só as mensagens novas são gravadas)
 def salvar_memoria(messages, session_id):
-    memory_file = os.path.join(MEMORY_DIR, f'memoria_{session_id}.json')
     logging.info(f"Salvando memória da conversa para a sessão {session_id}...")
     messages_data = []
     for msg in messages:
@@ -79,8 +104,7 @@ def salvar_memoria(messages, session_id):
         else:
             continue
         messages_data.append({'type': msg_type, 'content': msg.content})
-    with open(memory_file, 'w', encoding='utf-8') as f:
-        json.dump(messages_data, f, ensure_ascii=False, indent=2)
+    armazem_memoria.salvar(session_id, messages_data)
     logging.info("Memória salva com sucesso.")
 
 # Função para gerar respostas com o modelo Groq
@@ -136,6 +160,7 @@ def mensagem():
 
     # Adiciona a mensagem do usuário na memória
     memory.chat_memory.add_user_message(mensagem_usuario)
+    armazenar_mensagem_no_vectorstore(mensagem_usuario, session_id)
 
     # Gera a resposta do chatbot
     resposta_chatbot = gerar_resposta_groq(memory.chat_memory.messages)
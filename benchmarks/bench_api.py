@@ -0,0 +1,270 @@
+"""
+Benchmark offline das rotas /mensagem, /conversa e /oportunidades.
+
+Sobe servidores falsos da Groq e da Cohere com latência configurável, inicia
+aplicativo.py num subprocesso com MongoDB em memória e mede vazão e
+percentis de latência para cada combinação de rota, comprimento da conversa
+e concorrência. Respostas 429 (carga descartada pelo controle de admissão,
+desligado por padrão em servidor_app.py) são contadas como recusadas, à
+parte dos erros, e ficam fora dos percentis e da vazão. Os resultados vão
+para um JSON comparável entre commits (veja benchmarks/comparar.py).
+
+    python -m benchmarks.bench_api --comprimentos 0,10,50 --concorrencias 1,8
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+
+from benchmarks.falsos import Latencia, ServidorFalso
+from benchmarks.estatisticas import resumo_latencias, situacao_resposta, metadados, commit_atual
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROTAS = ('mensagem', 'conversa', 'oportunidades')
+# Conversas já existentes são só lidas por /conversa; um grupo pequeno basta
+USUARIOS_LEITURA = 32
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def usuarios_necessarios(rota, comprimento, total_requisicoes):
+    """
+    /mensagem altera a conversa e /conversa cria a mensagem inicial quando o
+    histórico está vazio; nesses casos cada requisição usa um usuário novo
+    para que o comprimento medido seja exatamente o configurado.
+    """
+    if rota == 'mensagem' or (rota == 'conversa' and comprimento == 0):
+        return total_requisicoes
+    return min(USUARIOS_LEITURA, total_requisicoes)
+
+
+def montar_cenarios(args):
+    cenarios = []
+    total = args.requisicoes + args.aquecimento
+    for rota in args.rotas:
+        comprimentos = [None] if rota == 'oportunidades' else args.comprimentos
+        for comprimento in comprimentos:
+            for concorrencia in args.concorrencias:
+                prefixo = f"bench-{rota}-{comprimento}-{concorrencia}"
+                cenarios.append({
+                    'rota': rota,
+                    'comprimento': comprimento,
+                    'concorrencia': concorrencia,
+                    'prefixo': prefixo,
+                    'usuarios': usuarios_necessarios(rota, comprimento or 0, total),
+                })
+    return cenarios
+
+
+def montar_semente(cenarios, args):
+    grupos = []
+    for c in cenarios:
+        grupos.append({
+            'prefixo': c['prefixo'],
+            'usuarios': c['usuarios'],
+            'comprimento': c['comprimento'] or 0,
+        })
+    return {
+        'semente': args.semente,
+        'grupos': grupos,
+        'oportunidades_por_usuario': args.oportunidades,
+    }
+
+
+class ServidorApp:
+    """
+    Processo de benchmarks/servidor_app.py.
+    """
+
+    def __init__(self, porta, url_llm, url_embed, arquivo_semente):
+        self.porta = porta
+        self.log = tempfile.NamedTemporaryFile(prefix='bench-app-', suffix='.log', delete=False)
+        env = dict(os.environ)
+        env.update({
+            'GROQ_API_KEY': 'bench',
+            'GROQ_BASE_URL': url_llm,
+            'COHERE_API_KEY': 'bench',
+            'CO_API_URL': url_embed,
+            'MONGODB_URI': 'mongodb://localhost',
+        })
+        self.processo = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.servidor_app', '--porta', str(porta), '--semente', arquivo_semente],
+            cwd=RAIZ, env=env, stdout=subprocess.PIPE, stderr=self.log, text=True,
+        )
+
+    def aguardar(self, timeout=120):
+        inicio = time.monotonic()
+        linha = self.processo.stdout.readline()
+        if 'PRONTO' not in linha:
+            self.parar()
+            with open(self.log.name, 'r', encoding='utf-8', errors='replace') as f:
+                cauda = f.read()[-4000:]
+            raise RuntimeError(f"O servidor do app não iniciou:\n{cauda}")
+        logging.info(f"App pronto em {time.monotonic() - inicio:.1f}s (log: {self.log.name}).")
+
+    def parar(self):
+        if self.processo.poll() is None:
+            self.processo.terminate()
+            try:
+                self.processo.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.processo.kill()
+
+
+def corpo_requisicao(rota, user_id, indice):
+    if rota == 'mensagem':
+        return {'user_id': user_id, 'mensagem': f"Quero aprender análise de dados ({indice})."}
+    return {'user_id': user_id}
+
+
+def executar_requisicao(conexao, rota, corpo):
+    """
+    Envia um POST e devolve (latência em segundos, situação da resposta, conexão).
+    """
+    dados = json.dumps(corpo)
+    inicio = time.perf_counter()
+    try:
+        conexao.request('POST', f'/{rota}', body=dados, headers={'Content-Type': 'application/json'})
+        resposta = conexao.getresponse()
+        resposta.read()
+        situacao = situacao_resposta(resposta.status)
+    except (OSError, http.client.HTTPException):
+        conexao.close()
+        conexao = http.client.HTTPConnection(conexao.host, conexao.port, timeout=conexao.timeout)
+        situacao = 'erro'
+    return time.perf_counter() - inicio, situacao, conexao
+
+
+def rodar_cenario(cenario, porta, args):
+    rota, prefixo, usuarios = cenario['rota'], cenario['prefixo'], cenario['usuarios']
+
+    # Aquecimento sequencial, fora da medição
+    conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=args.timeout)
+    for i in range(args.aquecimento):
+        _, _, conexao = executar_requisicao(conexao, rota, corpo_requisicao(rota, f"{prefixo}-{i % usuarios}", i))
+    conexao.close()
+
+    proximo = [args.aquecimento]
+    lock = threading.Lock()
+    latencias, contagem = [], {'erro': 0, 'recusada': 0}
+    limite = args.aquecimento + args.requisicoes
+
+    def trabalhador():
+        conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=args.timeout)
+        while True:
+            with lock:
+                indice = proximo[0]
+                if indice >= limite:
+                    break
+                proximo[0] += 1
+            corpo = corpo_requisicao(rota, f"{prefixo}-{indice % usuarios}", indice)
+            latencia, situacao, conexao = executar_requisicao(conexao, rota, corpo)
+            with lock:
+                # Uma recusa volta em microssegundos e puxaria os percentis para baixo
+                if situacao == 'recusada':
+                    contagem['recusada'] += 1
+                    continue
+                latencias.append(latencia)
+                if situacao == 'erro':
+                    contagem['erro'] += 1
+        conexao.close()
+
+    threads = [threading.Thread(target=trabalhador) for _ in range(cenario['concorrencia'])]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+
+    return {
+        'rota': f"/{rota}",
+        'comprimento_conversa': cenario['comprimento'],
+        'concorrencia': cenario['concorrencia'],
+        'requisicoes': len(latencias) + contagem['recusada'],
+        'erros': contagem['erro'],
+        'recusadas': contagem['recusada'],
+        'duracao_s': round(duracao, 3),
+        'throughput_rps': round(len(latencias) / duracao, 3) if duracao > 0 else None,
+        'latencia_ms': resumo_latencias(latencias),
+    }
+
+
+def lista_inteiros(texto):
+    return [int(v) for v in texto.split(',') if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline da API de chat.")
+    parser.add_argument('--rotas', type=lambda t: [r for r in t.split(',') if r], default=list(ROTAS))
+    parser.add_argument('--comprimentos', type=lista_inteiros, default=[0, 10, 50, 200],
+                        help="Número de mensagens já existentes na conversa.")
+    parser.add_argument('--concorrencias', type=lista_inteiros, default=[1, 4, 16])
+    parser.add_argument('--requisicoes', type=int, default=100, help="Requisições medidas por cenário.")
+    parser.add_argument('--aquecimento', type=int, default=5)
+    parser.add_argument('--oportunidades', type=int, default=20, help="Oportunidades salvas por usuário.")
+    parser.add_argument('--latencia-llm', default='lognormal:300:0.5')
+    parser.add_argument('--latencia-embed', default='lognormal:60:0.3')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--saida', help="Arquivo JSON de saída (padrão: benchmarks/resultados/api-<commit>.json).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for rota in args.rotas:
+        if rota not in ROTAS:
+            parser.error(f"Rota desconhecida: {rota}")
+
+    llm = ServidorFalso(Latencia(args.latencia_llm, args.semente)).iniciar()
+    embed = ServidorFalso(Latencia(args.latencia_embed, args.semente + 1)).iniciar()
+
+    cenarios = montar_cenarios(args)
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8') as f:
+        json.dump(montar_semente(cenarios, args), f)
+        arquivo_semente = f.name
+
+    porta = porta_livre()
+    servidor = ServidorApp(porta, llm.url, embed.url, arquivo_semente)
+    resultados = []
+    try:
+        servidor.aguardar()
+        for cenario in cenarios:
+            chamadas_llm = sum(llm.chamadas.values())
+            chamadas_embed = sum(embed.chamadas.values())
+            resultado = rodar_cenario(cenario, porta, args)
+            resultado['chamadas_llm'] = sum(llm.chamadas.values()) - chamadas_llm
+            resultado['chamadas_embed'] = sum(embed.chamadas.values()) - chamadas_embed
+            resultados.append(resultado)
+            lat = resultado['latencia_ms']
+            logging.info(
+                f"{resultado['rota']} comprimento={cenario['comprimento']} concorrencia={cenario['concorrencia']}: "
+                f"{resultado['throughput_rps']} req/s, p50={lat['p50']}ms p99={lat['p99']}ms, erros={resultado['erros']}, "
+                f"recusadas={resultado['recusadas']}"
+            )
+    finally:
+        servidor.parar()
+        llm.parar()
+        embed.parar()
+        os.unlink(arquivo_semente)
+
+    config = {k: v for k, v in vars(args).items() if k != 'saida'}
+    saida = args.saida or os.path.join(RAIZ, 'benchmarks', 'resultados', f"api-{commit_atual() or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump({'meta': metadados(config), 'cenarios': resultados}, f, ensure_ascii=False, indent=2)
+    logging.info(f"Resultados salvos em {saida}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Busca vetorial x lexical x híbrida (busca_hibrida) na memória dos usuários.
+
+Gera mensagens sintéticas de --usuarios usuários sobre poucos temas, cada uma
+citando um termo exato (curso, cidade ou certificação). O embedding de uma
+mensagem é dominado pelo tema e só levemente afetado pelo termo, como
+acontece com "AWS Solutions Architect" e "Azure Administrator". Cada consulta
+pede por um termo que o usuário citou e mede:
+
+- recall@k das mensagens do usuário com o termo, para cada busca;
+- latência por consulta no IndiceLocal (partição do usuário) e numa busca
+  vetorial sobre os vetores de todos os usuários filtrada depois, como faria
+  um índice sem user_id, com quantos resultados de outros usuários ela
+  precisou descartar.
+
+    python -m benchmarks.bench_busca --usuarios 500 --mensagens 200 --consultas 500
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+
+from benchmarks.estatisticas import metadados, commit_atual
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+import busca_hibrida  # noqa: E402
+
+TEMAS = {
+    'cursos': ("Quero fazer um curso de {}", ['Python', 'Excel', 'Power BI', 'Figma', 'Kotlin', 'React', 'SQL',
+                                              'Tableau', 'Rust', 'Scrum', 'Photoshop', 'Libras']),
+    'cidades': ("Moro em {} e procuro vagas perto", ['Campinas', 'Recife', 'Curitiba', 'Manaus', 'Goiânia',
+                                                     'Belém', 'Natal', 'Joinville', 'Londrina', 'Sorocaba']),
+    'certificacoes': ("Estou estudando para a certificação {}", ['PMP', 'CCNA', 'AWS Solutions Architect',
+                                                                 'Azure Administrator', 'ITIL', 'CPA-20',
+                                                                 'TOEFL', 'CKA', 'Terraform Associate']),
+    'rotina': ("Tenho pouco tempo livre por causa de {}", ['trabalho', 'filhos', 'faculdade', 'estágio']),
+}
+
+
+def gerar(usuarios, mensagens, dimensao, peso_termo, semente):
+    rng = np.random.default_rng(semente)
+    centros = {tema: rng.normal(size=dimensao) for tema in TEMAS}
+    termos = {termo: rng.normal(size=dimensao) for _, lista in TEMAS.values() for termo in lista}
+    temas = list(TEMAS)
+    corpus = []
+    for u in range(usuarios):
+        for m in range(mensagens):
+            tema = temas[rng.integers(len(temas))]
+            modelo, lista = TEMAS[tema]
+            termo = lista[rng.integers(len(lista))]
+            vetor = centros[tema] + peso_termo * termos[termo] + rng.normal(scale=0.5, size=dimensao)
+            corpus.append((f"u{u}", f"u{u}-{m}", modelo.format(termo), tema, termo, vetor.astype(np.float32)))
+    return corpus, centros, termos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall e latência da busca híbrida na memória dos usuários.")
+    parser.add_argument('--usuarios', type=int, default=200)
+    parser.add_argument('--mensagens', type=int, default=100, help="Mensagens por usuário.")
+    parser.add_argument('--dimensao', type=int, default=256)
+    parser.add_argument('--peso-termo', type=float, default=0.2, help="Peso do termo exato no embedding.")
+    parser.add_argument('--consultas', type=int, default=300)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', help="Arquivo JSON de saída (padrão: benchmarks/resultados/busca-<commit>.json).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    corpus, centros, termos = gerar(args.usuarios, args.mensagens, args.dimensao, args.peso_termo, args.semente)
+    indice = busca_hibrida.IndiceLocal()
+    inicio = time.perf_counter()
+    for user_id, doc_id, texto, _, _, vetor in corpus:
+        indice.adicionar(user_id, doc_id, texto, vetor)
+    logging.info(f"{len(corpus)} mensagens indexadas em {time.perf_counter() - inicio:.2f}s.")
+
+    # Busca sem partição: todos os vetores, filtrando o usuário depois
+    global_ids = np.array([c[0] for c in corpus])
+    global_matriz = np.vstack([c[5] / np.linalg.norm(c[5]) for c in corpus])
+
+    rng = np.random.default_rng(args.semente + 1)
+    buscas = ('vetorial', 'lexical', 'hibrida')
+    recall = {b: [] for b in buscas}
+    tempos = {b: [] for b in buscas + ('vetorial_global',)}
+    descartados = []
+    for _ in range(args.consultas):
+        user_id, _, _, tema, termo, _ = corpus[rng.integers(len(corpus))]
+        relevantes = {c[1] for c in corpus if c[0] == user_id and c[4] == termo}
+        texto = f"o que eu disse sobre {termo}?"
+        vetor = centros[tema] + args.peso_termo * termos[termo] + rng.normal(scale=0.5, size=args.dimensao)
+        chamadas = {
+            'vetorial': lambda: indice.buscar_vetorial(user_id, vetor, args.k),
+            'lexical': lambda: indice.buscar_lexical(user_id, texto, args.k),
+            'hibrida': lambda: indice.buscar(user_id, texto, vetor, k=args.k, candidatos=args.k * 4),
+        }
+        for nome, chamada in chamadas.items():
+            t = time.perf_counter()
+            resultado = chamada()
+            tempos[nome].append(time.perf_counter() - t)
+            encontrados = {d['_id'] for d, _ in resultado}
+            recall[nome].append(len(encontrados & relevantes) / min(len(relevantes), args.k))
+
+        t = time.perf_counter()
+        scores = global_matriz @ (vetor / np.linalg.norm(vetor))
+        ordem = np.argsort(-scores)
+        posicoes = np.flatnonzero(global_ids[ordem] == user_id)[:args.k]
+        tempos['vetorial_global'].append(time.perf_counter() - t)
+        # Resultados de outros usuários à frente do k-ésimo resultado do usuário
+        descartados.append(int(posicoes[-1]) + 1 - len(posicoes))
+
+    resultados = {}
+    for nome in tempos:
+        resultados[nome] = {'p50_ms': round(float(np.percentile(tempos[nome], 50)) * 1000, 3),
+                            'p95_ms': round(float(np.percentile(tempos[nome], 95)) * 1000, 3)}
+        if nome in recall:
+            resultados[nome][f'recall@{args.k}'] = round(float(np.mean(recall[nome])), 4)
+        logging.info(f"{nome:<16} {resultados[nome]}")
+    resultados['vetorial_global']['outros_usuarios_descartados'] = round(float(np.mean(descartados)), 1)
+    logging.info(f"Busca global: em média {resultados['vetorial_global']['outros_usuarios_descartados']} "
+                 f"resultados de outros usuários antes dos {args.k} do usuário.")
+
+    config = {k: v for k, v in vars(args).items() if k != 'saida'}
+    saida = args.saida or os.path.join(RAIZ, 'benchmarks', 'resultados', f"busca-{commit_atual() or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump({'meta': metadados(config), 'buscas': resultados}, f, ensure_ascii=False, indent=2)
+    logging.info(f"Resultados salvos em {saida}")
+
+
+if __name__ == '__main__':
+    main()
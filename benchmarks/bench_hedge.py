@@ -0,0 +1,123 @@
+"""
+Latência de cauda das chat completions com e sem hedge (cliente_llm.py).
+
+Sobe dois servidores falsos de LLM (falsos.ServidorFalso) com a mesma
+distribuição de latência, de cauda longa, e faz --chamadas completions com
+--concorrencia threads em cada cenário:
+
+- sem_hedge: só o primário, sem cópias (como uma chamada simples com prazo);
+- hedge_mesmo: cópia ao próprio primário depois do p95 recente;
+- hedge_secundario: cópia ao secundário depois do p95 recente;
+- primario_fora: o primário responde 503 a tudo; mede o failover e quantas
+  requisições ainda chegam a ele depois que o disjuntor abre.
+
+O relatório tem p50/p95/p99 e máximo de cada cenário, cópias enviadas e
+vencidas e requisições por servidor, e é gravado em
+benchmarks/resultados/hedge-<commit>.json.
+
+    python -m benchmarks.bench_hedge --chamadas 400 --latencia lognormal:300:0.8
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.falsos import Latencia, ServidorFalso
+from benchmarks.estatisticas import metadados, commit_atual
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+import cliente_llm  # noqa: E402
+
+MENSAGENS = [{'role': 'system', 'content': "Você é um assistente de carreira."},
+             {'role': 'user', 'content': "Quero mudar para a área de dados."}]
+
+
+def cliente_groq(url):
+    from groq import Groq
+
+    return Groq(api_key='falso', base_url=url, max_retries=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de hedge e failover das chat completions.")
+    parser.add_argument('--chamadas', type=int, default=300)
+    parser.add_argument('--concorrencia', type=int, default=8)
+    parser.add_argument('--latencia', default='lognormal:200:0.8', help="Latência dos servidores (ver falsos.Latencia).")
+    parser.add_argument('--prazo', type=float, default=10.0, help="Prazo de cada chamada, em segundos.")
+    parser.add_argument('--percentil', type=float, default=95, help="Percentil das latências usado como atraso da cópia.")
+    parser.add_argument('--atraso-inicial', type=float, default=1.0, help="Atraso da cópia antes de haver amostras.")
+    parser.add_argument('--max-fracao', type=float, default=0.1, help="Fração máxima de chamadas com cópia.")
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', help="Arquivo JSON de saída (padrão: benchmarks/resultados/hedge-<commit>.json).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    resultados = {}
+
+    def medir(nome, secundario=True, fracao=args.max_fracao, erros_primario=0.0, mesmo=False):
+        primario_srv = ServidorFalso(Latencia(args.latencia, args.semente), erros=erros_primario).iniciar()
+        secundario_srv = ServidorFalso(Latencia(args.latencia, args.semente + 1)).iniciar()
+        try:
+            primario = cliente_groq(primario_srv.url)
+            provedores = [cliente_llm.Provedor('primario', lambda: primario, 'llama-falso')]
+            if secundario and not mesmo:
+                reserva = cliente_groq(secundario_srv.url)
+                provedores.append(cliente_llm.Provedor('secundario', lambda: reserva, 'llama-falso'))
+            cliente = cliente_llm.ClienteCompletions(
+                provedores, prazo_s=args.prazo, percentil_hedge=args.percentil,
+                atraso_inicial_s=args.atraso_inicial, fracao_max_hedges=fracao,
+            )
+
+            def chamar(_):
+                inicio = time.perf_counter()
+                try:
+                    cliente.completar(MENSAGENS, operacao='resposta', max_tokens=200)
+                    return time.perf_counter() - inicio, True
+                except Exception:
+                    return time.perf_counter() - inicio, False
+
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(args.concorrencia) as executor:
+                medidas = list(executor.map(chamar, range(args.chamadas)))
+            duracao = time.perf_counter() - inicio
+        finally:
+            primario_srv.parar()
+            secundario_srv.parar()
+        latencias = np.array([d for d, ok in medidas if ok]) * 1000
+        resultados[nome] = {
+            'duracao_s': round(duracao, 2),
+            'erros': sum(1 for _, ok in medidas if not ok),
+            **{f'p{p}_ms': round(float(np.percentile(latencias, p)), 1) for p in (50, 95, 99)},
+            'max_ms': round(float(latencias.max()), 1),
+            'requisicoes_primario': sum(primario_srv.chamadas.values()),
+            'requisicoes_secundario': sum(secundario_srv.chamadas.values()),
+            'estatisticas': dict(cliente.estatisticas),
+        }
+        r = resultados[nome]
+        logging.info(f"{nome:<17} p50 {r['p50_ms']:7.1f}ms  p95 {r['p95_ms']:7.1f}ms  p99 {r['p99_ms']:7.1f}ms  "
+                     f"máx {r['max_ms']:7.1f}ms  erros {r['erros']}  cópias {r['estatisticas']['hedges']} "
+                     f"(vencidas {r['estatisticas']['vitorias_hedge']})  "
+                     f"requisições {r['requisicoes_primario']}/{r['requisicoes_secundario']}")
+
+    medir('sem_hedge', secundario=False, fracao=0)
+    medir('hedge_mesmo', mesmo=True)
+    medir('hedge_secundario')
+    medir('primario_fora', erros_primario=1.0)
+
+    config = {k: v for k, v in vars(args).items() if k != 'saida'}
+    saida = args.saida or os.path.join(RAIZ, 'benchmarks', 'resultados', f"hedge-{commit_atual() or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump({'meta': metadados(config), 'cenarios': resultados}, f, ensure_ascii=False, indent=2)
+    logging.info(f"Resultados salvos em {saida}")
+
+
+if __name__ == '__main__':
+    main()
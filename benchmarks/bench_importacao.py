@@ -0,0 +1,154 @@
+"""
+Tempo de importação dos pontos de entrada, medido com python -X importtime.
+
+Cada módulo é importado num processo novo (--repeticoes vezes, vale a
+mediana). O resultado traz o tempo acumulado do módulo, o tempo total do
+processo e as importações diretas mais caras. Se algum módulo passar do
+orçamento, o script termina com código 1, para ser usado na CI.
+
+    python -m benchmarks.bench_importacao
+    python -m benchmarks.bench_importacao --modulos aplicativo --orcamento aplicativo=600
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+import subprocess
+
+from benchmarks.estatisticas import metadados, commit_atual
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# módulo -> (diretório de trabalho, entradas extras do sys.path). crew.py é
+# importado de src/crew, como em main.py, e não como o pacote src/crew
+MODULOS = {
+    'aplicativo': (RAIZ, []),
+    'chatbot': (RAIZ, []),
+    'crew': (os.path.join(RAIZ, 'src', 'crew'), []),
+}
+
+# Orçamento em milissegundos do tempo acumulado de importação de cada módulo
+ORCAMENTOS_MS = {
+    'aplicativo': 800,
+    'chatbot': 600,
+    'crew': 4000,
+}
+
+
+def analisar_importtime(saida_erro):
+    """
+    Lista de (profundidade, nome, próprio_us, acumulado_us) das linhas do -X importtime.
+    """
+    registros = []
+    for linha in saida_erro.splitlines():
+        if not linha.startswith('import time:'):
+            continue
+        partes = linha[len('import time:'):].split('|')
+        if len(partes) != 3 or not partes[0].strip().isdigit():
+            continue  # cabeçalho
+        nome = partes[2].rstrip()
+        # Um espaço de indentação no nível superior, mais dois por nível de aninhamento
+        profundidade = (len(nome) - len(nome.lstrip()) - 1) // 2
+        registros.append((profundidade, nome.strip(), int(partes[0]), int(partes[1])))
+    return registros
+
+
+def medir(modulo, diretorio, caminhos):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(caminhos + [RAIZ, env.get('PYTHONPATH', '')]).rstrip(os.pathsep)
+    inicio = time.perf_counter()
+    processo = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+        cwd=diretorio, env=env, capture_output=True, text=True,
+    )
+    total = time.perf_counter() - inicio
+    registros = analisar_importtime(processo.stderr)
+    if processo.returncode != 0:
+        erro = processo.stderr.strip().splitlines()[-1] if processo.stderr.strip() else 'erro desconhecido'
+        return {'erro': erro}
+
+    # O registro do módulo vem depois dos seus filhos, no nível superior
+    indice = next(i for i in range(len(registros) - 1, -1, -1)
+                  if registros[i][0] == 0 and registros[i][1] == modulo)
+    diretos = []
+    for profundidade, nome, _, acumulado in reversed(registros[:indice]):
+        if profundidade == 0:
+            break  # importações anteriores ao módulo (site, encodings)
+        if profundidade == 1:
+            diretos.append((nome, acumulado))
+    return {
+        'importacao_ms': registros[indice][3] / 1000.0,
+        'processo_ms': total * 1000.0,
+        'diretos': diretos,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de importação dos pontos de entrada.")
+    parser.add_argument('--modulos', nargs='+', choices=sorted(MODULOS), default=sorted(MODULOS))
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--orcamento', action='append', default=[], metavar='MODULO=MS',
+                        help="Sobrescreve o orçamento de um módulo.")
+    parser.add_argument('--top', type=int, default=8, help="Importações diretas mais caras a mostrar.")
+    parser.add_argument('--saida', help="Arquivo JSON de saída (padrão: benchmarks/resultados/importacao-<commit>.json).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    orcamentos = dict(ORCAMENTOS_MS)
+    for item in args.orcamento:
+        modulo, _, valor = item.partition('=')
+        orcamentos[modulo] = float(valor)
+
+    resultados = {}
+    estourou = False
+    for modulo in args.modulos:
+        diretorio, caminhos = MODULOS[modulo]
+        medicoes = [medir(modulo, diretorio, caminhos) for _ in range(args.repeticoes)]
+        erros = [m['erro'] for m in medicoes if 'erro' in m]
+        if erros:
+            logging.error(f"{modulo}: falha ao importar: {erros[0]}")
+            resultados[modulo] = {'erro': erros[0]}
+            estourou = True
+            continue
+
+        importacao = statistics.median(m['importacao_ms'] for m in medicoes)
+        processo = statistics.median(m['processo_ms'] for m in medicoes)
+        diretos = {}
+        for m in medicoes:
+            for nome, acumulado in m['diretos']:
+                diretos.setdefault(nome, []).append(acumulado / 1000.0)
+        mais_caros = sorted(((nome, statistics.median(v)) for nome, v in diretos.items()),
+                            key=lambda par: par[1], reverse=True)[:args.top]
+        orcamento = orcamentos.get(modulo)
+        dentro = orcamento is None or importacao <= orcamento
+        estourou = estourou or not dentro
+        resultados[modulo] = {
+            'importacao_ms': round(importacao, 1),
+            'processo_ms': round(processo, 1),
+            'orcamento_ms': orcamento,
+            'dentro_do_orcamento': dentro,
+            'importacoes_diretas_ms': {nome: round(ms, 1) for nome, ms in mais_caros},
+        }
+        nivel = logging.INFO if dentro else logging.ERROR
+        logging.log(nivel, f"{modulo}: {importacao:.0f} ms de importação ({processo:.0f} ms de processo), "
+                           f"orçamento {orcamento} ms")
+        for nome, ms in mais_caros:
+            logging.info(f"    {nome:<30} {ms:8.1f} ms")
+
+    config = {k: v for k, v in vars(args).items() if k != 'saida'}
+    saida = args.saida or os.path.join(RAIZ, 'benchmarks', 'resultados', f"importacao-{commit_atual() or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump({'meta': metadados(config), 'modulos': resultados}, f, ensure_ascii=False, indent=2)
+    logging.info(f"Resultados salvos em {saida}")
+
+    if estourou:
+        logging.error("Tempo de importação acima do orçamento.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Recall versus tamanho dos formatos compactos de embedding (embeddings_compactos).
+
+Usa os embeddings em float já gravados no Contexto (--mongo), um arquivo JSONL
+com um campo "embedding" por linha (--arquivo) ou dados sintéticos
+(--sintetico N:D). Para cada formato mede bytes por vetor em BSON e o recall@k
+em relação à busca exata em float32, com e sem reordenação em precisão total
+dos melhores candidatos.
+
+    python -m benchmarks.bench_quantizacao --mongo --limite 20000 --k 5 --candidatos 20
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+import bson
+import numpy as np
+
+from benchmarks.estatisticas import metadados, commit_atual
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+import embeddings_compactos  # noqa: E402
+
+
+def carregar_do_mongo(limite):
+    import conexao_mongo
+    from pymongo import ReadPreference
+
+    client_mongo = conexao_mongo.conectar()
+    colecao = client_mongo[conexao_mongo.NOME_BANCO].get_collection(
+        'Contexto', read_preference=ReadPreference.SECONDARY_PREFERRED
+    )
+    # Só documentos em float servem de referência para o recall
+    cursor = colecao.find({'embedding': {'$type': 'array'}}, {'_id': 0, 'embedding': 1}).limit(limite)
+    return [d['embedding'] for d in cursor]
+
+
+def carregar_de_arquivo(caminho, limite):
+    vetores = []
+    with open(caminho, 'r', encoding='utf-8') as f:
+        for linha in f:
+            if linha.strip():
+                vetores.append(json.loads(linha)['embedding'])
+                if len(vetores) >= limite:
+                    break
+    return vetores
+
+
+def gerar_sintetico(especificacao, semente):
+    """
+    Vetores agrupados em torno de alguns centros, como mensagens de poucos temas.
+    """
+    n, d = (int(v) for v in especificacao.split(':'))
+    rng = np.random.default_rng(semente)
+    centros = rng.normal(size=(max(n // 50, 1), d))
+    rotulos = rng.integers(0, len(centros), size=n)
+    return (centros[rotulos] + rng.normal(scale=0.6, size=(n, d))).astype(np.float32)
+
+
+def normalizar(matriz):
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+
+def top_k(scores, k, excluir):
+    scores = scores.copy()
+    scores[excluir] = -np.inf
+    return np.argpartition(-scores, k)[:k]
+
+
+def avaliar(matriz, formato, consultas, k, candidatos):
+    documentos = [embeddings_compactos.compactar(v, formato) for v in matriz]
+    bytes_por_vetor = float(np.mean([len(bson.encode(d)) for d in documentos]))
+    reconstruida = normalizar(np.vstack([embeddings_compactos.descompactar(d) for d in documentos]))
+    exata = normalizar(matriz)
+
+    recall, recall_reescorado, tempo = [], [], 0.0
+    for i in consultas:
+        consulta = exata[i]
+        verdade = set(top_k(exata @ consulta, k, i).tolist())
+
+        inicio = time.perf_counter()
+        scores = reconstruida @ consulta
+        tempo += time.perf_counter() - inicio
+
+        recall.append(len(verdade & set(top_k(scores, k, i).tolist())) / k)
+        # Reordena os melhores candidatos compactos com os vetores em float
+        pool = top_k(scores, min(candidatos, len(matriz) - 1), i)
+        reordenados = pool[np.argsort(-(exata[pool] @ consulta))[:k]]
+        recall_reescorado.append(len(verdade & set(reordenados.tolist())) / k)
+
+    return {
+        'formato': formato,
+        'bytes_por_vetor': round(bytes_por_vetor, 1),
+        f'recall@{k}': round(float(np.mean(recall)), 4),
+        f'recall@{k}_reescorado_top{candidatos}': round(float(np.mean(recall_reescorado)), 4),
+        'pontuacao_ms_por_consulta': round(tempo / len(consultas) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall x tamanho dos formatos compactos de embedding.")
+    fonte = parser.add_mutually_exclusive_group(required=True)
+    fonte.add_argument('--mongo', action='store_true', help="Lê os embeddings em float do Contexto.")
+    fonte.add_argument('--arquivo', help="JSONL com um campo 'embedding' por linha.")
+    fonte.add_argument('--sintetico', help="N:D vetores sintéticos, ex.: 5000:768.")
+    parser.add_argument('--limite', type=int, default=20000)
+    parser.add_argument('--consultas', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--candidatos', type=int, default=20)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', help="Arquivo JSON de saída (padrão: benchmarks/resultados/quantizacao-<commit>.json).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.mongo:
+        vetores = carregar_do_mongo(args.limite)
+    elif args.arquivo:
+        vetores = carregar_de_arquivo(args.arquivo, args.limite)
+    else:
+        vetores = gerar_sintetico(args.sintetico, args.semente)
+    matriz = np.asarray(vetores, dtype=np.float32)
+    if len(matriz) <= args.k + 1:
+        parser.error("Poucos vetores para avaliar o recall.")
+    logging.info(f"{len(matriz)} vetores de dimensão {matriz.shape[1]}.")
+
+    rng = np.random.default_rng(args.semente)
+    consultas = rng.choice(len(matriz), size=min(args.consultas, len(matriz)), replace=False)
+
+    resultados = [avaliar(matriz, formato, consultas, args.k, args.candidatos) for formato in embeddings_compactos.FORMATOS]
+    base = resultados[0]['bytes_por_vetor']
+    for r in resultados:
+        r['reducao'] = round(base / r['bytes_por_vetor'], 2)
+        logging.info(f"{r}")
+
+    config = {k: v for k, v in vars(args).items() if k != 'saida'}
+    config.update({'vetores': len(matriz), 'dimensao': int(matriz.shape[1])})
+    saida = args.saida or os.path.join(RAIZ, 'benchmarks', 'resultados', f"quantizacao-{commit_atual() or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump({'meta': metadados(config), 'formatos': resultados}, f, ensure_ascii=False, indent=2)
+    logging.info(f"Resultados salvos em {saida}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Custo de ler as páginas das oportunidades encontradas pelo crew.
+
+Sobe --hosts servidores de páginas locais (falsos.ServidorPaginas) com a
+latência configurada e lê --links links espalhados entre eles:
+
+- serial: um requests.get por link, sem sessão nem cache (como o
+  ScrapeWebsiteTool usado antes pelos agentes);
+- frio: PageFetcher (src/crew/tools/paginas.py) com o cache vazio;
+- condicional: de novo, com o cache vencido (GETs condicionais, respostas 304);
+- fresco: de novo, dentro do prazo de frescor (sem requisições);
+- alterado: depois de as páginas mudarem (respostas 200 e texto novo).
+
+    python -m benchmarks.bench_raspagem --links 50 --latencia fixa:200
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+
+from benchmarks.falsos import Latencia, ServidorPaginas
+from benchmarks.estatisticas import metadados, commit_atual
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ, 'src', 'crew'))
+from tools.paginas import PageFetcher, TextExtractor  # noqa: E402
+
+
+def ler_serial(links):
+    import requests
+
+    paginas = []
+    for link in links:
+        resposta = requests.get(link, timeout=30)
+        extrator = TextExtractor()
+        extrator.feed(resposta.text)
+        paginas.append(extrator.text())
+    return paginas
+
+
+def contagens(servidores):
+    total = {}
+    for servidor in servidores:
+        for status, n in servidor.chamadas.items():
+            total[status] = total.get(status, 0) + n
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da leitura de páginas de oportunidades.")
+    parser.add_argument('--links', type=int, default=50)
+    parser.add_argument('--hosts', type=int, default=4, help="Servidores (hosts) entre os quais os links se dividem.")
+    parser.add_argument('--latencia', default='uniforme:100:300', help="Latência de cada página (ver falsos.Latencia).")
+    parser.add_argument('--tamanho', type=int, default=20000, help="Bytes de HTML por página.")
+    parser.add_argument('--por-host', type=int, default=4)
+    parser.add_argument('--paralelo', type=int, default=16)
+    parser.add_argument('--sem-serial', action='store_true', help="Pula o cenário serial (lento com latência alta).")
+    parser.add_argument('--saida', help="Arquivo JSON de saída (padrão: benchmarks/resultados/raspagem-<commit>.json).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    servidores = [ServidorPaginas(Latencia(args.latencia, semente=i), tamanho=args.tamanho).iniciar()
+                  for i in range(args.hosts)]
+    links = [f"{servidores[i % args.hosts].url}/pagina/{i}" for i in range(args.links)]
+    resultados = {}
+
+    def medir(nome, funcao):
+        antes = contagens(servidores)
+        for servidor in servidores:
+            servidor.maximo_simultaneas = 0
+        inicio = time.perf_counter()
+        paginas = funcao()
+        duracao = time.perf_counter() - inicio
+        depois = contagens(servidores)
+        resultados[nome] = {
+            'segundos': round(duracao, 3),
+            'respostas': {k: depois.get(k, 0) - antes.get(k, 0) for k in depois if depois.get(k, 0) != antes.get(k, 0)},
+            'maximo_simultaneas_por_host': max(s.maximo_simultaneas for s in servidores),
+            'erros': sum(1 for p in paginas if isinstance(p, dict) and 'erro' in p),
+        }
+        logging.info(f"{nome:<12} {duracao:7.2f}s  {resultados[nome]['respostas']}  "
+                     f"até {resultados[nome]['maximo_simultaneas_por_host']} simultâneas por host")
+
+    try:
+        if not args.sem_serial:
+            medir('serial', lambda: ler_serial(links))
+        with tempfile.TemporaryDirectory() as cache:
+            fetcher = PageFetcher(cache_dir=cache, per_host=args.por_host, workers=args.paralelo, fresh_for_s=0)
+            medir('frio', lambda: fetcher.fetch_many(links))
+            medir('condicional', lambda: fetcher.fetch_many(links))
+            fetcher.fresh_for_s = 3600
+            medir('fresco', lambda: fetcher.fetch_many(links))
+            for servidor in servidores:
+                servidor.versao += 1
+            fetcher.fresh_for_s = 0
+            medir('alterado', lambda: fetcher.fetch_many(links))
+            fetcher.close()
+    finally:
+        for servidor in servidores:
+            servidor.parar()
+
+    config = {k: v for k, v in vars(args).items() if k != 'saida'}
+    saida = args.saida or os.path.join(RAIZ, 'benchmarks', 'resultados', f"raspagem-{commit_atual() or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump({'meta': metadados(config), 'cenarios': resultados}, f, ensure_ascii=False, indent=2)
+    logging.info(f"Resultados salvos em {saida}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Compara dois arquivos de resultados de bench_api (por exemplo, de dois commits).
+
+    python -m benchmarks.comparar base.json novo.json --limite 10
+
+Sai com código 1 se algum cenário piorar mais que --limite por cento em p50,
+p99 ou vazão.
+"""
+import sys
+import json
+import argparse
+
+
+def chave(cenario):
+    return (cenario['rota'], cenario.get('comprimento_conversa'), cenario['concorrencia'])
+
+
+def variacao(antes, depois):
+    if antes in (None, 0) or depois is None:
+        return None
+    return (depois - antes) / antes * 100.0
+
+
+def formatar(valor):
+    return '-' if valor is None else f"{valor:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara resultados de benchmark entre commits.")
+    parser.add_argument('base')
+    parser.add_argument('novo')
+    parser.add_argument('--limite', type=float, default=None,
+                        help="Piora máxima tolerada em porcentagem.")
+    args = parser.parse_args()
+
+    with open(args.base, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.novo, 'r', encoding='utf-8') as f:
+        novo = json.load(f)
+
+    cenarios_base = {chave(c): c for c in base['cenarios']}
+    print(f"base: {base['meta'].get('commit')}  novo: {novo['meta'].get('commit')}")
+    print(f"{'rota':<16}{'compr.':>8}{'conc.':>7}{'p50':>10}{'p99':>10}{'req/s':>10}")
+
+    regressoes = []
+    for cenario in novo['cenarios']:
+        anterior = cenarios_base.get(chave(cenario))
+        if anterior is None:
+            continue
+        d_p50 = variacao(anterior['latencia_ms']['p50'], cenario['latencia_ms']['p50'])
+        d_p99 = variacao(anterior['latencia_ms']['p99'], cenario['latencia_ms']['p99'])
+        d_rps = variacao(anterior['throughput_rps'], cenario['throughput_rps'])
+        rota, comprimento, concorrencia = chave(cenario)
+        print(f"{rota:<16}{str(comprimento):>8}{concorrencia:>7}{formatar(d_p50):>10}{formatar(d_p99):>10}{formatar(d_rps):>10}")
+        if args.limite is not None:
+            piorou = [
+                d_p50 is not None and d_p50 > args.limite,
+                d_p99 is not None and d_p99 > args.limite,
+                d_rps is not None and -d_rps > args.limite,
+            ]
+            if any(piorou):
+                regressoes.append(chave(cenario))
+
+    if regressoes:
+        print(f"\n{len(regressoes)} cenário(s) pioraram mais de {args.limite}%:")
+        for r in regressoes:
+            print(f"  - {r}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import math
+import subprocess
+import platform
+import datetime
+import sys
+
+
+def percentil(valores_ordenados, p):
+    """
+    Percentil p (0-100) com interpolação linear sobre uma lista já ordenada.
+    """
+    if not valores_ordenados:
+        return None
+    if len(valores_ordenados) == 1:
+        return valores_ordenados[0]
+    posicao = (len(valores_ordenados) - 1) * p / 100.0
+    inferior = math.floor(posicao)
+    superior = math.ceil(posicao)
+    if inferior == superior:
+        return valores_ordenados[int(posicao)]
+    fracao = posicao - inferior
+    return valores_ordenados[inferior] * (1 - fracao) + valores_ordenados[superior] * fracao
+
+
+
+def situacao_resposta(status):
+    """
+    Classifica o status HTTP: 'ok' (200), 'recusada' (429, carga descartada
+    pelo controle de admissão) ou 'erro'.
+    """
+    if status == 200:
+        return 'ok'
+    return 'recusada' if status == 429 else 'erro'
+
+
+def resumo_latencias(latencias_s):
+    """
+    Resume uma lista de latências em segundos como milissegundos.
+    """
+    ordenadas = sorted(latencias_s)
+    if not ordenadas:
+        return {'p50': None, 'p90': None, 'p99': None, 'media': None, 'max': None}
+    return {
+        'p50': round(percentil(ordenadas, 50) * 1000, 3),
+        'p90': round(percentil(ordenadas, 90) * 1000, 3),
+        'p99': round(percentil(ordenadas, 99) * 1000, 3),
+        'media': round(sum(ordenadas) / len(ordenadas) * 1000, 3),
+        'max': round(ordenadas[-1] * 1000, 3),
+    }
+
+
+def commit_atual():
+    """
+    Hash do commit atual, ou None fora de um repositório git.
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def metadados(config):
+    """
+    Metadados gravados junto com os resultados para permitir comparar commits.
+    """
+    return {
+        'commit': commit_atual(),
+        'data': datetime.datetime.utcnow().isoformat() + 'Z',
+        'python': sys.version.split()[0],
+        'plataforma': platform.platform(),
+        'config': config,
+    }
@@ -0,0 +1,302 @@
+"""
+Servidores locais que imitam as APIs da Groq e da Cohere.
+
+As respostas são determinísticas (dependem apenas do conteúdo da requisição)
+e cada servidor aplica uma distribuição de latência configurável, para que os
+benchmarks meçam o custo do nosso código sem depender da rede nem de cotas.
+"""
+import json
+import math
+import time
+import random
+import hashlib
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Dimensão dos embeddings de cada modelo usado pelo projeto
+DIMENSOES_EMBEDDING = {
+    'embed-multilingual-v2.0': 768,
+    'embed-english-light-v3.0': 384,
+    'embed-multilingual-light-v3.0': 384,
+    'embed-multilingual-v3.0': 1024,
+    'embed-english-v3.0': 1024,
+}
+DIMENSAO_PADRAO = 1024
+
+
+class Latencia:
+    """
+    Distribuição de latência em milissegundos descrita por uma string:
+
+    - ``zero``
+    - ``fixa:50``
+    - ``uniforme:20:80``
+    - ``normal:media:desvio``
+    - ``lognormal:mediana:sigma``
+    - ``exponencial:media``
+    """
+
+    def __init__(self, especificacao='zero', semente=0):
+        self.especificacao = especificacao
+        partes = especificacao.split(':')
+        self.tipo = partes[0]
+        self.parametros = [float(p) for p in partes[1:]]
+        esperados = {'zero': 0, 'fixa': 1, 'uniforme': 2, 'normal': 2, 'lognormal': 2, 'exponencial': 1}
+        if self.tipo not in esperados:
+            raise ValueError(f"Distribuição de latência desconhecida: {self.tipo}")
+        if len(self.parametros) != esperados[self.tipo]:
+            raise ValueError(f"Parâmetros inválidos para '{especificacao}'.")
+        self._rng = random.Random(semente)
+        self._lock = threading.Lock()
+
+    def amostrar(self):
+        """
+        Sorteia uma latência em segundos.
+        """
+        with self._lock:
+            if self.tipo == 'zero':
+                ms = 0.0
+            elif self.tipo == 'fixa':
+                ms = self.parametros[0]
+            elif self.tipo == 'uniforme':
+                ms = self._rng.uniform(*self.parametros)
+            elif self.tipo == 'normal':
+                ms = self._rng.gauss(*self.parametros)
+            elif self.tipo == 'lognormal':
+                mediana, sigma = self.parametros
+                ms = self._rng.lognormvariate(math.log(mediana), sigma)
+            else:
+                ms = self._rng.expovariate(1.0 / self.parametros[0])
+        return max(ms, 0.0) / 1000.0
+
+    def __repr__(self):
+        return f"Latencia({self.especificacao!r})"
+
+
+def embedding_deterministico(texto, dimensao):
+    """
+    Vetor unitário pseudoaleatório derivado do hash do texto.
+    """
+    semente = int.from_bytes(hashlib.sha256(texto.encode('utf-8')).digest()[:8], 'big')
+    rng = random.Random(semente)
+    vetor = [rng.gauss(0.0, 1.0) for _ in range(dimensao)]
+    norma = math.sqrt(sum(v * v for v in vetor)) or 1.0
+    return [v / norma for v in vetor]
+
+
+def resposta_chat_deterministica(mensagens, max_tokens):
+    """
+    Conteúdo de resposta do chat que depende apenas das mensagens enviadas.
+
+    Prompts de classificação (max_tokens pequeno) recebem "não", para que o
+    fluxo de /mensagem nunca dispare os agentes durante um benchmark.
+    """
+    if max_tokens is not None and max_tokens <= 10:
+        return "não"
+    ultima = mensagens[-1]['content'] if mensagens else ''
+    digest = hashlib.sha256(ultima.encode('utf-8')).hexdigest()[:8]
+    return (
+        f"Entendi ({digest}). Obrigado por compartilhar. "
+        "Qual é o seu nível de escolaridade atual e qual área de atuação mais te interessa?"
+    )
+
+
+class _ManipuladorFalso(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_POST(self):
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        corpo = json.loads(self.rfile.read(tamanho) or b'{}')
+        servidor = self.server
+        time.sleep(servidor.latencia.amostrar())
+        servidor.contar(self.path)
+
+        if servidor.sortear_erro():
+            self._responder(503, {'error': {'message': "Falha simulada."}})
+        elif self.path.endswith('/chat/completions'):
+            self._responder(200, self._chat(corpo))
+        elif self.path.endswith('/v1/embed'):
+            self._responder(200, self._embed_v1(corpo))
+        elif self.path.endswith('/v2/embed'):
+            self._responder(200, self._embed_v2(corpo))
+        else:
+            self._responder(404, {'message': f"Rota não simulada: {self.path}"})
+
+    def _chat(self, corpo):
+        mensagens = corpo.get('messages', [])
+        conteudo = resposta_chat_deterministica(mensagens, corpo.get('max_tokens'))
+        tokens_prompt = sum(len(m.get('content') or '') for m in mensagens) // 4
+        tokens_resposta = len(conteudo) // 4
+        return {
+            'id': 'chatcmpl-falso',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': corpo.get('model'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': conteudo},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': tokens_prompt,
+                'completion_tokens': tokens_resposta,
+                'total_tokens': tokens_prompt + tokens_resposta,
+            },
+        }
+
+    def _vetores(self, corpo):
+        dimensao = DIMENSOES_EMBEDDING.get(corpo.get('model'), DIMENSAO_PADRAO)
+        return [embedding_deterministico(t, dimensao) for t in corpo.get('texts', [])]
+
+    def _meta(self, corpo, versao):
+        tokens = sum(len(t) for t in corpo.get('texts', [])) // 4
+        return {'api_version': {'version': versao}, 'billed_units': {'input_tokens': tokens}}
+
+    def _embed_v1(self, corpo):
+        return {
+            'id': 'embed-falso',
+            'response_type': 'embeddings_floats',
+            'embeddings': self._vetores(corpo),
+            'texts': corpo.get('texts', []),
+            'meta': self._meta(corpo, '1'),
+        }
+
+    def _embed_v2(self, corpo):
+        return {
+            'id': 'embed-falso',
+            'response_type': 'embeddings_by_type',
+            'embeddings': {'float': self._vetores(corpo)},
+            'texts': corpo.get('texts', []),
+            'meta': self._meta(corpo, '2'),
+        }
+
+
+class ServidorFalso(ThreadingHTTPServer):
+    """
+    Servidor HTTP que atende chat completions (formato OpenAI/Groq) e
+    embeddings (Cohere v1 e v2) com a latência configurada. Uma fração
+    `erros` das requisições (alterável com o servidor no ar) recebe 503.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latencia, host='127.0.0.1', porta=0, erros=0.0, semente=0):
+        super().__init__((host, porta), _ManipuladorFalso)
+        self.latencia = latencia
+        self.erros = erros
+        self._rng_erros = random.Random(semente)
+        self.chamadas = {}
+        self._lock_chamadas = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, porta = self.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def contar(self, rota):
+        with self._lock_chamadas:
+            self.chamadas[rota] = self.chamadas.get(rota, 0) + 1
+
+    def sortear_erro(self):
+        with self._lock_chamadas:
+            return self.erros > 0 and self._rng_erros.random() < self.erros
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"Servidor falso em {self.url} com {self.latencia}.")
+        return self
+
+    def parar(self):
+        self.shutdown()
+        self.server_close()
+
+
+def pagina_html(indice, versao, tamanho):
+    """
+    Página de oportunidade determinística com cerca de `tamanho` bytes.
+    """
+    paragrafo = (f"<p>Oportunidade {indice}, versão {versao}: curso online de análise de dados "
+                 f"com certificado, inscrições abertas e vagas limitadas.</p>\n")
+    corpo = paragrafo * max(1, tamanho // len(paragrafo))
+    return (
+        f"<!doctype html><html><head><title>Oportunidade {indice}</title>"
+        f"<meta name=\"description\" content=\"Resumo da oportunidade {indice}\">"
+        f"<script>var rastreio = {indice};</script><style>p {{ margin: 0 }}</style></head>"
+        f"<body><h1>Oportunidade {indice}</h1>{corpo}</body></html>"
+    ).encode('utf-8')
+
+
+class _ManipuladorPaginas(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        servidor = self.server
+        partes = self.path.strip('/').split('/')
+        if len(partes) != 2 or partes[0] != 'pagina' or not partes[1].isdigit():
+            servidor.contar('404')
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        indice = int(partes[1])
+        with servidor._lock_chamadas:
+            servidor.simultaneas += 1
+            servidor.maximo_simultaneas = max(servidor.maximo_simultaneas, servidor.simultaneas)
+        try:
+            time.sleep(servidor.latencia.amostrar())
+            etag = f'"v{servidor.versao}-{indice}"'
+            modificada = 'Mon, 01 Jan 2024 00:00:00 GMT'
+            if self.headers.get('If-None-Match') == etag:
+                servidor.contar('304')
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            servidor.contar('200')
+            corpo = pagina_html(indice, servidor.versao, servidor.tamanho)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', modificada)
+            self.end_headers()
+            self.wfile.write(corpo)
+        finally:
+            with servidor._lock_chamadas:
+                servidor.simultaneas -= 1
+
+
+class ServidorPaginas(ServidorFalso):
+    """
+    Servidor de páginas HTML (/pagina/<n>) com ETag e Last-Modified, que
+    responde 304 a GETs condicionais. Trocar `versao` muda todas as páginas.
+    Conta respostas por status e o máximo de requisições simultâneas.
+    """
+
+    def __init__(self, latencia, tamanho=20000, host='127.0.0.1', porta=0):
+        ThreadingHTTPServer.__init__(self, (host, porta), _ManipuladorPaginas)
+        self.latencia = latencia
+        self.tamanho = tamanho
+        self.versao = 1
+        self.chamadas = {}
+        self.simultaneas = 0
+        self.maximo_simultaneas = 0
+        self._lock_chamadas = threading.Lock()
+        self._thread = None
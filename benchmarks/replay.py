@@ -0,0 +1,480 @@
+"""
+Gerador de carga que reproduz conversas gravadas com muitos usuários virtuais.
+
+Fontes de conversas:
+
+- documentos de HistoricoConversa lidos do MongoDB (--mongo) ou de um
+  arquivo JSON/JSONL exportado (--arquivo);
+- arquivos memoria_{session_id}.json/.jsonl gravados por app__.py (--diretorio-memoria).
+
+Cada usuário virtual faz /login, /conversa e então envia as mensagens do
+usuário na ordem gravada para /mensagem, esperando um tempo de "pensamento"
+entre elas. O relatório traz vazão sustentada, taxa de erro, recusas (429
+do controle de admissão, fora dos percentis e da vazão), latências de cauda
+e uso de CPU/memória do servidor. Com --degraus várias quantidades de
+usuários são testadas em sequência para encontrar o joelho da curva.
+
+    python -m benchmarks.replay --arquivo historico.jsonl --url http://localhost:5000 \\
+        --degraus 1,4,16,64 --duracao 120 --pid-servidor 12345
+"""
+import os
+import sys
+import json
+import glob
+import time
+import logging
+import argparse
+import datetime
+import tempfile
+import threading
+import http.client
+import urllib.parse
+
+from benchmarks.falsos import Latencia, ServidorFalso
+from benchmarks.estatisticas import resumo_latencias, situacao_resposta, metadados, commit_atual
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Pausas gravadas muito longas (o usuário saiu e voltou depois) são truncadas
+PENSAMENTO_MAXIMO_S = 60.0
+
+
+def _para_datetime(valor):
+    if isinstance(valor, datetime.datetime):
+        return valor
+    if isinstance(valor, dict) and '$date' in valor:
+        valor = valor['$date']
+        if isinstance(valor, dict):
+            valor = int(valor.get('$numberLong', 0))
+    if isinstance(valor, (int, float)):
+        return datetime.datetime.utcfromtimestamp(valor / 1000.0)
+    if isinstance(valor, str):
+        try:
+            return datetime.datetime.fromisoformat(valor.replace('Z', '+00:00')).replace(tzinfo=None)
+        except ValueError:
+            return None
+    return None
+
+
+def _conversa_de_mensagens(origem, mensagens):
+    """
+    Converte a lista de mensagens gravada em [(texto, pausa_gravada_s)] do usuário.
+    """
+    turnos = []
+    anterior = None
+    for msg in mensagens:
+        instante = _para_datetime(msg.get('timestamp'))
+        if msg.get('type') == 'human':
+            pausa = None
+            if instante and anterior:
+                pausa = min(max((instante - anterior).total_seconds(), 0.0), PENSAMENTO_MAXIMO_S)
+            turnos.append((msg.get('content', ''), pausa))
+        if instante:
+            anterior = instante
+    return {'origem': origem, 'turnos': turnos}
+
+
+def carregar_do_mongo(limite):
+    sys.path.insert(0, RAIZ)
+    import conexao_mongo
+    from pymongo import ReadPreference
+
+    client_mongo = conexao_mongo.conectar()
+    # Lê de um secundário quando houver, para não competir com o tráfego do app
+    colecao = client_mongo[conexao_mongo.NOME_BANCO].get_collection(
+        'HistoricoConversa', read_preference=ReadPreference.SECONDARY_PREFERRED
+    )
+    cursor = colecao.find({}, {'user_id': 1, 'messages.type': 1, 'messages.content': 1, 'messages.timestamp': 1})
+    if limite:
+        cursor = cursor.limit(limite)
+    return [_conversa_de_mensagens(doc.get('user_id'), doc.get('messages', [])) for doc in cursor]
+
+
+def carregar_de_arquivo(caminho, limite):
+    """
+    Aceita um array JSON ou JSONL (um documento por linha, como o mongoexport).
+    """
+    with open(caminho, 'r', encoding='utf-8') as f:
+        conteudo = f.read().strip()
+    if conteudo.startswith('['):
+        documentos = json.loads(conteudo)
+    else:
+        documentos = [json.loads(linha) for linha in conteudo.splitlines() if linha.strip()]
+    if limite:
+        documentos = documentos[:limite]
+    return [_conversa_de_mensagens(doc.get('user_id'), doc.get('messages', [])) for doc in documentos]
+
+
+def carregar_de_diretorio_memoria(diretorio, limite):
+    from memoria_arquivo import ArmazemSessoes
+
+    armazem = ArmazemSessoes(diretorio)
+    sessoes = set()
+    for caminho in glob.glob(os.path.join(diretorio, 'memoria_*.json')) + glob.glob(os.path.join(diretorio, 'memoria_*.jsonl')):
+        sessoes.add(os.path.basename(caminho)[len('memoria_'):].rsplit('.', 1)[0])
+    conversas = []
+    for session_id in sorted(sessoes):
+        conversas.append(_conversa_de_mensagens(session_id, armazem.carregar(session_id)))
+        if limite and len(conversas) >= limite:
+            break
+    return conversas
+
+
+class ModeloPensamento:
+    """
+    Tempo entre a resposta do assistente e a próxima mensagem do usuário.
+
+    'gravado' usa a pausa registrada na conversa (com a distribuição de
+    reserva quando não houver timestamps); as demais especificações seguem
+    o formato de benchmarks.falsos.Latencia.
+    """
+
+    def __init__(self, especificacao, escala, reserva, semente):
+        self.gravado = especificacao == 'gravado'
+        self.distribuicao = Latencia(reserva if self.gravado else especificacao, semente)
+        self.escala = escala
+
+    def pausa(self, pausa_gravada):
+        if self.gravado and pausa_gravada is not None:
+            return pausa_gravada * self.escala
+        return self.distribuicao.amostrar() * self.escala
+
+
+class MonitorRecursos(threading.Thread):
+    """
+    Amostra CPU e memória residente do processo do servidor (e filhos, como
+    os workers de um servidor pre-fork) uma vez por intervalo.
+    """
+
+    def __init__(self, pid, intervalo=1.0):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.intervalo = intervalo
+        self.amostras = []
+        self._parar = threading.Event()
+
+    def _ler_proc(self):
+        with open(f'/proc/{self.pid}/stat', 'r') as f:
+            campos = f.read().rsplit(')', 1)[1].split()
+        ticks = os.sysconf('SC_CLK_TCK')
+        cpu_s = (int(campos[11]) + int(campos[12])) / ticks
+        rss = int(campos[21]) * os.sysconf('SC_PAGE_SIZE')
+        return cpu_s, rss
+
+    def run(self):
+        try:
+            import psutil
+            processo = psutil.Process(self.pid)
+        except ImportError:
+            processo = None
+        anterior = None
+        while not self._parar.wait(self.intervalo):
+            try:
+                if processo is not None:
+                    grupo = [processo] + processo.children(recursive=True)
+                    cpu_s = sum(sum(p.cpu_times()[:2]) for p in grupo)
+                    rss = sum(p.memory_info().rss for p in grupo)
+                else:
+                    cpu_s, rss = self._ler_proc()
+            except Exception as e:
+                logging.warning(f"Não foi possível ler os recursos do processo {self.pid}: {e}")
+                return
+            agora = time.monotonic()
+            if anterior is not None:
+                cpu_pct = (cpu_s - anterior[1]) / (agora - anterior[0]) * 100.0
+                self.amostras.append({'cpu_pct': round(cpu_pct, 1), 'rss_mb': round(rss / 2 ** 20, 1)})
+            anterior = (agora, cpu_s)
+
+    def parar(self):
+        self._parar.set()
+
+    def resumo(self):
+        if not self.amostras:
+            return None
+        cpus = [a['cpu_pct'] for a in self.amostras]
+        rss = [a['rss_mb'] for a in self.amostras]
+        return {
+            'cpu_pct_media': round(sum(cpus) / len(cpus), 1),
+            'cpu_pct_max': max(cpus),
+            'rss_mb_max': max(rss),
+            'rss_mb_final': rss[-1],
+        }
+
+
+class Registro:
+    """
+    Resultados de todas as requisições de um degrau.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.eventos = []  # (instante_fim, rota, latencia_s, situacao: 'ok', 'recusada' ou 'erro')
+
+    def adicionar(self, rota, latencia, situacao):
+        with self.lock:
+            self.eventos.append((time.monotonic(), rota, latencia, situacao))
+
+
+class UsuarioVirtual(threading.Thread):
+    def __init__(self, indice, conversa, args, pensamento, registro, prazo, parar):
+        super().__init__(daemon=True)
+        self.indice = indice
+        self.conversa = conversa
+        self.args = args
+        self.pensamento = pensamento
+        self.registro = registro
+        self.prazo = prazo
+        self.parar = parar
+        url = urllib.parse.urlparse(args.url)
+        self.host, self.porta = url.hostname, url.port or 80
+        self.conexao = None
+
+    def _post(self, rota, corpo):
+        if self.conexao is None:
+            self.conexao = http.client.HTTPConnection(self.host, self.porta, timeout=self.args.timeout)
+        inicio = time.perf_counter()
+        try:
+            self.conexao.request('POST', rota, body=json.dumps(corpo), headers={'Content-Type': 'application/json'})
+            resposta = self.conexao.getresponse()
+            dados = resposta.read()
+            situacao = situacao_resposta(resposta.status)
+        except (OSError, http.client.HTTPException):
+            self.conexao.close()
+            self.conexao = None
+            dados, situacao = b'', 'erro'
+        self.registro.adicionar(rota, time.perf_counter() - inicio, situacao)
+        return dados if situacao == 'ok' else None
+
+    def _esperar(self, segundos):
+        return not self.parar.wait(min(segundos, max(self.prazo - time.monotonic(), 0.0)))
+
+    def run(self):
+        repeticao = 0
+        while time.monotonic() < self.prazo and not self.parar.is_set():
+            sessao = f"replay-{self.indice}-{repeticao}-{self.conversa['origem']}"
+            chave = 'session_id' if self.args.alvo == 'app__' else 'user_id'
+            # Todos fazem login com a mesma credencial, mas cada um mantém sua própria conversa
+            self._post('/login', {'email': self.args.email, 'senha': self.args.senha})
+            self._post('/conversa', {chave: sessao})
+            for texto, pausa_gravada in self.conversa['turnos']:
+                if not self._esperar(self.pensamento.pausa(pausa_gravada)):
+                    break
+                if time.monotonic() >= self.prazo:
+                    break
+                self._post('/mensagem', {chave: sessao, 'mensagem': texto})
+            repeticao += 1
+            if not self.args.repetir:
+                break
+        if self.conexao is not None:
+            self.conexao.close()
+
+
+def resumir_degrau(registro, usuarios, inicio, fim, rampa):
+    eventos = registro.eventos
+    por_rota = {}
+    for _, rota, latencia, situacao in eventos:
+        dados = por_rota.setdefault(rota, {'latencias': [], 'erros': 0, 'recusadas': 0})
+        # Recusas voltam na hora: ficam fora das latências
+        if situacao == 'recusada':
+            dados['recusadas'] += 1
+            continue
+        dados['latencias'].append(latencia)
+        if situacao == 'erro':
+            dados['erros'] += 1
+
+    atendidos = [e for e in eventos if e[3] != 'recusada']
+    # Vazão sustentada: requisições atendidas depois da rampa de subida
+    inicio_estavel = inicio + rampa
+    estaveis = [e for e in atendidos if e[0] >= inicio_estavel]
+    janela = max(fim - inicio_estavel, 1e-9)
+    total = len(eventos)
+    erros = sum(1 for e in eventos if e[3] == 'erro')
+    recusadas = total - len(atendidos)
+    todas = [e[2] for e in atendidos]
+    return {
+        'usuarios_virtuais': usuarios,
+        'requisicoes': total,
+        'erros': erros,
+        'taxa_erro': round(erros / total, 4) if total else None,
+        'recusadas': recusadas,
+        'taxa_recusa': round(recusadas / total, 4) if total else None,
+        'duracao_s': round(fim - inicio, 3),
+        'throughput_sustentado_rps': round(len(estaveis) / janela, 3),
+        'latencia_ms': resumo_latencias(todas),
+        'rotas': {
+            rota: {
+                'requisicoes': len(d['latencias']) + d['recusadas'],
+                'erros': d['erros'],
+                'recusadas': d['recusadas'],
+                'latencia_ms': resumo_latencias(d['latencias']),
+            }
+            for rota, d in sorted(por_rota.items())
+        },
+    }
+
+
+def rodar_degrau(usuarios, conversas, args, pensamento):
+    registro = Registro()
+    parar = threading.Event()
+    monitor = MonitorRecursos(args.pid_servidor) if args.pid_servidor else None
+    if monitor:
+        monitor.start()
+
+    inicio = time.monotonic()
+    prazo = inicio + args.duracao
+    threads = []
+    for i in range(usuarios):
+        vu = UsuarioVirtual(i, conversas[i % len(conversas)], args, pensamento, registro, prazo, parar)
+        threads.append(vu)
+        vu.start()
+        # Rampa de subida linear para não disparar todos de uma vez
+        if args.rampa and usuarios > 1:
+            time.sleep(args.rampa / usuarios)
+    try:
+        for t in threads:
+            t.join(max(prazo - time.monotonic(), 0) + args.timeout)
+    except KeyboardInterrupt:
+        parar.set()
+    parar.set()
+    fim = time.monotonic()
+
+    resultado = resumir_degrau(registro, usuarios, inicio, fim, args.rampa)
+    if monitor:
+        monitor.parar()
+        monitor.join()
+        resultado['recursos_servidor'] = monitor.resumo()
+    return resultado
+
+
+def encontrar_joelho(degraus):
+    """
+    Degrau com a maior "potência" (vazão / latência p99): a partir dele mais
+    usuários aumentam principalmente a fila, não a vazão.
+
+    Degraus com erros ou recusas já passaram da capacidade e não concorrem;
+    retorna (usuários do joelho ou None, [{usuarios_virtuais, motivo}] dos
+    degraus descartados).
+    """
+    melhor, melhor_potencia = None, 0.0
+    descartados = []
+    for d in degraus:
+        p99 = d['latencia_ms']['p99']
+        if not p99:
+            motivo = "nenhuma requisição atendida"
+        elif d['taxa_erro']:
+            motivo = f"taxa de erro {d['taxa_erro']:.2%}"
+        elif d.get('taxa_recusa'):
+            motivo = f"taxa de recusa {d['taxa_recusa']:.2%}"
+        else:
+            potencia = d['throughput_sustentado_rps'] / p99
+            if potencia > melhor_potencia:
+                melhor, melhor_potencia = d['usuarios_virtuais'], potencia
+            continue
+        logging.warning(f"Degrau de {d['usuarios_virtuais']} usuários virtuais fora do cálculo do joelho: {motivo}.")
+        descartados.append({'usuarios_virtuais': d['usuarios_virtuais'], 'motivo': motivo})
+    return melhor, descartados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduz conversas gravadas como carga concorrente.")
+    fonte = parser.add_mutually_exclusive_group(required=True)
+    fonte.add_argument('--mongo', action='store_true', help="Lê HistoricoConversa do MongoDB configurado no .env.")
+    fonte.add_argument('--arquivo', help="JSON/JSONL com documentos de HistoricoConversa.")
+    fonte.add_argument('--diretorio-memoria', help="Diretório conversa_memoria/ de app__.py.")
+    parser.add_argument('--limite-conversas', type=int, default=None)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--alvo', choices=('aplicativo', 'app__'), default='aplicativo',
+                        help="app__ identifica a conversa por session_id em vez de user_id.")
+    parser.add_argument('--email', default=None, help="Login usado pelos usuários virtuais (padrão: primeiro de usuarios.json).")
+    parser.add_argument('--senha', default=None)
+    parser.add_argument('--degraus', default='8', help="Quantidades de usuários virtuais, ex.: 1,4,16,64.")
+    parser.add_argument('--duracao', type=float, default=60.0, help="Duração de cada degrau em segundos.")
+    parser.add_argument('--rampa', type=float, default=5.0, help="Segundos para iniciar todos os usuários.")
+    parser.add_argument('--repetir', action='store_true', help="Recomeça a conversa ao terminar, até o fim do degrau.")
+    parser.add_argument('--pensamento', default='gravado',
+                        help="'gravado' ou distribuição (ex.: lognormal:4000:0.6) em ms.")
+    parser.add_argument('--pensamento-reserva', default='lognormal:4000:0.6',
+                        help="Distribuição usada quando a conversa não tem timestamps.")
+    parser.add_argument('--escala-pensamento', type=float, default=1.0)
+    parser.add_argument('--pid-servidor', type=int, default=None, help="PID do servidor para medir CPU e memória.")
+    parser.add_argument('--servidor-local', action='store_true',
+                        help="Sobe aplicativo.py com Groq/Cohere falsos e Mongo em memória (como bench_api).")
+    parser.add_argument('--latencia-llm', default='lognormal:300:0.5')
+    parser.add_argument('--latencia-embed', default='lognormal:60:0.3')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--saida', help="Arquivo JSON de saída (padrão: benchmarks/resultados/replay-<commit>.json).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.mongo:
+        conversas = carregar_do_mongo(args.limite_conversas)
+    elif args.arquivo:
+        conversas = carregar_de_arquivo(args.arquivo, args.limite_conversas)
+    else:
+        conversas = carregar_de_diretorio_memoria(args.diretorio_memoria, args.limite_conversas)
+    conversas = [c for c in conversas if c['turnos']]
+    if not conversas:
+        parser.error("Nenhuma conversa com mensagens do usuário foi encontrada.")
+    logging.info(f"{len(conversas)} conversas carregadas, {sum(len(c['turnos']) for c in conversas)} mensagens do usuário.")
+
+    if args.email is None:
+        with open(os.path.join(RAIZ, 'usuarios.json'), 'r') as f:
+            usuarios = json.load(f)
+        args.email = next(iter(usuarios))
+        registro_usuario = usuarios[args.email]
+        args.senha = registro_usuario['password'] if isinstance(registro_usuario, dict) else registro_usuario
+
+    servidores_falsos, servidor = [], None
+    if args.servidor_local:
+        from benchmarks.bench_api import ServidorApp, porta_livre
+        llm = ServidorFalso(Latencia(args.latencia_llm, args.semente)).iniciar()
+        embed = ServidorFalso(Latencia(args.latencia_embed, args.semente + 1)).iniciar()
+        servidores_falsos = [llm, embed]
+        porta = porta_livre()
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8') as f:
+            json.dump({'grupos': []}, f)
+            semente = f.name
+        servidor = ServidorApp(porta, llm.url, embed.url, semente)
+        args.url = f"http://127.0.0.1:{porta}"
+        args.pid_servidor = servidor.processo.pid
+
+    pensamento = ModeloPensamento(args.pensamento, args.escala_pensamento, args.pensamento_reserva, args.semente)
+    degraus = []
+    try:
+        if servidor:
+            servidor.aguardar()
+            os.unlink(semente)
+        for usuarios in [int(v) for v in args.degraus.split(',') if v.strip()]:
+            logging.info(f"Degrau com {usuarios} usuários virtuais por {args.duracao:.0f}s...")
+            resultado = rodar_degrau(usuarios, conversas, args, pensamento)
+            degraus.append(resultado)
+            lat = resultado['latencia_ms']
+            logging.info(
+                f"{usuarios} VUs: {resultado['throughput_sustentado_rps']} req/s sustentadas, "
+                f"erro={resultado['taxa_erro']}, recusa={resultado['taxa_recusa']}, p50={lat['p50']}ms p99={lat['p99']}ms, "
+                f"servidor={resultado.get('recursos_servidor')}"
+            )
+    finally:
+        if servidor:
+            servidor.parar()
+        for s in servidores_falsos:
+            s.parar()
+
+    joelho, descartados = encontrar_joelho(degraus)
+    if joelho is not None:
+        logging.info(f"Joelho da curva estimado em {joelho} usuários virtuais.")
+    else:
+        logging.warning("Nenhum degrau sem erros ou recusas: joelho da curva não estimado.")
+
+    config = {k: v for k, v in vars(args).items() if k not in ('saida', 'senha')}
+    saida = args.saida or os.path.join(RAIZ, 'benchmarks', 'resultados', f"replay-{commit_atual() or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump({'meta': metadados(config), 'degraus': degraus, 'joelho_usuarios_virtuais': joelho,
+                   'degraus_fora_do_joelho': descartados}, f, ensure_ascii=False, indent=2)
+    logging.info(f"Resultados salvos em {saida}")
+
+
+if __name__ == '__main__':
+    main()
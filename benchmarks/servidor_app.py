@@ -0,0 +1,120 @@
+"""
+Sobe o app de aplicativo.py contra um MongoDB em memória (mongomock).
+
+Groq e Cohere são apontados para os servidores falsos pelas variáveis
+GROQ_BASE_URL e CO_API_URL, definidas por quem inicia este processo.
+
+    python -m benchmarks.servidor_app --porta 5055 --semente semente.json
+"""
+import os
+import sys
+import json
+import random
+import logging
+import argparse
+import datetime
+
+import mongomock
+import pymongo
+import pymongo.mongo_client
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FRASES_USUARIO = [
+    "Tenho ensino médio completo e quero fazer uma graduação em tecnologia.",
+    "Trabalho no varejo há cinco anos e não estou muito satisfeito.",
+    "Meu objetivo é migrar para a área de dados nos próximos dois anos.",
+    "Gostaria de fazer cursos de Python, SQL e estatística.",
+    "Prefiro oportunidades online, mas aceito híbridas em São Paulo.",
+    "Tenho pouco tempo livre durante a semana e orçamento limitado.",
+]
+FRASES_ASSISTENTE = [
+    "Entendi! Qual é a sua área de trabalho atual?",
+    "Obrigado. Quais são seus objetivos profissionais a curto prazo?",
+    "Ótimo. Que cursos ou certificações você gostaria de fazer?",
+    "Você prefere oportunidades presenciais, online ou híbridas?",
+    "Existe alguma limitação de tempo ou financeira que devo considerar?",
+    "Perfeito. Deseja receber as recomendações agora?",
+]
+
+
+def gerar_historico(comprimento, rng):
+    """
+    Lista de mensagens alternando assistente e usuário, como gravada por salvar_memoria.
+    """
+    agora = datetime.datetime.utcnow()
+    mensagens = []
+    for i in range(comprimento):
+        if i % 2 == 0:
+            tipo, conteudo = 'ai', rng.choice(FRASES_ASSISTENTE)
+        else:
+            tipo, conteudo = 'human', rng.choice(FRASES_USUARIO)
+        mensagens.append({'type': tipo, 'content': conteudo, 'timestamp': agora})
+    return mensagens
+
+
+def popular_banco(db, semente):
+    """
+    Popula as coleções a partir da especificação gerada por bench_api:
+
+    {"grupos": [{"prefixo": "...", "usuarios": 16, "comprimento": 50}],
+     "oportunidades_por_usuario": 20}
+    """
+    rng = random.Random(semente.get('semente', 0))
+    por_usuario = semente.get('oportunidades_por_usuario', 0)
+    historicos, oportunidades = [], []
+    for grupo in semente.get('grupos', []):
+        for i in range(grupo['usuarios']):
+            user_id = f"{grupo['prefixo']}-{i}"
+            if grupo['comprimento'] > 0:
+                historicos.append({
+                    'user_id': user_id,
+                    'messages': gerar_historico(grupo['comprimento'], rng),
+                    'last_updated': datetime.datetime.utcnow(),
+                })
+            for j in range(por_usuario):
+                oportunidades.append({
+                    'user_id': user_id,
+                    'titulo': f"Oportunidade {j} para {user_id}",
+                    'descricao': "Curso online de análise de dados com certificado.",
+                    'link': f"https://exemplo.com/oportunidades/{j}",
+                })
+    if historicos:
+        db['HistoricoConversa'].insert_many(historicos)
+    if oportunidades:
+        db['Oportunidades'].insert_many(oportunidades)
+    logging.warning(f"Banco em memória populado: {len(historicos)} conversas, {len(oportunidades)} oportunidades.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor do app para benchmarks.")
+    parser.add_argument('--porta', type=int, default=5055)
+    parser.add_argument('--semente', help="Arquivo JSON com a especificação dos dados iniciais.")
+    args = parser.parse_args()
+
+    # O MongoClient precisa ser substituído antes de aplicativo.py ser importado
+    pymongo.MongoClient = mongomock.MongoClient
+    pymongo.mongo_client.MongoClient = mongomock.MongoClient
+    os.environ.setdefault('MONGODB_URI', 'mongodb://localhost')
+    # Os benchmarks medem o app sem descarte de carga: com o controle de
+    # admissão, a concorrência alta vira 429. ADMISSAO=1 no ambiente o mede.
+    os.environ.setdefault('ADMISSAO', '0')
+
+    os.chdir(RAIZ)
+    if RAIZ not in sys.path:
+        sys.path.insert(0, RAIZ)
+    import aplicativo
+
+    if args.semente:
+        with open(args.semente, 'r', encoding='utf-8') as f:
+            popular_banco(aplicativo.obter_db(), json.load(f))
+
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    servidor = make_server('127.0.0.1', args.porta, aplicativo.app, threaded=True)
+    print("PRONTO", flush=True)
+    servidor.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+Busca híbrida (palavras-chave + vetores) nas mensagens de um usuário no Contexto.
+
+Termos exatos, como nomes de cursos, cidades e certificações, nem sempre ficam
+perto da consulta no espaço dos embeddings ("AWS Solutions Architect" e "Azure
+Administrator" embedam quase igual). A busca combina duas listas:
+
+- lexical: índice invertido das palavras de cada mensagem, pontuado por BM25;
+- vetorial: similaridade de cosseno dos embeddings;
+
+fundidas por reciprocal rank fusion (RRF), que só usa as posições e dispensa
+calibrar as duas pontuações. As duas listas são sempre filtradas por user_id
+antes de pontuar: nenhuma consulta lê mensagens ou vetores de outro usuário.
+
+Dois índices oferecem buscar(user_id, texto, vetor, k):
+
+- IndiceMongo: a parte lexical consulta o campo palavras, gravado com cada
+  mensagem (campos_lexicos), pelo índice composto (user_id, palavras); a parte
+  vetorial é a função de busca recebida (Atlas $vectorSearch ou
+  embeddings_compactos.buscar, ambas filtradas por user_id);
+- IndiceLocal: índice em memória particionado por usuário, para uso offline
+  (benchmarks, testes, exports) sem MongoDB.
+"""
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+RRF_K = 60
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Palavras distintas gravadas por mensagem e termos usados por consulta
+MAX_PALAVRAS = 200
+MAX_TERMOS_CONSULTA = 32
+# Mensagens com algum termo da consulta lidas pela busca lexical no MongoDB
+MAX_CANDIDATOS_LEXICOS = 500
+NOME_INDICE = 'user_id_palavras'
+
+STOPWORDS = frozenset("""
+a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela para pra com sem e ou que se
+ao aos à às é ser ter tem foi sou estou eu me meu minha meus minhas você voce isso isto esse essa este esta
+mais muito já ja não nao sim também tambem como quando onde qual quero gostaria fazer sobre
+the of and or for in on to with at by from an is are
+""".split())
+
+
+def normalizar(texto):
+    texto = unicodedata.normalize('NFKD', (texto or '').lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def tokenizar(texto, stopwords=STOPWORDS):
+    """Palavras sem acento, em minúsculas e sem stopwords ('São Paulo' -> ['sao', 'paulo'])."""
+    return [t for t in re.findall(r'[a-z0-9+#]+', normalizar(texto)) if len(t) > 1 and t not in stopwords]
+
+
+def campos_lexicos(texto):
+    """Campos gravados com a mensagem no Contexto para a busca lexical."""
+    termos = tokenizar(texto)
+    return {'palavras': sorted(set(termos))[:MAX_PALAVRAS], 'n_palavras': len(termos)}
+
+
+def termos_consulta(texto):
+    return list(dict.fromkeys(tokenizar(texto)))[:MAX_TERMOS_CONSULTA]
+
+
+def idf(total, df):
+    """IDF do BM25 de um termo presente em df de total documentos."""
+    return np.log(1 + (total - df + 0.5) / (df + 0.5))
+
+
+def peso_bm25(tamanho, media):
+    """
+    Peso BM25 de um termo presente num documento de `tamanho` termos (média
+    `media`), com frequência 1. Aceita um array de tamanhos.
+    """
+    return (BM25_K1 + 1) / (1 + BM25_K1 * (1 - BM25_B + BM25_B * tamanho / max(media, 1.0)))
+
+
+def bm25(termos, palavras, tamanho, frequencias, total, media):
+    """
+    Pontuação BM25 de uma mensagem (conjunto de palavras, tamanho em termos).
+    Cada palavra conta uma vez por mensagem: em mensagens curtas a frequência
+    do termo quase nunca passa de 1.
+    """
+    peso = peso_bm25(tamanho, media)
+    return float(sum(idf(total, frequencias.get(termo, 0)) * peso for termo in termos if termo in palavras))
+
+
+def peso_rrf(posicao):
+    """Contribuição RRF da posição (0 = primeira) num ranking. Aceita um array de posições."""
+    return 1.0 / (RRF_K + 1 + posicao)
+
+
+def fundir(*rankings, k=None):
+    """
+    Reciprocal rank fusion de listas de (documento, score), cada uma do melhor
+    para o pior. Documentos são identificados pelo _id. Retorna [(documento, score RRF)].
+    """
+    fundidos, documentos = {}, {}
+    for ranking in rankings:
+        for posicao, (documento, _) in enumerate(ranking):
+            chave = documento['_id']
+            documentos.setdefault(chave, documento)
+            fundidos[chave] = fundidos.get(chave, 0.0) + peso_rrf(posicao)
+    ordem = sorted(fundidos, key=fundidos.get, reverse=True)
+    return [(documentos[chave], round(fundidos[chave], 6)) for chave in ordem[:k]]
+
+
+class IndiceMongo:
+    def __init__(self, colecao, busca_vetorial=None):
+        """
+        busca_vetorial(user_id, vetor, limite) retorna [(documento, score)],
+        documentos com _id e content, já filtrada por user_id.
+        """
+        self.colecao = colecao
+        self.busca_vetorial = busca_vetorial
+
+    def garantir_indice(self):
+        self.colecao.create_index([('user_id', 1), ('palavras', 1)], name=NOME_INDICE)
+
+    def buscar_lexical(self, user_id, texto, limite):
+        termos = termos_consulta(texto)
+        if not termos:
+            return []
+        candidatos = list(self.colecao.find(
+            {'user_id': user_id, 'palavras': {'$in': termos}},
+            {'content': 1, 'palavras': 1, 'n_palavras': 1},
+        ).limit(MAX_CANDIDATOS_LEXICOS))
+        if not candidatos:
+            return []
+        total = self.colecao.count_documents({'user_id': user_id})
+        # Frequência e tamanho médio estimados nas mensagens com algum termo da
+        # consulta: exatos para a frequência enquanto não passam do limite
+        frequencias = {}
+        for documento in candidatos:
+            for termo in set(documento['palavras']).intersection(termos):
+                frequencias[termo] = frequencias.get(termo, 0) + 1
+        media = float(np.mean([d.get('n_palavras') or len(d['palavras']) for d in candidatos]))
+        pontuados = [
+            ({'_id': d['_id'], 'content': d.get('content', '')},
+             bm25(termos, set(d['palavras']), d.get('n_palavras') or len(d['palavras']), frequencias,
+                  max(total, len(candidatos)), media))
+            for d in candidatos
+        ]
+        pontuados.sort(key=lambda par: par[1], reverse=True)
+        return pontuados[:limite]
+
+    def buscar(self, user_id, texto, vetor=None, k=5, candidatos=50):
+        lexicos = self.buscar_lexical(user_id, texto, candidatos) if texto else []
+        vetoriais = []
+        if vetor is not None and self.busca_vetorial is not None:
+            vetoriais = self.busca_vetorial(user_id, vetor, candidatos)
+        return fundir(lexicos, vetoriais, k=k)
+
+
+class _Particao:
+    """Mensagens de um usuário no IndiceLocal."""
+
+    def __init__(self):
+        self.documentos = []
+        self.palavras = []
+        self.tamanhos = []
+        self.postings = {}
+        self.vetores = []
+        self._matriz = None
+
+    def matriz(self, dimensao):
+        if self._matriz is None or self._matriz[0] != dimensao:
+            linhas = [i for i, v in enumerate(self.vetores) if v is not None and v.shape[0] == dimensao]
+            matriz = np.vstack([self.vetores[i] for i in linhas]) if linhas else np.zeros((0, dimensao), np.float32)
+            self._matriz = (dimensao, np.asarray(linhas), matriz)
+        return self._matriz[1], self._matriz[2]
+
+
+class IndiceLocal:
+    """
+    Índice em memória com uma partição por usuário: uma busca só pontua as
+    mensagens e os vetores da partição do user_id consultado.
+    """
+
+    def __init__(self):
+        self._particoes = {}
+        self._lock = threading.Lock()
+
+    def adicionar(self, user_id, documento_id, content, vetor=None):
+        with self._lock:
+            particao = self._particoes.setdefault(user_id, _Particao())
+            posicao = len(particao.documentos)
+            termos = tokenizar(content)
+            palavras = set(termos)
+            particao.documentos.append({'_id': documento_id, 'content': content})
+            particao.palavras.append(palavras)
+            particao.tamanhos.append(len(termos))
+            for palavra in palavras:
+                particao.postings.setdefault(palavra, []).append(posicao)
+            if vetor is not None:
+                vetor = np.asarray(vetor, dtype=np.float32)
+                vetor = vetor / (np.linalg.norm(vetor) or 1.0)
+            particao.vetores.append(vetor)
+            particao._matriz = None
+
+    def carregar(self, colecao, user_id):
+        """Carrega as mensagens de um usuário de uma coleção no formato do Contexto."""
+        import embeddings_compactos
+
+        campos = {'content': 1, 'embedding': 1, 'embedding_q': 1, 'embedding_escala': 1, 'embedding_formato': 1}
+        total = 0
+        for documento in colecao.find({'user_id': user_id}, campos):
+            tem_vetor = 'embedding' in documento or 'embedding_q' in documento
+            self.adicionar(user_id, documento['_id'], documento.get('content', ''),
+                           embeddings_compactos.descompactar(documento) if tem_vetor else None)
+            total += 1
+        return total
+
+    def usuarios(self):
+        return list(self._particoes)
+
+    def buscar_lexical(self, user_id, texto, limite):
+        particao = self._particoes.get(user_id)
+        termos = termos_consulta(texto)
+        if particao is None or not termos:
+            return []
+        frequencias = {t: len(particao.postings.get(t, ())) for t in termos}
+        candidatos = set()
+        for termo in termos:
+            candidatos.update(particao.postings.get(termo, ()))
+        total = len(particao.documentos)
+        media = float(np.mean(particao.tamanhos)) if total else 1.0
+        pontuados = [
+            (particao.documentos[i], bm25(termos, particao.palavras[i], particao.tamanhos[i], frequencias, total, media))
+            for i in candidatos
+        ]
+        pontuados.sort(key=lambda par: par[1], reverse=True)
+        return pontuados[:limite]
+
+    def buscar_vetorial(self, user_id, vetor, limite):
+        particao = self._particoes.get(user_id)
+        if particao is None or vetor is None:
+            return []
+        consulta = np.asarray(vetor, dtype=np.float32)
+        linhas, matriz = particao.matriz(consulta.shape[0])
+        if not len(linhas):
+            return []
+        scores = matriz @ (consulta / (np.linalg.norm(consulta) or 1.0))
+        ordem = np.argsort(-scores)[:limite]
+        return [(particao.documentos[linhas[i]], float(scores[i])) for i in ordem]
+
+    def buscar(self, user_id, texto, vetor=None, k=5, candidatos=50):
+        lexicos = self.buscar_lexical(user_id, texto, candidatos) if texto else []
+        return fundir(lexicos, self.buscar_vetorial(user_id, vetor, candidatos), k=k)
@@ -0,0 +1,183 @@
+"""
+Cache das conversas em andamento, com gravação adiada (write-behind).
+
+A conversa de um usuário fica em memória entre uma mensagem e outra: uma
+conversa ativa não é relida do MongoDB a cada turno. Alterações marcam a
+entrada como suja e são gravadas por uma thread em segundo plano:
+
+- quando a alteração mais antiga ainda não gravada passa de idade_max_suja_s;
+- quando a entrada sai do cache (LRU acima de maximo ou ociosa há ocioso_s);
+- em descarregar(), chamado antes de outro processo ler a conversa (crew) e
+  no encerramento do processo (atexit e o hook worker_exit do gunicorn).
+
+Uma entrada removida com alterações pendentes continua acessível até ser
+gravada, então o usuário que volta nesse intervalo não lê uma versão antiga.
+Com versao_atual, cada acerto compara a versão em cache com a do banco (uma
+leitura de um único campo) e recarrega a conversa se outro processo a alterou.
+"""
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+
+
+class _Entrada:
+    __slots__ = ('conversa', 'usada_em', 'suja_desde')
+
+    def __init__(self, conversa):
+        self.conversa = conversa
+        self.usada_em = time.monotonic()
+        self.suja_desde = None
+
+
+class CacheConversas:
+    def __init__(self, carregar, gravar, versao_atual=None, maximo=1000, ocioso_s=900.0,
+                 idade_max_suja_s=5.0, intervalo_s=1.0):
+        """
+        carregar(user_id) lê a conversa do banco; gravar(conversa) grava as
+        alterações pendentes e retorna se conseguiu; versao_atual(user_id),
+        opcional, retorna a versão gravada no banco.
+        """
+        self.carregar = carregar
+        self.gravar = gravar
+        self.versao_atual = versao_atual
+        self.maximo = maximo
+        self.ocioso_s = ocioso_s
+        self.idade_max_suja_s = idade_max_suja_s
+        self.intervalo_s = intervalo_s
+        self._entradas = OrderedDict()
+        # Removidas do cache com alterações ainda não gravadas
+        self._despejadas = {}
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._pid_gravador = None
+        self.estatisticas = {'acertos': 0, 'faltas': 0, 'recarregadas': 0, 'gravacoes': 0, 'falhas': 0}
+        atexit.register(self.descarregar)
+
+    def obter(self, user_id):
+        with self._lock:
+            entrada = self._entradas.get(user_id)
+            if entrada is None:
+                entrada = self._despejadas.pop(user_id, None)
+                if entrada is not None:
+                    self._entradas[user_id] = entrada
+            if entrada is not None:
+                self._entradas.move_to_end(user_id)
+                entrada.usada_em = time.monotonic()
+                self.estatisticas['acertos'] += 1
+
+        if entrada is not None:
+            if self.versao_atual is not None and self.versao_atual(user_id) != entrada.conversa.versao:
+                # Outro worker gravou a conversa: as alterações pendentes são
+                # mescladas pela gravação; sem elas, basta reler
+                self.estatisticas['recarregadas'] += 1
+                if entrada.suja_desde is not None:
+                    self._gravar(entrada)
+                else:
+                    entrada.conversa = self.carregar(user_id)
+            return entrada.conversa
+
+        conversa = self.carregar(user_id)
+        with self._lock:
+            self.estatisticas['faltas'] += 1
+            entrada = self._entradas.get(user_id)
+            if entrada is None:
+                # Outra thread pode ter carregado o mesmo usuário enquanto líamos
+                entrada = self._entradas[user_id] = _Entrada(conversa)
+                self._limitar()
+            return entrada.conversa
+
+    def marcar_suja(self, conversa):
+        """
+        Registra que a conversa tem mensagens ainda não gravadas.
+        """
+        with self._lock:
+            user_id = conversa.user_id
+            entrada = self._entradas.get(user_id) or self._despejadas.get(user_id)
+            if entrada is None:
+                # Gravada e removida enquanto a requisição ainda a usava
+                entrada = self._entradas[user_id] = _Entrada(conversa)
+                self._limitar()
+            elif entrada.conversa is not conversa:
+                entrada = None
+            if entrada is not None:
+                if entrada.suja_desde is None:
+                    entrada.suja_desde = time.monotonic()
+                self._iniciar_gravador()
+        if entrada is None:
+            # Objeto que não é mais o do cache: grava direto (a gravação mescla)
+            self._gravar(_Entrada(conversa))
+
+    def descarregar(self, user_id=None):
+        """
+        Grava já as alterações pendentes de um usuário, ou de todos.
+
+        Retorna o número de conversas que continuam com alterações pendentes.
+        """
+        with self._lock:
+            if user_id is None:
+                entradas = [e for e in self._entradas.values() if e.suja_desde is not None]
+                entradas += list(self._despejadas.values())
+            else:
+                entrada = self._entradas.get(user_id) or self._despejadas.get(user_id)
+                entradas = [entrada] if entrada is not None and entrada.suja_desde is not None else []
+        pendentes = sum(1 for entrada in entradas if not self._gravar(entrada))
+        if pendentes and user_id is None:
+            logging.error(f"{pendentes} conversas com alterações não gravadas no MongoDB.")
+        return pendentes
+
+    def _limitar(self):
+        # Chamado com self._lock
+        while len(self._entradas) > self.maximo:
+            user_id, entrada = self._entradas.popitem(last=False)
+            if entrada.suja_desde is not None:
+                self._despejadas[user_id] = entrada
+                self._acordar.set()
+
+    def _gravar(self, entrada):
+        conversa = entrada.conversa
+        try:
+            gravado = self.gravar(conversa)
+        except Exception as e:
+            logging.error(f"Erro ao gravar a conversa de {conversa.user_id}: {e}")
+            gravado = False
+        with self._lock:
+            if not gravado:
+                self.estatisticas['falhas'] += 1
+                return False
+            self.estatisticas['gravacoes'] += 1
+            # Mensagens acrescentadas durante a gravação mantêm a entrada suja
+            if conversa.persistidas == len(conversa.messages):
+                entrada.suja_desde = None
+                if self._despejadas.get(conversa.user_id) is entrada:
+                    del self._despejadas[conversa.user_id]
+        return True
+
+    def _iniciar_gravador(self):
+        # Chamado com self._lock. A thread é criada no primeiro uso e recriada
+        # num processo filho (workers pré-fork não herdam as threads do mestre)
+        if self._pid_gravador != os.getpid():
+            self._pid_gravador = os.getpid()
+            threading.Thread(target=self._gravador, daemon=True, name="gravador-conversas").start()
+
+    def _vencidas(self):
+        agora = time.monotonic()
+        with self._lock:
+            for user_id, entrada in list(self._entradas.items()):
+                if agora - entrada.usada_em < self.ocioso_s:
+                    continue
+                del self._entradas[user_id]
+                if entrada.suja_desde is not None:
+                    self._despejadas[user_id] = entrada
+            vencidas = [e for e in self._entradas.values()
+                        if e.suja_desde is not None and agora - e.suja_desde >= self.idade_max_suja_s]
+            return vencidas + list(self._despejadas.values())
+
+    def _gravador(self):
+        while True:
+            self._acordar.wait(self.intervalo_s)
+            self._acordar.clear()
+            for entrada in self._vencidas():
+                self._gravar(entrada)
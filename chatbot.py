@@ -1,112 +1,78 @@
 import os
 import logging
-from tqdm import tqdm
-from langchain.memory import ConversationBufferMemory
-from langchain.schema import AIMessage, HumanMessage
-from groq import Groq
-from langchain_mongodb import MongoDBAtlasVectorSearch
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.embeddings import Embeddings
 from dotenv import load_dotenv
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
 import datetime
-import urllib.parse
-import cohere
-from langchain.embeddings.base import Embeddings
+import random
+import time
 import subprocess
 import sys  # Ensure sys is imported for path operations
+import embeddings_compactos
 
-# Carregar as variáveis de ambiente do arquivo .env
-load_dotenv()
+# groq, cohere, pymongo, tqdm e langchain.memory só são
+# importados quando usados, e a conversa só começa em main()
 
-# Configuração do logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-# Inicialize o cliente Groq com a chave da API
-api_key = os.getenv("GROQ_API_KEY")
-if not api_key:
-    raise ValueError("A chave de API do Groq não foi encontrada. Verifique se está definida no arquivo .env.")
-client = Groq(api_key=api_key)
-
-# Inicializar a chave de API do Cohere
-cohere_api_key = os.getenv("COHERE_API_KEY")
-if not cohere_api_key:
-    raise ValueError("A chave de API do Cohere não foi encontrada. Verifique se está definida no arquivo .env.")
-
-# Criar a classe de embeddings com a API da Cohere
+# Criar a classe de embeddings com a API da Cohere (cliente e chamada de embeddings_compactos)
 class CohereEmbeddings(Embeddings):
-    def __init__(self, api_key, model="embed-english-light-v3.0", input_type="search_query", embedding_types=["float"]):
-        self.client = cohere.ClientV2(api_key)
+    def __init__(self, api_key, model=embeddings_compactos.MODELO_PADRAO):
+        self.client = embeddings_compactos.cliente_cohere(api_key)
         self.model = model
-        self.input_type = input_type
-        self.embedding_types = embedding_types
-    
+
+    def _embed(self, texts, input_type):
+        return embeddings_compactos.embedar(self.client, texts, self.model, input_type)
+
+    # Documentos e consultas usam input_types diferentes nos modelos v3
     def embed_documents(self, texts):
-        response = self.client.embed(
-            texts=texts,
-            model=self.model,
-            input_type=self.input_type,
-            embedding_types=self.embedding_types,
-        )
-        return response.embeddings.float  # Alterado aqui
-    
+        return self._embed(texts, "search_document")
+
     def embed_query(self, text):
-        response = self.client.embed(
-            texts=[text],
-            model=self.model,
-            input_type=self.input_type,
-            embedding_types=self.embedding_types,
+        return self._embed([text], "search_query")[0]
+
+# Clientes criados no primeiro uso
+_clientes = {}
+
+def obter_cliente_groq():
+    if 'groq' not in _clientes:
+        from groq import Groq
+
+        # Inicialize o cliente Groq com a chave da API
+        api_key = os.getenv("GROQ_API_KEY")
+        if not api_key:
+            raise ValueError("A chave de API do Groq não foi encontrada. Verifique se está definida no arquivo .env.")
+        _clientes['groq'] = Groq(api_key=api_key)
+    return _clientes['groq']
+
+def obter_embedding_model():
+    if 'embeddings' not in _clientes:
+        # Inicializar a chave de API do Cohere
+        cohere_api_key = os.getenv("COHERE_API_KEY")
+        if not cohere_api_key:
+            raise ValueError("A chave de API do Cohere não foi encontrada. Verifique se está definida no arquivo .env.")
+        # Mesmo modelo do aplicativo (o da configuração ativa), para que os
+        # vetores do Contexto tenham todos a mesma dimensão
+        _clientes['embeddings'] = CohereEmbeddings(
+            api_key=cohere_api_key,
+            model=obter_configuracao_embeddings()['modelo'],
         )
-        return response.embeddings.float[0]  # Alterado aqui
-
-# Inicialize o modelo de embeddings com o Cohere
-embedding_model = CohereEmbeddings(
-    api_key=cohere_api_key,
-    model="embed-multilingual-light-v3.0",  # Escolha o modelo apropriado
-    input_type="search_query",         # Ajuste conforme necessário
-    embedding_types=["float"]          # Tipos de embeddings desejados
-)
+    return _clientes['embeddings']
 
-# Carregar as credenciais do MongoDB
-MONGODB_USERNAME = os.getenv('MONGODB_USERNAME')
-MONGODB_PASSWORD = os.getenv('MONGODB_PASSWORD')
-
-if not MONGODB_USERNAME or not MONGODB_PASSWORD:
-    raise ValueError("Nome de usuário ou senha do MongoDB não encontrados no arquivo .env.")
-
-# Codificar o nome de usuário e a senha
-username = urllib.parse.quote_plus(MONGODB_USERNAME)
-password = urllib.parse.quote_plus(MONGODB_PASSWORD)
-
-# Nome do host do cluster (substitua pelo seu)
-cluster_host = 'hackathonmeta.pvjrb.mongodb.net'  # Certifique-se de que este é o nome correto do seu cluster
-
-# Montar a string de conexão
-uri = f"mongodb+srv://{username}:{password}@{cluster_host}/?retryWrites=true&w=majority&appName=HackathonMeta&tls=true"
-
-# Criar o cliente MongoDB com ServerApi
-client_mongo = MongoClient(uri, server_api=ServerApi('1'))
-
-# Testar a conexão
-try:
-    client_mongo.admin.command('ping')
-    logging.info("Conexão bem-sucedida com o MongoDB.")
-except Exception as e:
-    logging.error(f"Erro ao conectar ao MongoDB: {e}")
-    raise
-
-# Conexão com o banco de dados e coleções
-db = client_mongo['DadosUsuários']
-collection_contexto = db['Contexto']
-collection_historico = db['HistoricoConversa']
-
-# Inicializa o MongoDB Atlas Vector Search
-vectorstore = MongoDBAtlasVectorSearch(
-    collection=collection_contexto,
-    embedding=embedding_model,
-    index_name='contexto',
-    text_key='content',
-    embedding_key='embedding'
-)
+def obter_db():
+    if 'db' not in _clientes:
+        import conexao_mongo
+
+        # Conexão com o banco de dados (MONGODB_URI substitui as credenciais do Atlas)
+        _clientes['db'] = conexao_mongo.conectar()[conexao_mongo.NOME_BANCO]
+    return _clientes['db']
+
+def obter_colecao(nome):
+    return obter_db()[nome]
+
+def obter_configuracao_embeddings():
+    # Coleção, modelo e formato do Contexto (ver migrar_embeddings.py)
+    if 'configuracao' not in _clientes:
+        _clientes['configuracao'] = embeddings_compactos.configuracao_ativa(obter_db())
+    return _clientes['configuracao']
 
 # Defina o USER_ID (obtenha do sistema de autenticação)
 USER_ID = 'user123'  # Substitua pelo identificador real do usuário
@@ -127,59 +93,90 @@ system_prompt = (
     "Lembre-se: Você não gera as recomendações diretamente, mas coleta informações precisas para que os agentes do Crew AI possam processá-las eficientemente."
 )
 
+# Versão do documento lido e quantas das mensagens já estão gravadas: só as
+# seguintes são acrescentadas, e só se ninguém gravou no meio (o aplicativo.py
+# pode atender o mesmo usuário ao mesmo tempo)
+_historico = {'versao': 0, 'persistidas': 0}
+HISTORICO_TENTATIVAS = int(os.getenv('HISTORICO_TENTATIVAS', 8))
+
+def _mensagens_do_documento(conversa):
+    messages = []
+    for msg in (conversa or {}).get('messages', []):
+        if msg['type'] == 'human':
+            messages.append(HumanMessage(content=msg['content']))
+        elif msg['type'] == 'ai':
+            messages.append(AIMessage(content=msg['content']))
+    return messages
+
 # Função para carregar a memória da conversa
 def carregar_memoria():
     logging.info("Carregando memória da conversa do MongoDB...")
-    conversa = collection_historico.find_one({'user_id': USER_ID})
+    conversa = obter_colecao('HistoricoConversa').find_one({'user_id': USER_ID})
+    messages = _mensagens_do_documento(conversa)
+    # Documentos sem o campo versao contam como versão 0
+    _historico['versao'] = (conversa or {}).get('versao', 0)
+    _historico['persistidas'] = len(messages)
     if conversa and 'messages' in conversa:
-        messages_data = conversa['messages']
-        messages = []
-        for msg in messages_data:
-            if msg['type'] == 'human':
-                messages.append(HumanMessage(content=msg['content']))
-            elif msg['type'] == 'ai':
-                messages.append(AIMessage(content=msg['content']))
         logging.info("Memória carregada com sucesso.")
-        return messages
     else:
         logging.info("Nenhuma memória anterior encontrada para este usuário.")
-        return []
+    return messages
 
 # Função para salvar a memória da conversa
 def salvar_memoria(messages):
-    logging.info("Salvando memória da conversa no MongoDB...")
-    # Converter as mensagens para um formato serializável
-    messages_data = []
-    for msg in messages:
-        if isinstance(msg, HumanMessage):
-            msg_type = 'human'
-        elif isinstance(msg, AIMessage):
-            msg_type = 'ai'
-        else:
-            continue
-        messages_data.append({
-            'type': msg_type,
-            'content': msg.content,
-            'timestamp': datetime.datetime.utcnow()
-        })
-    # Criar o documento a ser inserido
-    conversa = {
-        'user_id': USER_ID,
-        'messages': messages_data,
-        'last_updated': datetime.datetime.utcnow()
-    }
-    # Inserir ou atualizar a conversa no MongoDB
-    collection_historico.update_one(
-        {'user_id': USER_ID},
-        {'$set': conversa},
-        upsert=True
-    )
-    logging.info("Memória da conversa salva no MongoDB.")
+    """
+    Acrescenta ao HistoricoConversa as mensagens adicionadas desde a leitura,
+    com compare-and-set em `versao`, como o aplicativo.py. Num conflito as
+    mensagens gravadas são recarregadas (na própria lista `messages`), as
+    nossas vão depois delas e a gravação é repetida.
+    """
+    from pymongo.errors import DuplicateKeyError
 
-# Carrega a memória da conversa
-messages = carregar_memoria()
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-memory.chat_memory.messages = messages
+    novas = messages[_historico['persistidas']:]
+    if not novas:
+        return True
+    logging.info("Salvando memória da conversa no MongoDB...")
+    colecao = obter_colecao('HistoricoConversa')
+    for tentativa in range(HISTORICO_TENTATIVAS):
+        agora = datetime.datetime.utcnow()
+        # Converter as mensagens novas para um formato serializável
+        messages_data = [
+            {'type': 'human' if isinstance(msg, HumanMessage) else 'ai', 'content': msg.content, 'timestamp': agora}
+            for msg in novas if isinstance(msg, (HumanMessage, AIMessage))
+        ]
+        versao = _historico['versao']
+        # {'versao': None} também encontra documentos sem o campo
+        filtro = {'user_id': USER_ID, 'versao': versao if versao else {'$in': [0, None]}}
+        try:
+            resultado = colecao.update_one(
+                filtro,
+                {'$push': {'messages': {'$each': messages_data}},
+                 '$inc': {'versao': 1},
+                 '$set': {'last_updated': agora}},
+                # Só uma conversa lida vazia pode criar o documento
+                upsert=_historico['persistidas'] == 0,
+            )
+            gravado = resultado.matched_count == 1 or resultado.upserted_id is not None
+        except DuplicateKeyError:
+            gravado = False
+        if gravado:
+            _historico['versao'] = versao + 1
+            _historico['persistidas'] = len(messages)
+            logging.info("Memória da conversa salva no MongoDB.")
+            return True
+
+        logging.info(f"Conversa alterada por outro processo (tentativa {tentativa + 1}); recarregando.")
+        documento = colecao.find_one({'user_id': USER_ID})
+        armazenadas = _mensagens_do_documento(documento)
+        messages[:] = armazenadas + novas
+        _historico['versao'] = (documento or {}).get('versao', 0)
+        _historico['persistidas'] = len(armazenadas)
+        time.sleep(random.uniform(0, 0.02 * 2 ** tentativa))
+    logging.error(f"Memória não salva: conflitos em {HISTORICO_TENTATIVAS} tentativas.")
+    return False
+
+# Memória da conversa, carregada em main()
+memory = None
 
 def gerar_resposta_groq(messages):
     logging.info("Gerando resposta do modelo Groq...")
@@ -193,7 +190,7 @@ def gerar_resposta_groq(messages):
 
     # Chamando a API do Groq
     try:
-        completion = client.chat.completions.create(
+        completion = obter_cliente_groq().chat.completions.create(
             model="llama-3.2-90b-text-preview",
             messages=model_messages,
             temperature=0.7,
@@ -213,10 +210,15 @@ def gerar_resposta_groq(messages):
 # Função para armazenar mensagens no banco vetorial (apenas do usuário)
 def armazenar_mensagem_no_vectorstore(role, content):
     if role == 'user':
+        configuracao = obter_configuracao_embeddings()
         # Cria metadados para a mensagem, incluindo o user_id
-        metadata = {"role": role, "user_id": USER_ID}
-        # Adiciona a mensagem ao vector store
-        vectorstore.add_texts([content], metadatas=[metadata])
+        metadata = {"role": role, "user_id": USER_ID, "criado_em": datetime.datetime.utcnow(),
+                    "modelo_embedding": configuracao['modelo']}
+        # Grava o embedding (no formato configurado) diretamente na coleção ativa
+        vetor = obter_embedding_model().embed_documents([content])[0]
+        documento = {'content': content, **metadata}
+        documento.update(embeddings_compactos.compactar(vetor, configuracao['formato']))
+        obter_colecao(configuracao['colecao']).insert_one(documento)
         logging.info("Mensagem do usuário armazenada no vectorstore.")
     else:
         logging.info("Mensagem do assistente não armazenada no vectorstore.")
@@ -249,7 +251,7 @@ def validar_contexto_suficiente(messages):
 
     # Chama o modelo de IA do Groq
     try:
-        completion = client.chat.completions.create(
+        completion = obter_cliente_groq().chat.completions.create(
             model="llama-3.2-90b-text-preview",
             messages=[{"role": "system", "content": formatted_prompt}],
             temperature=0.0,
@@ -321,7 +323,7 @@ def detectar_intencao_ai(usuario_resposta, contexto):
     )
     
     # Chamando o modelo de IA do Groq
-    response = client.chat.completions.create(
+    response = obter_cliente_groq().chat.completions.create(
         model="llama-3.2-90b-text-preview",
         messages=[{"role": "system", "content": prompt}],
         temperature=0.0,  # Sem variação na resposta
@@ -338,6 +340,8 @@ def detectar_intencao_ai(usuario_resposta, contexto):
 
 
 def iniciar_conversa():
+    from tqdm import tqdm
+
     logging.info("Iniciando a conversa...")
     with tqdm(total=100, desc="Progresso da Conversa") as pbar:
         while True:
@@ -385,11 +389,29 @@ def iniciar_conversa():
 
     logging.info("Conversa encerrada.")
 
-# Inicia o processo de conversa
-iniciar_conversa()
+def main():
+    global memory
+    from langchain.memory import ConversationBufferMemory
+
+    # Carregar as variáveis de ambiente do arquivo .env
+    load_dotenv()
+
+    # Configuração do logging
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # Carrega a memória da conversa
+    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    memory.chat_memory.messages = carregar_memoria()
+
+    # Inicia o processo de conversa
+    iniciar_conversa()
+
+    # Exibe o histórico final da conversa
+    print("\nHistórico Completo:")
+    for i, msg in enumerate(memory.chat_memory.messages):
+        role = "Chatbot" if isinstance(msg, AIMessage) else "Você"
+        print(f"{i + 1}. {role}: {msg.content}")
+
 
-# Exibe o histórico final da conversa
-print("\nHistórico Completo:")
-for i, msg in enumerate(memory.chat_memory.messages):
-    role = "Chatbot" if isinstance(msg, AIMessage) else "Você"
-    print(f"{i + 1}. {role}: {msg.content}")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""
+Chat completions com prazo, requisição de reserva (hedge) e failover entre provedores.
+
+Uma resposta lenta do LLM é um turno lento para o usuário. ClienteCompletions
+envia a requisição ao primeiro provedor e, se ela não responde dentro do
+atraso de hedge (o p95 recente das latências desse provedor para a mesma
+operação), envia uma cópia ao próximo provedor configurado (ou ao mesmo,
+quando há um só) e fica com a primeira resposta bem-sucedida. Um erro do
+provedor (5xx, 408, 429, conexão) leva direto ao próximo (failover); uma
+requisição inválida (os demais 4xx) é repassada a quem chamou na hora. Nada passa do prazo da chamada: cada
+requisição recebe como timeout o tempo que ainda resta.
+
+Cada provedor tem um disjuntor: depois de falhas_para_abrir falhas seguidas
+ele é pulado por pausa_s segundos, e então uma única requisição de teste
+decide se ele volta. As cópias são limitadas a fracao_max_hedges das
+chamadas recentes, para não dobrar a carga quando todo o provedor fica lento.
+"""
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+FECHADO, ABERTO, MEIO_ABERTO = 'fechado', 'aberto', 'meio_aberto'
+
+
+class PrazoEsgotado(TimeoutError):
+    """Nenhum provedor respondeu dentro do prazo da chamada."""
+
+
+class SemProvedorDisponivel(RuntimeError):
+    """Todos os provedores estão com o disjuntor aberto."""
+
+
+class Disjuntor:
+    def __init__(self, falhas_para_abrir=5, pausa_s=30.0):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.pausa_s = pausa_s
+        self.estado = FECHADO
+        self.falhas = 0
+        self._aberto_ate = 0.0
+        self._sondando = False
+        self._lock = threading.Lock()
+
+    def permite(self):
+        """Se uma requisição pode ir ao provedor. Passada a pausa, libera uma só (meio aberto)."""
+        with self._lock:
+            if self.estado == FECHADO:
+                return True
+            if self.estado == ABERTO and time.monotonic() >= self._aberto_ate:
+                self.estado = MEIO_ABERTO
+                self._sondando = False
+            if self.estado == MEIO_ABERTO and not self._sondando:
+                self._sondando = True
+                return True
+            return False
+
+    def sucesso(self):
+        with self._lock:
+            self.estado = FECHADO
+            self.falhas = 0
+            self._sondando = False
+
+    def falha(self):
+        """Registra uma falha; retorna True se ela abriu o disjuntor."""
+        with self._lock:
+            self.falhas += 1
+            if self.estado == MEIO_ABERTO or (self.estado == FECHADO and self.falhas >= self.falhas_para_abrir):
+                self.estado = ABERTO
+                self._aberto_ate = time.monotonic() + self.pausa_s
+                self._sondando = False
+                return True
+            return False
+
+
+class JanelaLatencias:
+    """Últimas latências bem-sucedidas, em segundos."""
+
+    def __init__(self, tamanho=200, minimo=20):
+        self.minimo = minimo
+        self._valores = deque(maxlen=tamanho)
+        self._lock = threading.Lock()
+
+    def registrar(self, segundos):
+        with self._lock:
+            self._valores.append(segundos)
+
+    def percentil(self, p):
+        """Percentil p, ou None com menos de `minimo` amostras."""
+        with self._lock:
+            if len(self._valores) < self.minimo:
+                return None
+            return float(np.percentile(self._valores, p))
+
+
+class Provedor:
+    def __init__(self, nome, obter_cliente, modelo, disjuntor=None):
+        """
+        obter_cliente() retorna um cliente no formato da Groq/OpenAI
+        (cliente.chat.completions.create), sem novas tentativas próprias:
+        o ClienteCompletions já decide quando repetir.
+        """
+        self.nome = nome
+        self.obter_cliente = obter_cliente
+        self.modelo = modelo
+        self.disjuntor = disjuntor or Disjuntor()
+        self.latencias = {}
+        self._lock = threading.Lock()
+
+    def janela(self, operacao):
+        with self._lock:
+            return self.latencias.setdefault(operacao, JanelaLatencias())
+
+    def chamar(self, mensagens, timeout, parametros):
+        return self.obter_cliente().chat.completions.create(
+            model=self.modelo, messages=mensagens, timeout=timeout, **parametros
+        )
+
+    def __repr__(self):
+        return f"Provedor({self.nome!r}, {self.modelo!r})"
+
+
+def _falha_do_provedor(erro):
+    # Requisições inválidas (4xx) não dizem nada sobre a saúde do provedor,
+    # exceto timeout de requisição (408) e limite de taxa (429)
+    status = getattr(erro, 'status_code', None)
+    return not (status is not None and 400 <= status < 500 and status not in (408, 429))
+
+
+class ClienteCompletions:
+    def __init__(self, provedores, prazo_s=20.0, atraso_hedge_s=None, percentil_hedge=95,
+                 atraso_inicial_s=2.0, atraso_minimo_s=0.05, fracao_max_hedges=0.1, max_threads=32):
+        """
+        provedores: em ordem de preferência. atraso_hedge_s fixa o atraso da
+        cópia; sem ele, é o percentil_hedge das latências recentes do
+        provedor (atraso_inicial_s enquanto há poucas amostras).
+        fracao_max_hedges=0 desliga as cópias (o failover continua).
+        """
+        if not provedores:
+            raise ValueError("Informe ao menos um provedor.")
+        self.provedores = list(provedores)
+        self.prazo_s = prazo_s
+        self.atraso_hedge_s = atraso_hedge_s
+        self.percentil_hedge = percentil_hedge
+        self.atraso_inicial_s = atraso_inicial_s
+        self.atraso_minimo_s = atraso_minimo_s
+        self.fracao_max_hedges = fracao_max_hedges
+        self._executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='completions')
+        self._hedges_recentes = deque(maxlen=100)
+        self._lock = threading.Lock()
+        self.estatisticas = {'chamadas': 0, 'hedges': 0, 'vitorias_hedge': 0, 'failovers': 0,
+                             'falhas': 0, 'prazos_esgotados': 0, 'sem_provedor': 0}
+
+    def _contar(self, chave):
+        with self._lock:
+            self.estatisticas[chave] += 1
+
+    def atraso_hedge(self, provedor, operacao):
+        if self.atraso_hedge_s is not None:
+            return self.atraso_hedge_s
+        percentil = provedor.janela(operacao).percentil(self.percentil_hedge)
+        if percentil is None:
+            return self.atraso_inicial_s
+        return max(percentil, self.atraso_minimo_s)
+
+    def _pode_fazer_hedge(self):
+        with self._lock:
+            if self.fracao_max_hedges <= 0:
+                return False
+            if not self._hedges_recentes:
+                return True
+            return sum(self._hedges_recentes) / len(self._hedges_recentes) < self.fracao_max_hedges
+
+    def _executar(self, provedor, operacao, mensagens, timeout, parametros):
+        inicio = time.perf_counter()
+        try:
+            resposta = provedor.chamar(mensagens, timeout, parametros)
+        except Exception as e:
+            if not _falha_do_provedor(e):
+                provedor.disjuntor.sucesso()  # o provedor respondeu
+            elif provedor.disjuntor.falha():
+                logging.warning(f"Disjuntor de {provedor.nome} aberto por {provedor.disjuntor.pausa_s:.0f}s "
+                                f"após {provedor.disjuntor.falhas} falhas: {e}")
+            raise
+        provedor.disjuntor.sucesso()
+        provedor.janela(operacao).registrar(time.perf_counter() - inicio)
+        return resposta
+
+    def completar(self, mensagens, operacao='completar', prazo_s=None, **parametros):
+        """
+        Resposta do primeiro provedor que completar as mensagens dentro do
+        prazo. operacao separa as latências de chamadas de tamanhos diferentes
+        (uma resposta longa e uma classificação de uma palavra).
+        """
+        self._contar('chamadas')
+        prazo_s = prazo_s or self.prazo_s
+        limite = time.monotonic() + prazo_s
+        restantes = list(self.provedores)
+        pendentes = {}
+        primeiro = None
+        repetiu_primeiro = False
+
+        def lancar(hedge):
+            nonlocal primeiro, repetiu_primeiro
+            escolhido = None
+            while restantes and escolhido is None:
+                provedor = restantes.pop(0)
+                if provedor.disjuntor.permite():
+                    escolhido = provedor
+            # Sem outro provedor, a cópia ou a nova tentativa vai ao primeiro (uma vez)
+            if escolhido is None and primeiro is not None and not repetiu_primeiro and primeiro.disjuntor.permite():
+                escolhido, repetiu_primeiro = primeiro, True
+            if escolhido is None:
+                return False
+            timeout = max(limite - time.monotonic(), 0.001)
+            futuro = self._executor.submit(self._executar, escolhido, operacao, mensagens, timeout, parametros)
+            pendentes[futuro] = (escolhido, hedge)
+            primeiro = primeiro or escolhido
+            return True
+
+        if not lancar(False):
+            self._contar('sem_provedor')
+            raise SemProvedorDisponivel("Todos os provedores de LLM estão com o disjuntor aberto.")
+        atraso = self.atraso_hedge(primeiro, operacao)
+        hedge_em = time.monotonic() + atraso
+        hedge_decidido = enviou_hedge = False
+        ultimo_erro = None
+        try:
+            while pendentes:
+                agora = time.monotonic()
+                if agora >= limite:
+                    break
+                espera = limite - agora
+                if not hedge_decidido:
+                    espera = min(espera, max(hedge_em - agora, 0.0))
+                feitos, _ = wait(list(pendentes), timeout=espera, return_when=FIRST_COMPLETED)
+                for futuro in feitos:
+                    provedor, hedge = pendentes.pop(futuro)
+                    try:
+                        resposta = futuro.result()
+                    except Exception as e:
+                        if not _falha_do_provedor(e):
+                            # Requisição inválida: outro provedor recusaria do mesmo jeito
+                            self._contar('falhas')
+                            raise
+                        ultimo_erro = e
+                        logging.warning(f"Falha em {provedor.nome} ({operacao}): {e}")
+                        if not pendentes and lancar(False):
+                            self._contar('failovers')
+                            hedge_em = time.monotonic() + atraso
+                        continue
+                    if hedge:
+                        self._contar('vitorias_hedge')
+                    return resposta
+                if not hedge_decidido and pendentes and time.monotonic() >= hedge_em:
+                    hedge_decidido = True
+                    if self._pode_fazer_hedge() and lancar(True):
+                        enviou_hedge = True
+                        self._contar('hedges')
+                        logging.info(f"Sem resposta de {primeiro.nome} em {atraso:.2f}s ({operacao}); enviando cópia.")
+        finally:
+            with self._lock:
+                self._hedges_recentes.append(enviou_hedge)
+        if pendentes:
+            self._contar('prazos_esgotados')
+            raise PrazoEsgotado(f"Nenhum provedor de LLM respondeu em {prazo_s:.1f}s ({operacao}).")
+        self._contar('falhas')
+        raise ultimo_erro
@@ -0,0 +1,47 @@
+import os
+import logging
+import urllib.parse
+from pymongo.mongo_client import MongoClient
+from pymongo.server_api import ServerApi
+
+# Nome do host do cluster e do banco de dados usados pelo projeto
+CLUSTER_HOST = 'hackathonmeta.pvjrb.mongodb.net'
+NOME_BANCO = 'DadosUsuários'
+
+
+def montar_uri():
+    """
+    Monta a string de conexão do MongoDB.
+
+    Se MONGODB_URI estiver definida ela é usada diretamente (outro cluster,
+    banco local, benchmarks); caso contrário a URI do Atlas é montada a
+    partir de MONGODB_USERNAME e MONGODB_PASSWORD.
+    """
+    uri = os.getenv('MONGODB_URI')
+    if uri:
+        return uri
+
+    MONGODB_USERNAME = os.getenv('MONGODB_USERNAME')
+    MONGODB_PASSWORD = os.getenv('MONGODB_PASSWORD')
+
+    if not MONGODB_USERNAME or not MONGODB_PASSWORD:
+        raise ValueError("Nome de usuário ou senha do MongoDB não encontrados no arquivo .env.")
+
+    username = urllib.parse.quote_plus(MONGODB_USERNAME)
+    password = urllib.parse.quote_plus(MONGODB_PASSWORD)
+
+    return f"mongodb+srv://{username}:{password}@{CLUSTER_HOST}/?retryWrites=true&w=majority&appName=HackathonMeta&tls=true"
+
+
+def conectar():
+    """
+    Cria o cliente MongoDB e testa a conexão com um ping.
+    """
+    client_mongo = MongoClient(montar_uri(), server_api=ServerApi('1'))
+    try:
+        client_mongo.admin.command('ping')
+        logging.info("Conexão bem-sucedida com o MongoDB.")
+    except Exception as e:
+        logging.error(f"Erro ao conectar ao MongoDB: {e}")
+        raise
+    return client_mongo
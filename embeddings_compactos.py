@@ -0,0 +1,219 @@
+"""
+Armazenamento compacto dos embeddings da coleção Contexto.
+
+Em vez da lista de floats (8 bytes por dimensão em BSON, mais a chave de cada
+elemento), o vetor pode ser gravado como binário BSON:
+
+- int8: quantização escalar simétrica por vetor, gravada como vetor BSON
+  (subtipo 9), formato que o Atlas Vector Search indexa diretamente. Como a
+  escala é por vetor, a similaridade de cosseno não depende dela;
+- float16: meia precisão, 2 bytes por dimensão.
+
+A busca pontua contra a forma compacta e pode reordenar os melhores candidatos
+com embeddings em precisão total.
+
+A coleção, o modelo e o formato em uso ficam num documento de configuração
+(Configuracao/embeddings_contexto), trocado por migrar_embeddings.py ao fim de
+uma migração de modelo.
+"""
+import os
+import re
+import logging
+import numpy as np
+
+FORMATOS = ('float', 'int8', 'float16')
+# Subtipo BSON dos vetores binários (int8, float32, bits)
+SUBTIPO_VETOR = 9
+
+# Documento com a versão ativa dos embeddings do Contexto
+COLECAO_CONFIGURACAO = 'Configuracao'
+ID_CONFIGURACAO = 'embeddings_contexto'
+MODELO_PADRAO = 'embed-multilingual-v2.0'
+
+
+def formato_configurado():
+    """
+    Formato definido em CONTEXTO_EMBEDDING_FORMATO ('float' por padrão).
+    """
+    formato = os.getenv('CONTEXTO_EMBEDDING_FORMATO', 'float').lower()
+    if formato not in FORMATOS:
+        raise ValueError(f"CONTEXTO_EMBEDDING_FORMATO inválido: {formato}. Use um de {FORMATOS}.")
+    return formato
+
+
+def configuracao_ativa(db):
+    """
+    Coleção, modelo, formato e índice vetorial em uso pelo Contexto.
+
+    Sem documento de configuração (nenhuma migração feita), vale a coleção
+    Contexto com o modelo padrão e o formato de CONTEXTO_EMBEDDING_FORMATO.
+    """
+    documento = db[COLECAO_CONFIGURACAO].find_one({'_id': ID_CONFIGURACAO}) or {}
+    return {
+        'versao': documento.get('versao'),
+        'colecao': documento.get('colecao', 'Contexto'),
+        'modelo': documento.get('modelo', MODELO_PADRAO),
+        'formato': documento.get('formato') or formato_configurado(),
+        'indice': documento.get('indice', 'contexto'),
+    }
+
+
+def exige_input_type(modelo):
+    """
+    Modelos Cohere v3 em diante embedam documentos e consultas de formas
+    diferentes (input_type search_document / search_query).
+    """
+    versao = re.search(r'v(\d+)', modelo)
+    return versao is None or int(versao.group(1)) >= 3
+
+
+def cliente_cohere(api_key=None):
+    """
+    Cliente da Cohere dos embedders do projeto (aplicativo.py, chatbot.py,
+    migrar_embeddings.py e o crew), com a chave de COHERE_API_KEY. A API v1
+    (cohere.Client) atende os modelos v2, que não aceitam input_type, e os v3
+    em diante; é também a que os cassetes gravam.
+    """
+    import cohere
+
+    api_key = api_key or os.getenv("COHERE_API_KEY")
+    if not api_key:
+        raise ValueError("A chave de API do Cohere não foi encontrada. Verifique se está definida no arquivo .env.")
+    return cohere.Client(api_key)
+
+
+def embedar(cliente, textos, modelo, input_type, truncate='END'):
+    """
+    Embeddings (listas de floats) dos textos. input_type (search_document ou
+    search_query) só é enviado aos modelos que o usam.
+    """
+    extra = {'input_type': input_type} if exige_input_type(modelo) else {}
+    return cliente.embed(texts=textos, model=modelo, truncate=truncate, **extra).embeddings
+
+
+def compactar(vetor, formato):
+    """
+    Campos a gravar no documento para um embedding no formato pedido.
+    """
+    if formato == 'float':
+        return {'embedding': [float(v) for v in vetor]}
+
+    # bson (do pymongo) só é importado quando há algo compacto a gravar
+    from bson.binary import Binary
+
+    array = np.asarray(vetor, dtype=np.float32)
+    if formato == 'int8':
+        try:
+            from bson.binary import BinaryVectorDtype
+        except ImportError:  # pymongo < 4.10 não tem vetores BSON
+            BinaryVectorDtype = None
+        maximo = float(np.max(np.abs(array))) or 1.0
+        escala = maximo / 127.0
+        quantizado = np.clip(np.rint(array / escala), -127, 127).astype(np.int8)
+        if BinaryVectorDtype is not None:
+            binario = Binary.from_vector(quantizado.tolist(), BinaryVectorDtype.INT8)
+        else:
+            binario = Binary(quantizado.tobytes())
+        return {
+            'embedding_q': binario,
+            'embedding_escala': escala,
+            'embedding_formato': 'int8',
+        }
+    if formato == 'float16':
+        return {
+            'embedding_q': Binary(array.astype('<f2').tobytes()),
+            'embedding_formato': 'float16',
+        }
+    raise ValueError(f"Formato de embedding desconhecido: {formato}")
+
+
+def descompactar(documento):
+    """
+    Embedding do documento como array float32, em qualquer um dos formatos.
+    """
+    if 'embedding_q' not in documento:
+        return np.asarray(documento['embedding'], dtype=np.float32)
+
+    binario = documento['embedding_q']
+    formato = documento.get('embedding_formato', 'int8')
+    if formato == 'float16':
+        return np.frombuffer(bytes(binario), dtype='<f2').astype(np.float32)
+    # Vetores BSON têm dois bytes de cabeçalho (dtype e padding)
+    deslocamento = 2 if getattr(binario, 'subtype', 0) == SUBTIPO_VETOR else 0
+    quantizado = np.frombuffer(bytes(binario), dtype=np.int8, offset=deslocamento)
+    return quantizado.astype(np.float32) * documento.get('embedding_escala', 1.0)
+
+
+def similaridades_cosseno(consulta, matriz):
+    """
+    Cosseno entre a consulta (D,) e cada linha da matriz (N, D), vetorizado.
+    """
+    consulta = np.asarray(consulta, dtype=np.float32)
+    normas = np.linalg.norm(matriz, axis=1) * (np.linalg.norm(consulta) or 1.0)
+    normas[normas == 0] = 1.0
+    return (matriz @ consulta) / normas
+
+
+def buscar(colecao, vetor_consulta, user_id, k=5, embedding_model=None, candidatos=20):
+    """
+    Mensagens do usuário mais similares à consulta.
+
+    Pontua contra a forma armazenada (compacta ou não). Se embedding_model
+    for informado, os `candidatos` melhores são reembedados em precisão total
+    numa única chamada e reordenados pelo cosseno exato.
+
+    Retorna uma lista de (documento, score) sem os campos de embedding.
+    """
+    cursor = colecao.find(
+        {'user_id': user_id},
+        {'content': 1, 'embedding': 1, 'embedding_q': 1, 'embedding_escala': 1, 'embedding_formato': 1},
+    )
+    documentos, vetores = [], []
+    for documento in cursor:
+        if 'embedding_q' not in documento and 'embedding' not in documento:
+            continue
+        vetores.append(descompactar(documento))
+        documentos.append({'_id': documento['_id'], 'content': documento.get('content', '')})
+    if not documentos:
+        return []
+
+    dimensao = len(vetor_consulta)
+    # Vetores de outro modelo (outra dimensão) não são comparáveis com a consulta
+    validos = [i for i, v in enumerate(vetores) if v.shape[0] == dimensao]
+    if not validos:
+        logging.warning(f"Nenhum embedding do usuário {user_id} tem dimensão {dimensao}.")
+        return []
+    matriz = np.vstack([vetores[i] for i in validos])
+    scores = similaridades_cosseno(vetor_consulta, matriz)
+
+    limite = max(k, candidatos) if embedding_model is not None else k
+    ordem = np.argsort(-scores)[:limite]
+    melhores = [(documentos[validos[i]], float(scores[i])) for i in ordem]
+
+    if embedding_model is not None and melhores:
+        precisos = np.asarray(embedding_model.embed_documents([d['content'] for d, _ in melhores]), dtype=np.float32)
+        exatos = similaridades_cosseno(vetor_consulta, precisos)
+        melhores = sorted(
+            ((d, float(s)) for (d, _), s in zip(melhores, exatos)),
+            key=lambda par: par[1],
+            reverse=True,
+        )
+    return melhores[:k]
+
+
+def definicao_indice_vetorial(formato, dimensoes):
+    """
+    Definição do índice do Atlas Vector Search para o formato de armazenamento.
+
+    float16 não é indexável pelo Atlas; nesse formato a busca é sempre feita
+    por buscar(), filtrando por user_id.
+    """
+    caminho = 'embedding' if formato == 'float' else 'embedding_q'
+    if formato == 'float16':
+        return None
+    return {
+        'fields': [
+            {'type': 'vector', 'path': caminho, 'numDimensions': dimensoes, 'similarity': 'cosine'},
+            {'type': 'filter', 'path': 'user_id'},
+        ]
+    }
@@ -0,0 +1,332 @@
+"""
+Exportação incremental das coleções para análise.
+
+Lê HistoricoConversa, Contexto e Oportunidades em lotes de cursor (de um
+secundário/nó de analytics quando houver) e grava arquivos comprimidos
+particionados por data:
+
+    <saida>/<colecao>/dt=AAAA-MM-DD/part-<execucao>-00001.jsonl.zst
+
+O consumo de memória não depende do tamanho das coleções: HistoricoConversa é
+exportado com uma linha por mensagem ($unwind no servidor) em vez do array
+inteiro. Cada execução continua da marca d'água gravada em <saida>/_estado.json
+(last_updated para HistoricoConversa, _id para as demais). Conversas alteradas
+são exportadas de novo por inteiro; a chave (user_id, indice) identifica a
+versão mais recente de cada mensagem.
+
+    python exportar.py --saida exportacoes --colecao HistoricoConversa --colecao Contexto
+    python exportar.py --saida exportacoes --formato parquet --com-embeddings
+"""
+import os
+import sys
+import json
+import gzip
+import base64
+import logging
+import argparse
+import datetime
+from dotenv import load_dotenv
+from bson import ObjectId
+from bson.binary import Binary
+from pymongo import ReadPreference
+from pymongo.read_preferences import SecondaryPreferred
+
+import conexao_mongo
+import embeddings_compactos
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Campo usado como marca d'água de cada coleção
+MARCAS_DAGUA = {
+    'HistoricoConversa': 'last_updated',
+    'Contexto': '_id',
+    'Oportunidades': '_id',
+}
+ARQUIVO_ESTADO = '_estado.json'
+
+
+def _valor_json(valor):
+    if isinstance(valor, datetime.datetime):
+        return valor.isoformat()
+    if isinstance(valor, ObjectId):
+        return str(valor)
+    if isinstance(valor, (bytes, Binary)):
+        return base64.b64encode(bytes(valor)).decode('ascii')
+    raise TypeError(f"Tipo não serializável: {type(valor)}")
+
+
+def _particao(valor):
+    if isinstance(valor, ObjectId):
+        valor = valor.generation_time
+    if isinstance(valor, datetime.datetime):
+        return valor.strftime('%Y-%m-%d')
+    return 'sem-data'
+
+
+class EscritorParticionado:
+    """
+    Escreve linhas em arquivos comprimidos por partição, trocando de arquivo a
+    cada `linhas_por_arquivo`. Cada arquivo é escrito com nome temporário e
+    renomeado ao ser fechado, então só arquivos completos ficam visíveis.
+    """
+
+    def __init__(self, diretorio, execucao, formato, linhas_por_arquivo, esquema=None):
+        self.diretorio = diretorio
+        self.execucao = execucao
+        self.formato = formato
+        self.linhas_por_arquivo = linhas_por_arquivo
+        self.esquema = esquema
+        self.sequencia = 0
+        self.atual = None
+        self.linhas = 0
+        self.buffer = []
+        self.arquivos = []
+
+    def _extensao(self):
+        if self.formato == 'parquet':
+            return '.parquet'
+        return '.jsonl.zst' if zstandard is not None else '.jsonl.gz'
+
+    def _abrir(self, particao):
+        self.sequencia += 1
+        pasta = os.path.join(self.diretorio, f"dt={particao}")
+        os.makedirs(pasta, exist_ok=True)
+        final = os.path.join(pasta, f"part-{self.execucao}-{self.sequencia:05d}{self._extensao()}")
+        temporario = final + '.tmp'
+        if self.formato == 'parquet':
+            escritor = pyarrow.parquet.ParquetWriter(temporario, self.esquema, compression='zstd')
+            bruto = None
+        else:
+            bruto = open(temporario, 'wb')
+            if zstandard is not None:
+                escritor = zstandard.ZstdCompressor(level=6).stream_writer(bruto)
+            else:
+                escritor = gzip.GzipFile(fileobj=bruto, mode='wb')
+        self.atual = {'particao': particao, 'final': final, 'temporario': temporario, 'escritor': escritor, 'bruto': bruto}
+        self.linhas = 0
+
+    def _descarregar(self):
+        if self.buffer and self.formato == 'parquet':
+            tabela = pyarrow.Table.from_pylist(self.buffer, schema=self.esquema)
+            self.atual['escritor'].write_table(tabela)
+        self.buffer = []
+
+    def fechar(self):
+        if self.atual is None:
+            return
+        self._descarregar()
+        self.atual['escritor'].close()
+        if self.atual['bruto'] is not None and not self.atual['bruto'].closed:
+            self.atual['bruto'].close()
+        os.replace(self.atual['temporario'], self.atual['final'])
+        self.arquivos.append(self.atual['final'])
+        self.atual = None
+
+    def pode_trocar(self):
+        return self.atual is not None and self.linhas >= self.linhas_por_arquivo
+
+    def escrever(self, linha, particao):
+        if self.atual is not None and self.atual['particao'] != particao:
+            self.fechar()
+        if self.atual is None:
+            self._abrir(particao)
+        if self.formato == 'parquet':
+            self.buffer.append(linha)
+            if len(self.buffer) >= 1000:
+                self._descarregar()
+        else:
+            dados = json.dumps(linha, ensure_ascii=False, default=_valor_json) + '\n'
+            self.atual['escritor'].write(dados.encode('utf-8'))
+        self.linhas += 1
+
+
+def _embedding_binario(documento, formato):
+    if 'embedding' not in documento and 'embedding_q' not in documento:
+        return None, None
+    vetor = embeddings_compactos.descompactar(documento).astype('<f4')
+    dados = vetor.tobytes()
+    if formato != 'parquet':
+        dados = base64.b64encode(dados).decode('ascii')
+    return dados, int(vetor.shape[0])
+
+
+def linhas_historico(colecao, marca, lote):
+    filtro = {'last_updated': {'$gt': marca}} if marca is not None else {}
+    pipeline = [
+        {'$match': filtro},
+        {'$sort': {'last_updated': 1}},
+        {'$project': {'_id': 0, 'user_id': 1, 'last_updated': 1, 'messages': 1}},
+        {'$unwind': {'path': '$messages', 'includeArrayIndex': 'indice'}},
+    ]
+    for doc in colecao.aggregate(pipeline, batchSize=lote, allowDiskUse=True):
+        mensagem = doc['messages']
+        linha = {
+            'user_id': doc.get('user_id'),
+            'indice': int(doc['indice']),
+            'type': mensagem.get('type'),
+            'content': mensagem.get('content'),
+            'timestamp': mensagem.get('timestamp'),
+            'last_updated': doc.get('last_updated'),
+        }
+        yield linha, doc.get('last_updated')
+
+
+def linhas_contexto(colecao, marca, lote, com_embeddings, formato):
+    filtro = {'_id': {'$gt': marca}} if marca is not None else {}
+    projecao = None if com_embeddings else {'embedding': 0, 'embedding_q': 0}
+    for doc in colecao.find(filtro, projecao, batch_size=lote).sort('_id', 1):
+        linha = {
+            '_id': str(doc['_id']),
+            'user_id': doc.get('user_id'),
+            'role': doc.get('role'),
+            'content': doc.get('content'),
+            'criado_em': doc.get('criado_em') or doc['_id'].generation_time.replace(tzinfo=None),
+        }
+        if com_embeddings:
+            linha['embedding'], linha['embedding_dim'] = _embedding_binario(doc, formato)
+        yield linha, doc['_id']
+
+
+def linhas_oportunidades(colecao, marca, lote):
+    filtro = {'_id': {'$gt': marca}} if marca is not None else {}
+    for doc in colecao.find(filtro, batch_size=lote).sort('_id', 1):
+        linha = {k: v for k, v in doc.items() if k != '_id'}
+        linha['_id'] = str(doc['_id'])
+        yield linha, doc['_id']
+
+
+def esquema_parquet(colecao, com_embeddings):
+    if pyarrow is None:
+        return None
+    texto, data = pyarrow.string(), pyarrow.timestamp('ms')
+    if colecao == 'HistoricoConversa':
+        campos = [('user_id', texto), ('indice', pyarrow.int32()), ('type', texto), ('content', texto),
+                  ('timestamp', data), ('last_updated', data)]
+    elif colecao == 'Contexto':
+        campos = [('_id', texto), ('user_id', texto), ('role', texto), ('content', texto), ('criado_em', data)]
+        if com_embeddings:
+            campos += [('embedding', pyarrow.binary()), ('embedding_dim', pyarrow.int32())]
+    else:
+        campos = [('_id', texto), ('user_id', texto), ('titulo', texto), ('descricao', texto), ('link', texto)]
+    return pyarrow.schema(campos)
+
+
+def carregar_estado(saida):
+    caminho = os.path.join(saida, ARQUIVO_ESTADO)
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def salvar_estado(saida, estado):
+    caminho = os.path.join(saida, ARQUIVO_ESTADO)
+    with open(caminho + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(estado, f, indent=2)
+    os.replace(caminho + '.tmp', caminho)
+
+
+def _marca_para_json(valor):
+    if isinstance(valor, ObjectId):
+        return {'oid': str(valor)}
+    return {'data': valor.isoformat()}
+
+
+def _marca_de_json(valor):
+    if valor is None:
+        return None
+    if 'oid' in valor:
+        return ObjectId(valor['oid'])
+    return datetime.datetime.fromisoformat(valor['data'])
+
+
+def exportar_colecao(db, nome, args, estado, execucao):
+    campo = MARCAS_DAGUA[nome]
+    marca = _marca_de_json(estado.get(nome))
+    # Contexto é lido da coleção ativa, que muda após uma migração de embeddings (mesmos _ids)
+    origem = embeddings_compactos.configuracao_ativa(db)['colecao'] if nome == 'Contexto' else nome
+    colecao = db.get_collection(origem, read_preference=args.read_preference)
+    if nome == 'HistoricoConversa':
+        linhas = linhas_historico(colecao, marca, args.lote)
+    elif nome == 'Contexto':
+        linhas = linhas_contexto(colecao, marca, args.lote, args.com_embeddings, args.formato)
+    else:
+        linhas = linhas_oportunidades(colecao, marca, args.lote)
+
+    escritor = EscritorParticionado(
+        os.path.join(args.saida, nome), execucao, args.formato, args.linhas_por_arquivo,
+        esquema_parquet(nome, args.com_embeddings),
+    )
+    total, ultima = 0, None
+    for linha, valor_marca in linhas:
+        # Só troca de arquivo quando a marca d'água muda, para nunca dividir
+        # entre arquivos documentos com a mesma marca
+        if escritor.pode_trocar() and valor_marca != ultima:
+            escritor.fechar()
+            estado[nome] = _marca_para_json(ultima)
+            salvar_estado(args.saida, estado)
+        escritor.escrever(linha, _particao(valor_marca))
+        ultima = valor_marca
+        total += 1
+        if total % 10000 == 0:
+            logging.info(f"{nome}: {total} linhas exportadas...")
+    escritor.fechar()
+    if ultima is not None:
+        estado[nome] = _marca_para_json(ultima)
+        salvar_estado(args.saida, estado)
+    logging.info(f"{nome}: {total} linhas em {len(escritor.arquivos)} arquivo(s), marca d'água {campo}={ultima}.")
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exportação incremental e comprimida para análise.")
+    parser.add_argument('--saida', required=True, help="Diretório de destino.")
+    parser.add_argument('--colecao', action='append', choices=list(MARCAS_DAGUA),
+                        help="Coleções a exportar (padrão: todas).")
+    parser.add_argument('--formato', choices=('jsonl', 'parquet'), default='jsonl')
+    parser.add_argument('--com-embeddings', action='store_true', help="Inclui os embeddings do Contexto como float32 binário.")
+    parser.add_argument('--lote', type=int, default=1000, help="Tamanho do lote do cursor.")
+    parser.add_argument('--linhas-por-arquivo', type=int, default=500000)
+    parser.add_argument('--tags-leitura', default='nodeType:ANALYTICS',
+                        help="Tags de leitura preferidas (vazio para qualquer secundário).")
+    parser.add_argument('--primario', action='store_true', help="Lê do primário (não recomendado).")
+    parser.add_argument('--reiniciar', action='store_true', help="Ignora a marca d'água e exporta tudo.")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.formato == 'parquet' and pyarrow is None:
+        parser.error("O formato parquet requer o pacote pyarrow.")
+    if args.formato == 'jsonl' and zstandard is None:
+        logging.warning("Pacote zstandard não encontrado; usando gzip.")
+
+    if args.primario:
+        args.read_preference = ReadPreference.PRIMARY
+    elif args.tags_leitura:
+        tags = dict(par.split(':', 1) for par in args.tags_leitura.split(','))
+        # Prefere os nós de analytics e cai para qualquer secundário
+        args.read_preference = SecondaryPreferred(tag_sets=[tags, {}])
+    else:
+        args.read_preference = ReadPreference.SECONDARY_PREFERRED
+
+    os.makedirs(args.saida, exist_ok=True)
+    estado = {} if args.reiniciar else carregar_estado(args.saida)
+    execucao = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+    db = conexao_mongo.conectar()[conexao_mongo.NOME_BANCO]
+
+    for nome in args.colecao or list(MARCAS_DAGUA):
+        exportar_colecao(db, nome, args, estado, execucao)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
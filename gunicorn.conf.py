@@ -0,0 +1,81 @@
+"""
+Configuração do gunicorn para servir a API em produção.
+
+    pip install gunicorn
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+O app é importado uma vez no processo mestre (preload_app), e os workers são
+criados por fork, compartilhando o código já carregado. Os clientes externos
+só são criados em cada worker, depois do fork, e as conexões são abertas antes
+de o worker aceitar requisições (post_worker_init). Ao sair, o worker grava as
+conversas com alterações pendentes no cache (worker_exit).
+
+kill -HUP <pid do mestre> troca os workers sem derrubar conexões: novos
+workers sobem e aquecem, e os antigos terminam as requisições em andamento
+(até GUNICORN_GRACEFUL_TIMEOUT segundos) antes de sair. Como o app é
+carregado no mestre, código novo exige kill -USR2 (sobe um novo mestre) e
+depois kill -QUIT no mestre antigo.
+
+Variáveis de ambiente:
+    GUNICORN_BIND               endereço (padrão 0.0.0.0:8000)
+    WEB_CONCURRENCY             número de workers (padrão: número de CPUs)
+    GUNICORN_THREADS            threads por worker (padrão 8; as chamadas ao LLM são I/O)
+    GUNICORN_TIMEOUT            segundos até um worker travado ser reiniciado (padrão 300,
+                                /mensagem pode esperar o crew terminar)
+    GUNICORN_GRACEFUL_TIMEOUT   espera pelas requisições em andamento ao parar (padrão 60)
+    GUNICORN_KEEPALIVE          segundos de keep-alive (padrão 5)
+    GUNICORN_MAX_REQUESTS       reinicia o worker após N requisições (padrão 0, desligado)
+    APP_MODULO                  aplicativo (padrão) ou app__
+    AQUECER_APIS                0 para não chamar Groq/Cohere no aquecimento
+"""
+import os
+import multiprocessing
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 300))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 60))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+preload_app = True
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOGLEVEL', 'info')
+
+
+def post_fork(server, worker):
+    # Nada criado no mestre pode ser usado pelo worker (MongoClient não é fork-safe)
+    import wsgi
+
+    wsgi.descartar_clientes()
+
+
+def post_worker_init(worker):
+    # Roda antes de o worker começar a aceitar conexões
+    import wsgi
+
+    try:
+        wsgi.aquecer()
+    except Exception as e:
+        # Sem aquecimento o worker ainda atende; os clientes são criados na primeira requisição
+        worker.log.error(f"Falha ao aquecer o worker {worker.pid}: {e}")
+
+
+def on_reload(server):
+    server.log.info("Recarregando: novos workers sobem antes de os antigos saírem.")
+
+
+def worker_int(worker):
+    worker.log.info(f"Worker {worker.pid} encerrando após as requisições em andamento.")
+
+
+def worker_exit(server, worker):
+    import wsgi
+
+    try:
+        wsgi.encerrar()
+    except Exception as e:
+        worker.log.error(f"Falha ao gravar as conversas pendentes do worker {worker.pid}: {e}")
@@ -0,0 +1,266 @@
+"""
+Ferramentas de manutenção do banco de dados.
+
+    python manutencao.py ttl                          # aplica as políticas de retenção (índices TTL)
+    python manutencao.py purgar-usuario --user-id X   # remove um usuário de todas as coleções
+    python manutencao.py limpar --colecao Contexto --mais-antigos-que-dias 90
+    python manutencao.py compactar --colecao Contexto
+    python manutencao.py palavras --colecao Contexto  # preenche as palavras da busca híbrida
+
+As remoções são feitas em lotes pequenos por _id, com pausa entre os lotes,
+para não sobrecarregar o cluster. --dry-run apenas conta o que seria removido.
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import datetime
+from dotenv import load_dotenv
+from tqdm import tqdm
+from pymongo.errors import OperationFailure
+
+import conexao_mongo
+import busca_hibrida
+
+# Política de retenção: coleção -> (campo de data, dias até expirar)
+POLITICAS_RETENCAO = {
+    'HistoricoConversa': ('last_updated', 365),
+    'Contexto': ('criado_em', 365),
+    'ContextoConsolidado': ('assembled_at', 30),
+    # O índice TTL também serve à ordenação por visto_em do catálogo
+    'CatalogoOportunidades': ('visto_em', 180),
+    # Checkpoints só servem para retomar execuções recentes do crew
+    'CrewCheckpoints': ('atualizada_em', 7),
+    'CrewRuns': ('inicio', 180),
+}
+
+# Coleções com dados por usuário -> campo que guarda o user_id
+COLECOES_USUARIO = {
+    'Contexto': 'user_id',
+    'HistoricoConversa': 'user_id',
+    'Oportunidades': 'user_id',
+    'ContextoConsolidado': 'user_id',
+    'CrewCheckpoints': 'user_id',
+    'CrewRuns': 'user_id',
+    # Travas de usuário do aplicativo.py (travas.TravasMongo): _id é o user_id
+    'TravasUsuario': '_id',
+}
+
+
+def colecoes_usuario(db):
+    """
+    COLECOES_USUARIO mais as coleções Contexto_<versao> criadas por migrar_embeddings.py.
+    """
+    sombras = sorted(n for n in db.list_collection_names() if n.startswith('Contexto_'))
+    return COLECOES_USUARIO | {nome: COLECOES_USUARIO['Contexto'] for nome in sombras}
+
+
+def politicas_retencao(db):
+    """
+    POLITICAS_RETENCAO, com a política do Contexto valendo também para as coleções sombra.
+    """
+    politicas = dict(POLITICAS_RETENCAO)
+    for nome in colecoes_usuario(db):
+        if nome.startswith('Contexto_'):
+            politicas[nome] = POLITICAS_RETENCAO['Contexto']
+    return politicas
+
+
+def confirmar(mensagem, assumir_sim):
+    if assumir_sim:
+        return True
+    resposta = input(f"{mensagem} (s/N): ")
+    return resposta.lower() == 's'
+
+
+def aplicar_ttl(db, colecao, campo, dias, dry_run=False):
+    """
+    Cria o índice TTL, ou ajusta o prazo com collMod se ele já existir.
+    """
+    segundos = int(dias * 86400)
+    existente = None
+    for indice in db[colecao].list_indexes():
+        if list(indice['key'].keys()) == [campo]:
+            existente = indice
+            break
+
+    if existente is not None and existente.get('expireAfterSeconds') == segundos:
+        logging.info(f"{colecao}.{campo}: TTL de {dias} dias já aplicado.")
+        return
+    if dry_run:
+        logging.info(f"[dry-run] {colecao}.{campo}: TTL seria definido para {dias} dias.")
+        return
+    if existente is not None and 'expireAfterSeconds' in existente:
+        db.command({'collMod': colecao, 'index': {'keyPattern': {campo: 1}, 'expireAfterSeconds': segundos}})
+    elif existente is not None:
+        # Índice comum no mesmo campo: o MongoDB não permite dois índices com a mesma chave
+        logging.warning(f"{colecao}.{campo} já tem um índice sem TTL ({existente['name']}); remova-o antes.")
+        return
+    else:
+        db[colecao].create_index([(campo, 1)], expireAfterSeconds=segundos, name=f"ttl_{campo}")
+    logging.info(f"{colecao}.{campo}: documentos expiram após {dias} dias.")
+
+
+def apagar_em_lotes(db, colecao, filtro, lote=1000, pausa=0.1, dry_run=False):
+    """
+    Remove os documentos que casam com o filtro, um lote de _ids por vez.
+
+    Retorna o número de documentos removidos (ou que seriam removidos).
+    """
+    total = db[colecao].count_documents(filtro)
+    if dry_run:
+        logging.info(f"[dry-run] {colecao}: {total} documentos seriam removidos com o filtro {filtro}.")
+        return total
+    if total == 0:
+        logging.info(f"{colecao}: nada a remover.")
+        return 0
+
+    removidos = 0
+    with tqdm(total=total, desc=f"Removendo de {colecao}", unit="doc") as pbar:
+        while True:
+            ids = [d['_id'] for d in db[colecao].find(filtro, {'_id': 1}).sort('_id', 1).limit(lote)]
+            if not ids:
+                break
+            resultado = db[colecao].delete_many({'_id': {'$in': ids}})
+            removidos += resultado.deleted_count
+            pbar.update(resultado.deleted_count)
+            if len(ids) < lote:
+                break
+            time.sleep(pausa)
+    logging.info(f"{colecao}: {removidos} documentos removidos.")
+    return removidos
+
+
+def preencher_palavras(db, colecao, lote, pausa, dry_run=False):
+    """
+    Grava os campos da busca lexical (busca_hibrida.campos_lexicos) nas
+    mensagens anteriores a ela e cria o índice (user_id, palavras).
+    """
+    from pymongo import UpdateOne
+
+    filtro = {'palavras': {'$exists': False}, 'content': {'$type': 'string'}}
+    total = db[colecao].count_documents(filtro)
+    if dry_run:
+        logging.info(f"[dry-run] {colecao}: {total} documentos receberiam as palavras da busca híbrida.")
+        return total
+    busca_hibrida.IndiceMongo(db[colecao]).garantir_indice()
+    atualizados = 0
+    with tqdm(total=total, desc=f"Palavras em {colecao}", unit="doc") as pbar:
+        while True:
+            documentos = list(db[colecao].find(filtro, {'content': 1}).sort('_id', 1).limit(lote))
+            if not documentos:
+                break
+            db[colecao].bulk_write([
+                UpdateOne({'_id': d['_id']}, {'$set': busca_hibrida.campos_lexicos(d['content'])})
+                for d in documentos
+            ], ordered=False)
+            atualizados += len(documentos)
+            pbar.update(len(documentos))
+            if len(documentos) < lote:
+                break
+            time.sleep(pausa)
+    logging.info(f"{colecao}: {atualizados} documentos com as palavras da busca híbrida.")
+    return atualizados
+
+
+def compactar(db, colecao, dry_run=False):
+    if dry_run:
+        logging.info(f"[dry-run] {colecao} seria compactada.")
+        return
+    try:
+        resultado = db.command('compact', colecao)
+        logging.info(f"{colecao} compactada: {resultado}")
+    except OperationFailure as e:
+        # Clusters compartilhados do Atlas não permitem compact
+        logging.error(f"Não foi possível compactar {colecao}: {e}")
+
+
+def filtro_por_idade(colecao, dias):
+    # Coleções sombra (Contexto_<versao>) seguem a política do Contexto
+    politica = 'Contexto' if colecao.startswith('Contexto_') else colecao
+    campo = POLITICAS_RETENCAO.get(politica, ('_id', None))[0]
+    limite = datetime.datetime.utcnow() - datetime.timedelta(days=dias)
+    if campo == '_id':
+        from bson import ObjectId
+        return {'_id': {'$lt': ObjectId.from_datetime(limite)}}
+    return {campo: {'$lt': limite}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manutenção do banco de dados do assistente.")
+    parser.add_argument('--dry-run', action='store_true', help="Apenas mostra o que seria feito.")
+    parser.add_argument('--lote', type=int, default=1000, help="Documentos removidos por lote.")
+    parser.add_argument('--pausa-ms', type=int, default=100, help="Pausa entre lotes, em milissegundos.")
+    parser.add_argument('--sim', action='store_true', help="Não pede confirmação.")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    ttl = sub.add_parser('ttl', help="Aplica as políticas de retenção como índices TTL.")
+    ttl.add_argument('--colecao', help="Aplica só para uma coleção.")
+    ttl.add_argument('--dias', type=float, help="Sobrescreve o prazo da política.")
+
+    purgar = sub.add_parser('purgar-usuario', help="Remove todos os dados de um usuário.")
+    purgar.add_argument('--user-id', required=True)
+
+    limpar = sub.add_parser('limpar', help="Remove documentos de coleções em lotes.")
+    limpar.add_argument('--colecao', action='append', required=True)
+    limpar.add_argument('--mais-antigos-que-dias', type=float, help="Remove só documentos mais antigos que N dias.")
+    limpar.add_argument('--filtro', type=json.loads, help="Filtro JSON adicional.")
+
+    compact = sub.add_parser('compactar', help="Executa compact nas coleções.")
+    compact.add_argument('--colecao', action='append', required=True)
+
+    palavras = sub.add_parser('palavras', help="Preenche as palavras da busca híbrida nas mensagens antigas.")
+    palavras.add_argument('--colecao', action='append', required=True)
+
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    db = conexao_mongo.conectar()[conexao_mongo.NOME_BANCO]
+    pausa = args.pausa_ms / 1000.0
+
+    if args.comando == 'ttl':
+        politicas = politicas_retencao(db)
+        if args.colecao:
+            if args.colecao not in politicas:
+                parser.error(f"Sem política de retenção para {args.colecao}.")
+            politicas = {args.colecao: politicas[args.colecao]}
+        for colecao, (campo, dias) in politicas.items():
+            aplicar_ttl(db, colecao, campo, args.dias or dias, args.dry_run)
+
+    elif args.comando == 'purgar-usuario':
+        if not args.dry_run and not confirmar(f"Remover todos os dados do usuário {args.user_id}?", args.sim):
+            logging.info("Operação cancelada pelo usuário.")
+            return 1
+        for colecao, campo in colecoes_usuario(db).items():
+            apagar_em_lotes(db, colecao, {campo: args.user_id}, args.lote, pausa, args.dry_run)
+
+    elif args.comando == 'limpar':
+        filtros = {}
+        for colecao in args.colecao:
+            filtro = dict(args.filtro or {})
+            if args.mais_antigos_que_dias is not None:
+                filtro.update(filtro_por_idade(colecao, args.mais_antigos_que_dias))
+            filtros[colecao] = filtro
+        if not args.dry_run and not confirmar(
+            f"Remover documentos de {', '.join(args.colecao)}? Sem filtro, isso apaga todos os dados.", args.sim
+        ):
+            logging.info("Operação cancelada pelo usuário.")
+            return 1
+        for colecao, filtro in filtros.items():
+            apagar_em_lotes(db, colecao, filtro, args.lote, pausa, args.dry_run)
+
+    elif args.comando == 'compactar':
+        for colecao in args.colecao:
+            compactar(db, colecao, args.dry_run)
+
+    elif args.comando == 'palavras':
+        for colecao in args.colecao:
+            preencher_palavras(db, colecao, args.lote, pausa, args.dry_run)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+Armazenamento em arquivo das conversas do app__.py (modo sem MongoDB).
+
+Cada sessão tem dois arquivos em MEMORY_DIR:
+
+- memoria_{session_id}.json: snapshot compacto (array JSON, o mesmo formato
+  antigo, então arquivos existentes continuam válidos);
+- memoria_{session_id}.jsonl: log só de acréscimo, uma linha por mensagem nova.
+
+Salvar uma mensagem acrescenta uma linha em vez de reescrever a conversa.
+Quando o log passa do limite, uma thread em segundo plano incorpora o log ao
+snapshot. Cada linha do log guarda a posição da mensagem ("i"), então um
+snapshot já atualizado com o log ainda não truncado (queda no meio da
+compactação) não duplica mensagens.
+
+Escritas de uma mesma sessão são serializadas por um lock por sessão e, entre
+processos, por flock num arquivo .lock. As sessões mais recentes ficam num
+LRU em memória, revalidado pelo tamanho e mtime dos arquivos.
+"""
+import os
+import json
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: apenas o lock entre threads
+    fcntl = None
+
+
+class ArmazemSessoes:
+    def __init__(self, diretorio, limite_compactacao=256 * 1024, sessoes_em_memoria=256):
+        self.diretorio = diretorio
+        self.limite_compactacao = limite_compactacao
+        self.sessoes_em_memoria = sessoes_em_memoria
+        os.makedirs(diretorio, exist_ok=True)
+        self._cache = OrderedDict()
+        self._lock_cache = threading.Lock()
+        self._locks = {}
+        self._lock_locks = threading.Lock()
+        self._fila_compactacao = None
+        self._pid_compactador = None
+        self._pendentes = set()
+
+    def _caminhos(self, session_id):
+        base = os.path.join(self.diretorio, f'memoria_{session_id}')
+        return base + '.json', base + '.jsonl', base + '.lock'
+
+    @contextmanager
+    def _travar(self, session_id):
+        with self._lock_locks:
+            lock = self._locks.setdefault(session_id, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._caminhos(session_id)[2], 'a') as arquivo_lock:
+                fcntl.flock(arquivo_lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(arquivo_lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _assinatura(caminho):
+        try:
+            st = os.stat(caminho)
+            return st.st_size, st.st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _ler_log(self, caminho_log, mensagens, deslocamento=0):
+        """
+        Acrescenta às mensagens as linhas do log a partir do deslocamento.
+
+        Retorna o novo deslocamento (fim da última linha completa).
+        """
+        try:
+            with open(caminho_log, 'rb') as f:
+                f.seek(deslocamento)
+                dados = f.read()
+        except FileNotFoundError:
+            return 0
+        fim = dados.rfind(b'\n') + 1  # uma linha incompleta (escrita em andamento) fica para depois
+        for linha in dados[:fim].splitlines():
+            if not linha.strip():
+                continue
+            registro = json.loads(linha)
+            indice = registro.pop('i')
+            if indice == len(mensagens):
+                mensagens.append(registro)
+            elif indice > len(mensagens):
+                logging.warning(f"Lacuna no log {caminho_log}: esperado {len(mensagens)}, encontrado {indice}.")
+                mensagens.append(registro)
+            # indice < len(mensagens): já está no snapshot
+        return deslocamento + fim
+
+    def _carregar_do_disco(self, session_id):
+        caminho_snap, caminho_log, _ = self._caminhos(session_id)
+        assinatura_snap = self._assinatura(caminho_snap)
+        mensagens = []
+        if assinatura_snap is not None:
+            with open(caminho_snap, 'r', encoding='utf-8') as f:
+                mensagens = [{'type': m['type'], 'content': m['content']} for m in json.load(f)]
+        deslocamento = self._ler_log(caminho_log, mensagens)
+        return {'mensagens': mensagens, 'snap': assinatura_snap, 'deslocamento': deslocamento}
+
+    def _entrada(self, session_id):
+        """
+        Estado atual da sessão, do LRU quando ainda válido.
+        """
+        caminho_snap, caminho_log, _ = self._caminhos(session_id)
+        with self._lock_cache:
+            entrada = self._cache.get(session_id)
+        if entrada is not None and entrada['snap'] == self._assinatura(caminho_snap):
+            tamanho_log = (self._assinatura(caminho_log) or (0, 0))[0]
+            if tamanho_log >= entrada['deslocamento']:
+                if tamanho_log > entrada['deslocamento']:
+                    # Outro processo acrescentou mensagens: lê só o trecho novo
+                    entrada['deslocamento'] = self._ler_log(caminho_log, entrada['mensagens'], entrada['deslocamento'])
+                self._lembrar(session_id, entrada)
+                return entrada
+        entrada = self._carregar_do_disco(session_id)
+        self._lembrar(session_id, entrada)
+        return entrada
+
+    def _lembrar(self, session_id, entrada):
+        with self._lock_cache:
+            self._cache[session_id] = entrada
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.sessoes_em_memoria:
+                self._cache.popitem(last=False)
+
+    def carregar(self, session_id):
+        """
+        Lista de mensagens {'type', 'content'} da sessão.
+        """
+        with self._travar(session_id):
+            return list(self._entrada(session_id)['mensagens'])
+
+    def salvar(self, session_id, mensagens):
+        """
+        Persiste a conversa completa. Se ela só acrescenta mensagens ao que
+        está gravado, grava apenas as novas no log; senão reescreve o snapshot.
+        """
+        with self._travar(session_id):
+            entrada = self._entrada(session_id)
+            atuais = entrada['mensagens']
+            if len(mensagens) >= len(atuais) and mensagens[:len(atuais)] == atuais:
+                novas = mensagens[len(atuais):]
+                if novas:
+                    self._acrescentar(session_id, entrada, novas)
+            else:
+                self._reescrever(session_id, entrada, mensagens)
+
+    def _acrescentar(self, session_id, entrada, novas):
+        _, caminho_log, _ = self._caminhos(session_id)
+        inicio = len(entrada['mensagens'])
+        linhas = ''.join(
+            json.dumps({'i': inicio + n, 'type': m['type'], 'content': m['content']},
+                       ensure_ascii=False, separators=(',', ':')) + '\n'
+            for n, m in enumerate(novas)
+        )
+        with open(caminho_log, 'a', encoding='utf-8') as f:
+            f.write(linhas)
+        entrada['mensagens'].extend({'type': m['type'], 'content': m['content']} for m in novas)
+        entrada['deslocamento'] = self._assinatura(caminho_log)[0]
+        if entrada['deslocamento'] > self.limite_compactacao:
+            self._agendar_compactacao(session_id)
+
+    def _reescrever(self, session_id, entrada, mensagens):
+        caminho_snap, caminho_log, _ = self._caminhos(session_id)
+        mensagens = [{'type': m['type'], 'content': m['content']} for m in mensagens]
+        temporario = caminho_snap + '.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(mensagens, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temporario, caminho_snap)
+        # Depois do snapshot gravado o log pode ser descartado com segurança
+        open(caminho_log, 'w').close()
+        entrada.update({'mensagens': mensagens, 'snap': self._assinatura(caminho_snap), 'deslocamento': 0})
+
+    def _agendar_compactacao(self, session_id):
+        with self._lock_cache:
+            # A thread é criada no primeiro uso e recriada num processo filho
+            # (workers pré-fork não herdam as threads do processo mestre)
+            if self._pid_compactador != os.getpid():
+                self._fila_compactacao = queue.Queue()
+                self._pendentes = set()
+                self._pid_compactador = os.getpid()
+                threading.Thread(target=self._compactador, args=(self._fila_compactacao,),
+                                 daemon=True, name="compactador-memoria").start()
+            if session_id in self._pendentes:
+                return
+            self._pendentes.add(session_id)
+        self._fila_compactacao.put(session_id)
+
+    def compactar(self, session_id):
+        """
+        Incorpora o log ao snapshot da sessão.
+        """
+        with self._travar(session_id):
+            entrada = self._entrada(session_id)
+            self._reescrever(session_id, entrada, entrada['mensagens'])
+        logging.info(f"Memória da sessão {session_id} compactada ({len(entrada['mensagens'])} mensagens).")
+
+    def _compactador(self, fila):
+        while True:
+            session_id = fila.get()
+            with self._lock_cache:
+                self._pendentes.discard(session_id)
+            try:
+                self.compactar(session_id)
+            except Exception as e:
+                logging.error(f"Erro ao compactar a memória da sessão {session_id}: {e}")
@@ -0,0 +1,106 @@
+"""
+Mensagens e conversas do aplicativo.py, sem os objetos do LangChain.
+
+Cada Mensagem guarda, na primeira vez que são pedidas, as formas em que é
+usada: o documento gravado no HistoricoConversa, o dicionário de papel
+enviado ao Groq e a linha da transcrição. A Conversa mantém a transcrição
+completa incrementalmente. Como a conversa fica no cache entre turnos (ver
+cache_conversas.py), cada mensagem é convertida uma única vez, em vez de
+várias vezes por requisição.
+"""
+import datetime
+import threading
+
+HUMANA = 'human'
+IA = 'ai'
+
+
+class Mensagem:
+    __slots__ = ('tipo', 'conteudo', 'timestamp', '_documento', '_papel')
+
+    def __init__(self, tipo, conteudo, timestamp=None):
+        self.tipo = tipo
+        self.conteudo = conteudo
+        self.timestamp = timestamp or datetime.datetime.utcnow()
+        self._documento = None
+        self._papel = None
+
+    @classmethod
+    def do_documento(cls, documento):
+        """
+        Mensagem lida do HistoricoConversa, ou None para tipos desconhecidos.
+        """
+        if documento.get('type') not in (HUMANA, IA):
+            return None
+        mensagem = cls(documento['type'], documento['content'], documento.get('timestamp'))
+        mensagem._documento = documento
+        return mensagem
+
+    @property
+    def humana(self):
+        return self.tipo == HUMANA
+
+    def documento(self):
+        if self._documento is None:
+            self._documento = {'type': self.tipo, 'content': self.conteudo, 'timestamp': self.timestamp}
+        return self._documento
+
+    def papel(self):
+        """
+        {'role', 'content'} no formato de mensagens do Groq.
+        """
+        if self._papel is None:
+            self._papel = {'role': 'user' if self.humana else 'assistant', 'content': self.conteudo}
+        return self._papel
+
+    def linha_transcricao(self):
+        return f"{'Usuário' if self.humana else 'Assistente'}: {self.conteudo}\n"
+
+
+class Conversa:
+    """
+    As mensagens de um usuário e a versão do HistoricoConversa em que foram
+    lidas. `persistidas` conta as mensagens iniciais já gravadas; as demais
+    são acrescentadas por salvar_memoria.
+    """
+    __slots__ = ('user_id', 'messages', 'versao', 'persistidas', 'lock', '_transcricao', '_transcritas')
+
+    def __init__(self, user_id, messages=None, versao=0):
+        self.user_id = user_id
+        self.messages = messages if messages is not None else []
+        self.versao = versao
+        self.persistidas = len(self.messages)
+        # Acréscimos e gravações podem vir de uma requisição e da thread de gravação
+        self.lock = threading.Lock()
+        self._transcricao = ''
+        self._transcritas = 0
+
+    def adicionar(self, mensagem):
+        with self.lock:
+            self.messages.append(mensagem)
+
+    def mesclar(self, armazenadas, versao):
+        """
+        Coloca as mensagens ainda não gravadas depois das `armazenadas`, lidas
+        do banco na `versao` dada. Chamado com self.lock.
+        """
+        novas = self.messages[self.persistidas:]
+        self.messages[:] = armazenadas + novas
+        self.versao = versao
+        self.persistidas = len(armazenadas)
+        self._transcricao, self._transcritas = '', 0
+
+    def papeis(self, ultimas=None):
+        mensagens = self.messages if not ultimas else self.messages[-ultimas:]
+        return [m.papel() for m in mensagens]
+
+    def transcricao(self):
+        """
+        "Usuário: ...\\nAssistente: ...\\n", estendida só com as mensagens novas.
+        """
+        with self.lock:
+            total = len(self.messages)
+            if self._transcritas < total:
+                self._transcricao += ''.join(m.linha_transcricao() for m in self.messages[self._transcritas:total])
+                self._transcritas = total
+            return self._transcricao
@@ -0,0 +1,273 @@
+"""
+Migração dos embeddings do Contexto para outro modelo, sem parar o app.
+
+    python migrar_embeddings.py status
+    python migrar_embeddings.py migrar --versao v3 --modelo embed-multilingual-v3.0 [--formato int8]
+    python migrar_embeddings.py indice --versao v3 [--criar]
+    python migrar_embeddings.py ativar --versao v3
+
+migrar lê a coleção ativa em ordem de _id e reembeda o conteúdo em lotes
+(input_type search_document nos modelos v3), gravando numa coleção sombra
+Contexto_<versao> com os mesmos _ids. O progresso fica salvo em Configuracao,
+então uma migração interrompida continua de onde parou.
+
+ativar copia o que chegou durante a migração, troca o documento de
+configuração (uma única escrita, lida pelos workers a cada
+EMBEDDINGS_CONFIG_TTL segundos) e, depois desse prazo, copia de novo o que
+ainda foi gravado na coleção antiga. A coleção antiga não é apagada.
+"""
+import sys
+import time
+import logging
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import ReplaceOne
+
+import conexao_mongo
+import embeddings_compactos
+import busca_hibrida
+from embeddings_compactos import COLECAO_CONFIGURACAO, ID_CONFIGURACAO
+
+# Máximo de textos por chamada de embed da Cohere
+LOTE_MAXIMO = 96
+# Campos de embedding da origem, que não são copiados
+CAMPOS_EMBEDDING = {'embedding': 0, 'embedding_q': 0, 'embedding_escala': 0, 'embedding_formato': 0}
+
+
+def id_estado(versao):
+    return f'migracao_embeddings_{versao}'
+
+
+class Reembedador:
+    def __init__(self, modelo, tentativas=5):
+        self.client = embeddings_compactos.cliente_cohere()
+        self.modelo = modelo
+        self.tentativas = tentativas
+
+    def embed_documents(self, textos):
+        for tentativa in range(self.tentativas):
+            try:
+                return embeddings_compactos.embedar(self.client, textos, self.modelo, 'search_document', 'RIGHT')
+            except Exception as e:
+                if tentativa == self.tentativas - 1:
+                    raise
+                espera = 2 ** tentativa
+                logging.warning(f"Erro ao embedar lote ({e}); nova tentativa em {espera}s.")
+                time.sleep(espera)
+
+
+def lotes(cursor, tamanho):
+    lote = []
+    for documento in cursor:
+        if not documento.get('content'):
+            continue
+        lote.append(documento)
+        if len(lote) == tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def copiar(db, estado, reembedador, lote=LOTE_MAXIMO, paralelo=4, desde=None, limite=None):
+    """
+    Reembeda os documentos da origem com _id maior que `desde` (ou que o
+    checkpoint) e grava na coleção de destino. Retorna quantos foram gravados.
+    """
+    origem, destino = db[estado['origem']], db[estado['destino']]
+    inicio_id = desde if desde is not None else estado.get('ultimo_id')
+    filtro = {'_id': {'$gt': inicio_id}} if inicio_id is not None else {}
+    restantes = origem.count_documents(filtro)
+    if limite:
+        restantes = min(restantes, limite)
+    logging.info(f"{restantes} documentos a migrar de {estado['origem']} para {estado['destino']}.")
+
+    cursor = origem.find(filtro, CAMPOS_EMBEDDING).sort('_id', 1).batch_size(lote * paralelo)
+    if limite:
+        cursor = cursor.limit(limite)
+    gravados, inicio = 0, time.monotonic()
+    janela = []
+
+    def processar(executor, lotes_janela):
+        nonlocal gravados
+        vetores = list(executor.map(lambda l: reembedador.embed_documents([d['content'] for d in l]), lotes_janela))
+        operacoes = []
+        for documentos, embeddings in zip(lotes_janela, vetores):
+            for documento, vetor in zip(documentos, embeddings):
+                novo = dict(documento)
+                novo['modelo_embedding'] = estado['modelo']
+                novo.update(embeddings_compactos.compactar(vetor, estado['formato']))
+                if 'palavras' not in novo:
+                    novo.update(busca_hibrida.campos_lexicos(documento.get('content', '')))
+                operacoes.append(ReplaceOne({'_id': documento['_id']}, novo, upsert=True))
+        destino.bulk_write(operacoes, ordered=False)
+        gravados += len(operacoes)
+        # A janela inteira foi gravada: o checkpoint só avança depois disso
+        atualizacao = {'ultimo_id': lotes_janela[-1][-1]['_id'], 'atualizado_em': datetime.datetime.utcnow()}
+        if 'dimensoes' not in estado and vetores and vetores[0]:
+            atualizacao['dimensoes'] = len(vetores[0][0])
+        estado.update(atualizacao)
+        db[COLECAO_CONFIGURACAO].update_one({'_id': estado['_id']}, {'$set': atualizacao})
+        decorrido = time.monotonic() - inicio
+        taxa = gravados / decorrido if decorrido else 0.0
+        faltam = max(restantes - gravados, 0)
+        eta = f", faltam ~{faltam / taxa:.0f}s" if taxa else ""
+        logging.info(f"{gravados}/{restantes} documentos ({taxa:.1f} docs/s{eta}).")
+
+    with ThreadPoolExecutor(max_workers=paralelo) as executor:
+        for documentos in lotes(cursor, lote):
+            janela.append(documentos)
+            if len(janela) == paralelo:
+                processar(executor, janela)
+                janela = []
+        if janela:
+            processar(executor, janela)
+    return gravados
+
+
+def carregar_estado(db, versao):
+    estado = db[COLECAO_CONFIGURACAO].find_one({'_id': id_estado(versao)})
+    if estado is None:
+        raise SystemExit(f"Nenhuma migração para a versão {versao}. Rode 'migrar' antes.")
+    return estado
+
+
+def comando_migrar(db, args):
+    ativa = embeddings_compactos.configuracao_ativa(db)
+    estado = db[COLECAO_CONFIGURACAO].find_one({'_id': id_estado(args.versao)})
+    if estado is None:
+        estado = {
+            '_id': id_estado(args.versao),
+            'versao': args.versao,
+            'modelo': args.modelo,
+            'formato': args.formato or ativa['formato'],
+            'origem': ativa['colecao'],
+            'destino': f"Contexto_{args.versao}",
+            'ultimo_id': None,
+            'iniciado_em': datetime.datetime.utcnow(),
+        }
+        if estado['destino'] == estado['origem']:
+            raise SystemExit(f"A versão {args.versao} já é a coleção ativa.")
+        db[COLECAO_CONFIGURACAO].insert_one(estado)
+    elif args.modelo != estado['modelo']:
+        raise SystemExit(f"A migração {args.versao} usa o modelo {estado['modelo']}; use outra versão para {args.modelo}.")
+    else:
+        logging.info(f"Retomando a migração {args.versao} a partir de _id {estado['ultimo_id']}.")
+
+    inicio = time.monotonic()
+    total = copiar(db, estado, Reembedador(estado['modelo']), args.lote, args.paralelo, limite=args.limite)
+    duracao = time.monotonic() - inicio
+    db[COLECAO_CONFIGURACAO].update_one({'_id': estado['_id']}, {'$set': {
+        'ultima_execucao': {'documentos': total, 'duracao_s': round(duracao, 1),
+                            'docs_por_s': round(total / duracao, 1) if duracao else None},
+    }})
+    logging.info(f"Migração {args.versao}: {total} documentos em {duracao:.0f}s. "
+                 f"Crie o índice (indice --versao {args.versao}) e depois rode 'ativar'.")
+    return 0
+
+
+def comando_indice(db, args):
+    estado = carregar_estado(db, args.versao)
+    definicao = embeddings_compactos.definicao_indice_vetorial(estado['formato'], estado.get('dimensoes'))
+    nome = f"contexto_{args.versao}"
+    if definicao is None:
+        logging.info(f"O formato {estado['formato']} não é indexável pelo Atlas; a busca será feita localmente.")
+        return 0
+    logging.info(f"Índice {nome} em {estado['destino']}: {definicao}")
+    if args.criar:
+        from pymongo.operations import SearchIndexModel
+
+        db[estado['destino']].create_search_index(SearchIndexModel(definition=definicao, name=nome, type='vectorSearch'))
+        logging.info(f"Índice {nome} criado; aguarde ficar pronto no Atlas antes de ativar.")
+    return 0
+
+
+def comando_ativar(db, args):
+    estado = carregar_estado(db, args.versao)
+    reembedador = Reembedador(estado['modelo'])
+    # ObjectIds gerados por clientes diferentes não são estritamente ordenados:
+    # a recuperação volta alguns minutos antes do checkpoint (gravar de novo é idempotente)
+    def recuperar():
+        desde = None
+        if estado.get('ultimo_id') is not None:
+            desde = ObjectId.from_datetime(estado['ultimo_id'].generation_time - datetime.timedelta(seconds=args.margem_s))
+        return copiar(db, estado, reembedador, args.lote, args.paralelo, desde=desde)
+
+    logging.info(f"Copiando o que chegou em {estado['origem']} durante a migração...")
+    recuperar()
+
+    anterior = embeddings_compactos.configuracao_ativa(db)
+    db[COLECAO_CONFIGURACAO].replace_one({'_id': ID_CONFIGURACAO}, {
+        '_id': ID_CONFIGURACAO,
+        'versao': estado['versao'],
+        'colecao': estado['destino'],
+        'modelo': estado['modelo'],
+        'formato': estado['formato'],
+        'indice': f"contexto_{estado['versao']}",
+        'anterior': anterior,
+        'ativado_em': datetime.datetime.utcnow(),
+    }, upsert=True)
+    logging.info(f"Versão {estado['versao']} ativa: leituras e escritas agora usam {estado['destino']}.")
+
+    if args.espera_s > 0:
+        logging.info(f"Aguardando {args.espera_s:.0f}s para todos os workers lerem a nova configuração...")
+        time.sleep(args.espera_s)
+        recuperar()
+    logging.info(f"Concluído. {estado['origem']} foi mantida; remova-a com manutencao.py quando não precisar mais dela.")
+    return 0
+
+
+def comando_status(db, args):
+    ativa = embeddings_compactos.configuracao_ativa(db)
+    print(f"Ativa: coleção {ativa['colecao']}, modelo {ativa['modelo']}, formato {ativa['formato']}, índice {ativa['indice']}")
+    for estado in db[COLECAO_CONFIGURACAO].find({'_id': {'$regex': '^migracao_embeddings_'}}):
+        total = db[estado['origem']].estimated_document_count()
+        migrados = db[estado['destino']].estimated_document_count()
+        print(f"- {estado['versao']}: {estado['modelo']} ({estado['formato']}) {estado['origem']} -> {estado['destino']}, "
+              f"{migrados}/{total} migrados, último _id {estado.get('ultimo_id')}, "
+              f"última execução {estado.get('ultima_execucao')}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migração dos embeddings do Contexto entre modelos.")
+    parser.add_argument('--lote', type=int, default=LOTE_MAXIMO, help="Textos por chamada de embed (máx. 96).")
+    parser.add_argument('--paralelo', type=int, default=4, help="Chamadas de embed simultâneas.")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    sub.add_parser('status', help="Mostra a versão ativa e as migrações.")
+
+    migrar = sub.add_parser('migrar', help="Reembeda a coleção ativa numa coleção sombra.")
+    migrar.add_argument('--versao', required=True, help="Nome da versão, ex.: v3 (gera Contexto_v3).")
+    migrar.add_argument('--modelo', required=True, help="Modelo Cohere de destino.")
+    migrar.add_argument('--formato', choices=embeddings_compactos.FORMATOS, help="Formato de armazenamento (padrão: o atual).")
+    migrar.add_argument('--limite', type=int, help="Migra no máximo N documentos nesta execução.")
+
+    indice = sub.add_parser('indice', help="Mostra (ou cria) o índice vetorial da coleção sombra.")
+    indice.add_argument('--versao', required=True)
+    indice.add_argument('--criar', action='store_true', help="Cria o índice no Atlas.")
+
+    ativar = sub.add_parser('ativar', help="Troca a leitura e a escrita para a versão migrada.")
+    ativar.add_argument('--versao', required=True)
+    ativar.add_argument('--espera-s', type=float, default=40,
+                        help="Espera antes da última cópia (maior que EMBEDDINGS_CONFIG_TTL).")
+    ativar.add_argument('--margem-s', type=float, default=300,
+                        help="Quanto antes do checkpoint a cópia final recomeça.")
+
+    args = parser.parse_args(argv)
+    if not 1 <= args.lote <= LOTE_MAXIMO:
+        parser.error(f"--lote deve estar entre 1 e {LOTE_MAXIMO}.")
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    db = conexao_mongo.conectar()[conexao_mongo.NOME_BANCO]
+    comandos = {'status': comando_status, 'migrar': comando_migrar, 'indice': comando_indice, 'ativar': comando_ativar}
+    return comandos[args.comando](db, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Perfil de requisições sob demanda: pilhas amostradas e tempos das etapas.
+
+Enquanto uma requisição perfilada roda, uma thread amostradora lê a pilha da
+thread da requisição (sys._current_frames) a cada intervalo_s e conta as
+pilhas no formato "folded" (raiz;...;folha), que flamegraph.pl e speedscope
+transformam em flame graph. A amostragem é por tempo de relógio: espera por
+rede ou trava aparece na pilha em que a thread está parada, não só uso de CPU.
+
+As etapas marcadas com etapa(nome) no código da requisição entram no perfil
+com início e duração; fora de uma requisição perfilada, etapa() não faz nada.
+Os perfis são gravados como JSON em um diretório local, um arquivo por id de
+requisição, mantendo os `maximo` mais recentes.
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import datetime
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+ID_VALIDO = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+_local = threading.local()
+
+
+def _rotulo(codigo):
+    return f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})"
+
+
+class Amostrador:
+    def __init__(self, thread_id, intervalo_s=0.005, max_profundidade=128):
+        self.thread_id = thread_id
+        self.intervalo_s = intervalo_s
+        self.max_profundidade = max_profundidade
+        self.pilhas = Counter()
+        self.amostras = 0
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._amostrar, name='perfilador', daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+        return self.pilhas
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            rotulos = []
+            while frame is not None and len(rotulos) < self.max_profundidade:
+                rotulos.append(_rotulo(frame.f_code))
+                frame = frame.f_back
+            self.pilhas[';'.join(reversed(rotulos))] += 1
+            self.amostras += 1
+
+
+class Perfil:
+    def __init__(self, id_requisicao, rota, metodo, intervalo_s=0.005, user_id=None):
+        self.id = id_requisicao
+        self.rota = rota
+        self.metodo = metodo
+        self.user_id = user_id
+        self.intervalo_s = intervalo_s
+        self.inicio = datetime.datetime.utcnow()
+        self.etapas = []
+        self._t0 = time.perf_counter()
+        self._nivel = 0
+        self._amostrador = Amostrador(threading.get_ident(), intervalo_s).iniciar()
+
+    @contextmanager
+    def etapa(self, nome):
+        inicio = time.perf_counter()
+        registro = {'nome': nome, 'nivel': self._nivel, 'inicio_ms': round((inicio - self._t0) * 1000, 2)}
+        self.etapas.append(registro)
+        self._nivel += 1
+        try:
+            yield
+        finally:
+            self._nivel -= 1
+            registro['duracao_ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+
+    def finalizar(self, status, erro=None):
+        """Para o amostrador e retorna o documento do perfil."""
+        duracao = time.perf_counter() - self._t0
+        pilhas = self._amostrador.parar()
+        documento = {
+            'id': self.id,
+            'rota': self.rota,
+            'metodo': self.metodo,
+            'user_id': self.user_id,
+            'status': status,
+            'inicio': self.inicio.isoformat() + 'Z',
+            'duracao_ms': round(duracao * 1000, 2),
+            'intervalo_ms': self.intervalo_s * 1000,
+            'amostras': self._amostrador.amostras,
+            'etapas': self.etapas,
+            'pilhas': dict(pilhas.most_common()),
+        }
+        if erro is not None:
+            documento['erro'] = repr(erro)[:500]
+        return documento
+
+
+def iniciar(id_requisicao, rota, metodo, intervalo_s=0.005, user_id=None):
+    """Começa a perfilar a requisição da thread atual."""
+    _local.perfil = Perfil(id_requisicao, rota, metodo, intervalo_s, user_id)
+    return _local.perfil
+
+
+def encerrar(status, erro=None):
+    """Documento do perfil da thread atual (None se ela não está sendo perfilada)."""
+    perfil = getattr(_local, 'perfil', None)
+    if perfil is None:
+        return None
+    _local.perfil = None
+    return perfil.finalizar(status, erro)
+
+
+def etapa(nome):
+    """Marca uma etapa da requisição perfilada (não faz nada nas demais)."""
+    perfil = getattr(_local, 'perfil', None)
+    return perfil.etapa(nome) if perfil is not None else nullcontext()
+
+
+def folded(documento):
+    """Pilhas do perfil no formato de flamegraph.pl e speedscope."""
+    return ''.join(f"{pilha} {n}\n" for pilha, n in documento['pilhas'].items())
+
+
+class ArmazemPerfis:
+    def __init__(self, diretorio, maximo=200):
+        self.diretorio = diretorio
+        self.maximo = maximo
+
+    def _caminho(self, id_requisicao):
+        if not ID_VALIDO.match(id_requisicao or ''):
+            raise ValueError(f"Id de requisição inválido: {id_requisicao!r}")
+        return os.path.join(self.diretorio, f"{id_requisicao}.json")
+
+    def salvar(self, documento):
+        os.makedirs(self.diretorio, exist_ok=True)
+        caminho = self._caminho(documento['id'])
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(documento, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+        self._podar()
+        return caminho
+
+    def carregar(self, id_requisicao):
+        try:
+            with open(self._caminho(id_requisicao), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _arquivos(self):
+        """Arquivos de perfil, do mais recente para o mais antigo."""
+        try:
+            nomes = [n for n in os.listdir(self.diretorio) if n.endswith('.json')]
+        except FileNotFoundError:
+            return []
+        caminhos = [os.path.join(self.diretorio, n) for n in nomes]
+        datas = {}
+        for caminho in caminhos:
+            try:
+                datas[caminho] = os.path.getmtime(caminho)
+            except FileNotFoundError:
+                pass
+        return sorted(datas, key=datas.get, reverse=True)
+
+    def listar(self, limite=50):
+        resumos = []
+        for caminho in self._arquivos()[:limite]:
+            try:
+                with open(caminho, 'r', encoding='utf-8') as f:
+                    documento = json.load(f)
+            except (OSError, ValueError):
+                continue
+            resumos.append({campo: documento.get(campo) for campo in
+                            ('id', 'rota', 'metodo', 'user_id', 'status', 'inicio', 'duracao_ms', 'amostras')})
+        return resumos
+
+    def _podar(self):
+        for caminho in self._arquivos()[self.maximo:]:
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.warning(f"Não foi possível remover o perfil {caminho}: {e}")
@@ -0,0 +1,294 @@
+"""
+Serviço local de embeddings compartilhado pelos workers do app__.py.
+
+Em vez de cada processo carregar o all-MiniLM-L6-v2, um único processo de
+serviço carrega o modelo na primeira requisição e atende os workers por um
+socket Unix. Requisições que chegam juntas são agrupadas num mesmo lote
+(até --tamanho-lote textos ou --espera-lote-ms de espera), e a fila é
+limitada: quando está cheia o cliente recebe erro imediatamente em vez de
+acumular atraso.
+
+O cliente (EmbeddingsServico) inicia o serviço sozinho se o socket ainda não
+existir, então basta usá-lo como qualquer Embeddings do LangChain:
+
+    python servico_embeddings.py --socket /tmp/embeddings.sock   # opcional, manual
+
+Protocolo: cada mensagem é um cabeçalho JSON precedido do tamanho (4 bytes,
+big-endian). A resposta traz {"n", "dim"} seguido de n*dim float32.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import struct
+import logging
+import argparse
+import threading
+import subprocess
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MODELO_PADRAO = "all-MiniLM-L6-v2"
+SOCKET_PADRAO = os.getenv('EMBEDDINGS_SOCKET', '/tmp/hackathon_meta_embeddings.sock')
+TAMANHO_MAXIMO_MENSAGEM = 64 * 1024 * 1024
+
+
+def _enviar(conexao, cabecalho, corpo=b''):
+    dados = json.dumps(cabecalho).encode('utf-8')
+    conexao.sendall(struct.pack('>I', len(dados)) + dados + corpo)
+
+
+def _receber_exato(conexao, tamanho):
+    partes = []
+    while tamanho:
+        parte = conexao.recv(min(tamanho, 1 << 20))
+        if not parte:
+            raise ConnectionError("Conexão encerrada pelo outro lado.")
+        partes.append(parte)
+        tamanho -= len(parte)
+    return b''.join(partes)
+
+
+def _receber(conexao):
+    tamanho, = struct.unpack('>I', _receber_exato(conexao, 4))
+    if tamanho > TAMANHO_MAXIMO_MENSAGEM:
+        raise ValueError(f"Mensagem grande demais ({tamanho} bytes).")
+    return json.loads(_receber_exato(conexao, tamanho))
+
+
+class _Pedido:
+    __slots__ = ('textos', 'pronto', 'vetores', 'erro')
+
+    def __init__(self, textos):
+        self.textos = textos
+        self.pronto = threading.Event()
+        self.vetores = None
+        self.erro = None
+
+
+class ServicoEmbeddings:
+    def __init__(self, caminho_socket=SOCKET_PADRAO, modelo=MODELO_PADRAO, tamanho_lote=64,
+                 espera_lote_ms=5, fila_maxima=256, ocioso_s=0):
+        self.caminho_socket = caminho_socket
+        self.modelo = modelo
+        self.tamanho_lote = tamanho_lote
+        self.espera_lote = espera_lote_ms / 1000.0
+        self.fila = queue.Queue(maxsize=fila_maxima)
+        self.ocioso_s = ocioso_s
+        self._modelo = None
+        self._ultima_atividade = time.monotonic()
+
+    def _carregar_modelo(self):
+        if self._modelo is None:
+            from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+            inicio = time.perf_counter()
+            self._modelo = HuggingFaceEmbeddings(model_name=self.modelo)
+            logging.info(f"Modelo {self.modelo} carregado em {time.perf_counter() - inicio:.1f}s.")
+        return self._modelo
+
+    def _agrupador(self):
+        while True:
+            lote = [self.fila.get()]
+            total = len(lote[0].textos)
+            limite = time.monotonic() + self.espera_lote
+            while total < self.tamanho_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    pedido = self.fila.get(timeout=restante)
+                except queue.Empty:
+                    break
+                lote.append(pedido)
+                total += len(pedido.textos)
+            try:
+                textos = [t for pedido in lote for t in pedido.textos]
+                vetores = np.asarray(self._carregar_modelo().embed_documents(textos), dtype=np.float32)
+                posicao = 0
+                for pedido in lote:
+                    pedido.vetores = vetores[posicao:posicao + len(pedido.textos)]
+                    posicao += len(pedido.textos)
+            except Exception as e:
+                logging.error(f"Erro ao gerar embeddings: {e}")
+                for pedido in lote:
+                    pedido.erro = str(e)
+            for pedido in lote:
+                pedido.pronto.set()
+
+    def _atender(self, conexao):
+        with conexao:
+            while True:
+                try:
+                    mensagem = _receber(conexao)
+                except (ConnectionError, struct.error):
+                    return
+                except (ValueError, OSError) as e:
+                    # Quadro inválido (tamanho acima do limite ou JSON quebrado, que é
+                    # um ValueError) ou timeout: o fluxo perdeu o alinhamento, então fecha
+                    logging.warning(f"Conexão encerrada após mensagem inválida: {e}")
+                    return
+                self._ultima_atividade = time.monotonic()
+                pedido = _Pedido([str(t) for t in mensagem.get('textos', [])])
+                if not pedido.textos:
+                    _enviar(conexao, {'n': 0, 'dim': 0})
+                    continue
+                try:
+                    self.fila.put_nowait(pedido)
+                except queue.Full:
+                    _enviar(conexao, {'erro': 'ocupado'})
+                    continue
+                pedido.pronto.wait()
+                if pedido.erro:
+                    _enviar(conexao, {'erro': pedido.erro})
+                else:
+                    n, dim = pedido.vetores.shape
+                    _enviar(conexao, {'n': n, 'dim': dim}, pedido.vetores.tobytes())
+
+    def executar(self):
+        if os.path.exists(self.caminho_socket):
+            os.unlink(self.caminho_socket)
+        servidor = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        servidor.bind(self.caminho_socket)
+        os.chmod(self.caminho_socket, 0o600)
+        servidor.listen(128)
+        servidor.settimeout(1.0)
+        threading.Thread(target=self._agrupador, daemon=True, name="agrupador-embeddings").start()
+        logging.info(f"Serviço de embeddings ouvindo em {self.caminho_socket}.")
+        try:
+            while True:
+                try:
+                    conexao, _ = servidor.accept()
+                except socket.timeout:
+                    if self.ocioso_s and time.monotonic() - self._ultima_atividade > self.ocioso_s:
+                        logging.info("Serviço de embeddings ocioso; encerrando.")
+                        return
+                    continue
+                threading.Thread(target=self._atender, args=(conexao,), daemon=True).start()
+        finally:
+            servidor.close()
+            if os.path.exists(self.caminho_socket):
+                os.unlink(self.caminho_socket)
+
+
+class ServicoOcupado(RuntimeError):
+    pass
+
+
+class EmbeddingsServico(Embeddings):
+    """
+    Embeddings do LangChain que delega ao serviço compartilhado.
+
+    Se o socket não responder, inicia o serviço (um só, mesmo com vários
+    workers tentando ao mesmo tempo) e espera até iniciar_timeout segundos.
+    """
+
+    def __init__(self, caminho_socket=SOCKET_PADRAO, modelo=MODELO_PADRAO, iniciar_automaticamente=True,
+                 iniciar_timeout=30.0, timeout=60.0):
+        self.caminho_socket = caminho_socket
+        self.modelo = modelo
+        self.iniciar_automaticamente = iniciar_automaticamente
+        self.iniciar_timeout = iniciar_timeout
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conectar(self):
+        conexao = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conexao.settimeout(self.timeout)
+        conexao.connect(self.caminho_socket)
+        return conexao
+
+    def _iniciar_servico(self):
+        with open(self.caminho_socket + '.lock', 'a') as arquivo_lock:
+            if fcntl is not None:
+                fcntl.flock(arquivo_lock, fcntl.LOCK_EX)
+            try:
+                # Outro worker pode ter iniciado o serviço enquanto esperávamos o lock
+                try:
+                    return self._conectar()
+                except OSError:
+                    pass
+                logging.info("Iniciando o serviço de embeddings compartilhado...")
+                subprocess.Popen(
+                    [sys.executable, os.path.abspath(__file__), '--socket', self.caminho_socket, '--modelo', self.modelo],
+                    stdin=subprocess.DEVNULL, start_new_session=True,
+                )
+                limite = time.monotonic() + self.iniciar_timeout
+                while time.monotonic() < limite:
+                    try:
+                        return self._conectar()
+                    except OSError:
+                        time.sleep(0.1)
+                raise TimeoutError(f"O serviço de embeddings não respondeu em {self.caminho_socket}.")
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(arquivo_lock, fcntl.LOCK_UN)
+
+    def _conexao(self):
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            try:
+                conexao = self._conectar()
+            except OSError:
+                if not self.iniciar_automaticamente:
+                    raise
+                conexao = self._iniciar_servico()
+            self._local.conexao = conexao
+        return conexao
+
+    def _embed(self, textos):
+        for tentativa in range(2):
+            conexao = self._conexao()
+            try:
+                _enviar(conexao, {'textos': textos})
+                resposta = _receber(conexao)
+                # O corpo é lido aqui dentro: uma conexão que cai no meio dele não
+                # pode ficar guardada em self._local com bytes pela metade
+                n, dim = resposta.get('n', 0), resposta.get('dim', 0)
+                dados = _receber_exato(conexao, n * dim * 4) if n else b''
+                break
+            except (OSError, ValueError, struct.error):
+                # Serviço reiniciado, conexão perdida ou resposta fora do protocolo:
+                # descarta a conexão e reconecta uma vez
+                conexao.close()
+                self._local.conexao = None
+                if tentativa:
+                    raise
+        if 'erro' in resposta:
+            if resposta['erro'] == 'ocupado':
+                raise ServicoOcupado("Fila do serviço de embeddings cheia.")
+            raise RuntimeError(f"Erro no serviço de embeddings: {resposta['erro']}")
+        return np.frombuffer(dados, dtype=np.float32).reshape(n, dim).tolist()
+
+    def embed_documents(self, texts):
+        return self._embed(list(texts))
+
+    def embed_query(self, text):
+        return self._embed([text])[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço local de embeddings compartilhado.")
+    parser.add_argument('--socket', default=SOCKET_PADRAO)
+    parser.add_argument('--modelo', default=MODELO_PADRAO)
+    parser.add_argument('--tamanho-lote', type=int, default=64, help="Máximo de textos por lote.")
+    parser.add_argument('--espera-lote-ms', type=float, default=5, help="Espera máxima para completar um lote.")
+    parser.add_argument('--fila-maxima', type=int, default=256, help="Pedidos aguardando antes de recusar.")
+    parser.add_argument('--ocioso-s', type=float, default=0, help="Encerra após N segundos sem uso (0 = nunca).")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    ServicoEmbeddings(args.socket, args.modelo, args.tamanho_lote, args.espera_lote_ms,
+                      args.fila_maxima, args.ocioso_s).executar()
+
+
+if __name__ == '__main__':
+    main()
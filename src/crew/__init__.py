@@ -0,0 +1,14 @@
+"""
+Opportunity finder crew.
+
+The crew modules import each other as top-level modules (from crew import ...),
+the way aplicativo.py and the scripts in this directory load them. Installed as
+the hackathon_meta_crew package, this directory goes to the end of sys.path so
+those imports resolve without installing main, tools etc. as top-level modules.
+"""
+import os
+import sys
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+if _PACKAGE_DIR not in sys.path:
+    sys.path.append(_PACKAGE_DIR)
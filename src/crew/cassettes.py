@@ -0,0 +1,263 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from types import SimpleNamespace
+
+# record: call the APIs and (re)write what they answer
+# replay: serve only from the cassette; a request not in it is an error
+# auto: serve from the cassette, record what is missing
+MODES = ('record', 'replay', 'auto')
+# catalogo and paginas are this crew's own tools: the catalogue changes with
+# every run and pages change on the web, so replays read them from the cassette too
+TARGETS = ('litellm', 'groq', 'cohere', 'serply', 'catalogo', 'paginas')
+# Tool fields that change what a Serply search returns (the API key is left out)
+SERPLY_TOOLS = ('SerplyWebSearchTool', 'SerplyNewsSearchTool', 'SerplyJobSearchTool', 'SerplyScholarSearchTool',
+                'SerplyWebpageToMarkdownTool')
+SERPLY_FIELDS = ('search_url', 'query_payload')
+
+# Connection and bookkeeping arguments: they do not change the answer
+_DROPPED = frozenset({
+    'api_key', 'api_base', 'base_url', 'timeout', 'request_timeout', 'num_retries', 'max_retries',
+    'extra_headers', 'metadata', 'callbacks', 'logger_fn', 'stream_options', 'user',
+})
+# Values that differ between otherwise identical runs
+_VOLATILE = re.compile(
+    r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?'
+    r'|\b[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}\b'
+)
+
+
+class CassetteMiss(KeyError):
+    """Replay mode got a request the cassette has no answer for."""
+
+
+def normalize(value):
+    """JSON-ready form of a request: volatile arguments, None values,
+    timestamps and ids removed, whitespace trimmed."""
+    if hasattr(value, 'model_dump'):
+        value = value.model_dump()
+    if isinstance(value, dict):
+        return {str(k): normalize(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))
+                if k not in _DROPPED and v is not None}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    if isinstance(value, str):
+        return '\n'.join(line.rstrip() for line in _VOLATILE.sub('<*>', value).strip().splitlines())
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return type(value).__name__
+
+
+class Cassette:
+    """Recorded API calls in one JSON file, keyed by normalised request.
+
+    {'interacoes': {key: {'alvo', 'requisicao', 'respostas': [{'resposta', 'duracao_s'}]}}}
+    A request made several times gets its recorded answers in order (the
+    last one repeats). latency scales the recorded duration of each answer
+    on replay: 0 serves at once, 1 as slow as the API was.
+    """
+
+    def __init__(self, path, mode='replay', latency=0.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}; use one of {', '.join(MODES)}.")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._served = {}
+        self._rewritten = set()
+        self.stats = {'servidas': 0, 'gravadas': 0, 'ausentes': 0}
+        self._interactions = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self._interactions = json.load(f).get('interacoes', {})
+        elif mode == 'replay':
+            raise FileNotFoundError(f"Cassette {path} not found; record it first.")
+
+    @staticmethod
+    def key(target, request):
+        canonical = json.dumps([target, normalize(request)], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+    def call(self, target, request, live, encode, decode):
+        """Answer to request: recorded, or from live() (then recorded).
+        encode/decode convert the answer to and from JSON."""
+        key = self.key(target, request)
+        if self.mode != 'record':
+            recorded = self._next(key)
+            if recorded is not None:
+                if self.latency:
+                    time.sleep(recorded['duracao_s'] * self.latency)
+                return decode(recorded['resposta'])
+            if self.mode == 'replay':
+                with self._lock:
+                    self.stats['ausentes'] += 1
+                raise CassetteMiss(f"No recorded {target} answer for request {key} in {self.path}.")
+        start = time.perf_counter()
+        response = live()
+        self._record(key, target, request, encode(response), time.perf_counter() - start)
+        return response
+
+    def _next(self, key):
+        with self._lock:
+            interaction = self._interactions.get(key)
+            if interaction is None:
+                return None
+            position = self._served.get(key, 0)
+            self._served[key] = position + 1
+            self.stats['servidas'] += 1
+            answers = interaction['respostas']
+            return answers[min(position, len(answers) - 1)]
+
+    def _record(self, key, target, request, response, duration):
+        with self._lock:
+            interaction = self._interactions.get(key)
+            # Re-recording replaces the answers of the previous recording
+            if interaction is None or (self.mode == 'record' and key not in self._rewritten):
+                interaction = self._interactions[key] = {'alvo': target, 'requisicao': normalize(request),
+                                                         'respostas': []}
+            self._rewritten.add(key)
+            interaction['respostas'].append({'resposta': response, 'duracao_s': round(duration, 4)})
+            self.stats['gravadas'] += 1
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump({'interacoes': self._interactions}, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(temporary, self.path)
+
+
+# ---- patches ----
+
+def _patch_litellm(cassette):
+    import litellm
+
+    original = litellm.completion
+
+    def completion(*args, **kwargs):
+        if kwargs.get('stream'):
+            return original(*args, **kwargs)
+        request = dict(zip(('model', 'messages'), args), **kwargs)
+        return cassette.call('litellm', request, lambda: original(*args, **kwargs),
+                             lambda r: r.model_dump(), lambda d: litellm.ModelResponse(**d))
+
+    litellm.completion = completion
+
+
+def _patch_groq(cassette):
+    from groq.resources.chat.completions import Completions
+    from groq.types.chat import ChatCompletion
+
+    original = Completions.create
+
+    def create(self, *args, **kwargs):
+        if kwargs.get('stream'):
+            return original(self, *args, **kwargs)
+        return cassette.call('groq', kwargs, lambda: original(self, *args, **kwargs),
+                             lambda r: r.model_dump(), ChatCompletion.model_validate)
+
+    Completions.create = create
+
+
+def _patch_cohere(cassette):
+    import cohere
+
+    original = cohere.Client.embed
+
+    def embed(self, *args, **kwargs):
+        return cassette.call('cohere', kwargs, lambda: original(self, *args, **kwargs),
+                             lambda r: {'embeddings': [list(v) for v in r.embeddings]},
+                             lambda d: SimpleNamespace(**d))
+
+    cohere.Client.embed = embed
+
+
+def _patch_serply(cassette):
+    import crewai_tools
+
+    for name in SERPLY_TOOLS:
+        tool = getattr(crewai_tools, name, None)
+        if tool is None:
+            continue
+
+        def _run(self, *args, _original=tool._run, _name=name, **kwargs):
+            request = {'ferramenta': _name, 'args': list(args), 'kwargs': kwargs,
+                       'config': {field: getattr(self, field, None) for field in SERPLY_FIELDS}}
+            return cassette.call('serply', request, lambda: _original(self, *args, **kwargs), str, str)
+
+        tool._run = _run
+
+
+def _json_safe(value):
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def _patch_catalogo(cassette):
+    from catalogo import OpportunityCatalog
+
+    original = OpportunityCatalog.search
+
+    def search(self, query, kind=None, modality=None, location=None, limit=10):
+        request = {'query': query, 'kind': kind, 'modality': modality, 'location': location, 'limit': limit}
+        return cassette.call('catalogo', request, lambda: original(self, query, kind, modality, location, limit),
+                             _json_safe, tuple)
+
+    OpportunityCatalog.search = search
+
+
+def _patch_paginas(cassette):
+    from tools.paginas import PageFetcher
+
+    original = PageFetcher.fetch
+
+    def fetch(self, url):
+        return cassette.call('paginas', {'url': url}, lambda: original(self, url), dict, dict)
+
+    PageFetcher.fetch = fetch
+
+
+_PATCHES = {'litellm': _patch_litellm, 'groq': _patch_groq, 'cohere': _patch_cohere, 'serply': _patch_serply,
+            'catalogo': _patch_catalogo, 'paginas': _patch_paginas}
+_installed = None
+
+
+def installed():
+    """The cassette installed in this process, if any."""
+    return _installed
+
+
+def install(cassette, targets=TARGETS):
+    """Routes the targets' calls through the cassette, for the whole process.
+    Targets whose library is not installed are skipped."""
+    global _installed
+    if _installed is not None:
+        raise RuntimeError(f"A cassette is already installed ({_installed.path}).")
+    for target in targets:
+        try:
+            _PATCHES[target](cassette)
+        except ImportError as e:
+            logging.warning(f"Cassette: {target} not patched ({e}).")
+    _installed = cassette
+    logging.info(f"Cassette {cassette.path} installed in {cassette.mode} mode for {', '.join(targets)}.")
+    return cassette
+
+
+def install_from_env(default_path, targets=TARGETS):
+    """install() configured by CASSETE_MODO (record, replay or auto; unset
+    disables cassettes), CASSETE_ARQUIVO and CASSETE_LATENCIA."""
+    mode = os.getenv('CASSETE_MODO')
+    if not mode or _installed is not None:
+        return _installed
+    latency = float(os.getenv('CASSETE_LATENCIA', 0))
+    return install(Cassette(os.getenv('CASSETE_ARQUIVO', default_path), mode, latency), targets)
@@ -0,0 +1,223 @@
+import os
+import re
+import hashlib
+import logging
+import datetime
+import threading
+
+import numpy as np
+
+import busca_hibrida
+
+# Global collection shared by every user's crew runs
+CATALOG_COLLECTION = 'CatalogoOportunidades'
+# Entries not seen by any crew run for this long are stale: left out of results
+STALE_AFTER_DAYS = float(os.getenv('CATALOGO_VALIDADE_DIAS', 30))
+# Fewer fresh results than this is a coverage gap (the agent should search the web)
+MIN_RESULTS = int(os.getenv('CATALOGO_MINIMO', 5))
+# Most recently seen entries loaded into the in-memory index
+MAX_LOADED = int(os.getenv('CATALOGO_MAX_CARREGADOS', 20000))
+# Cosine below this (without a keyword match) does not count as a match
+MIN_SIMILARITY = float(os.getenv('CATALOGO_SIMILARIDADE_MINIMA', 0.35))
+
+MODALITIES = {
+    'online': re.compile(r'\b(online|on-line|remot[oa]|ead|a distancia|virtual)\b'),
+    'hibrido': re.compile(r'\bhibrid[oa]\b'),
+    'presencial': re.compile(r'\bpresencial\b'),
+}
+
+# Words nearly every entry shares, dropped from the catalogue keywords on top
+# of the stopwords of the hybrid memory search (busca_hibrida)
+OPPORTUNITY_WORDS = frozenset("""
+curso cursos vaga vagas evento eventos oportunidade oportunidades programa
+""".split())
+STOPWORDS = busca_hibrida.STOPWORDS | OPPORTUNITY_WORDS
+
+
+def keywords(text):
+    """Catalogue keywords of a text: busca_hibrida.tokenizar with the catalogue stopwords."""
+    return busca_hibrida.tokenizar(text, STOPWORDS)
+
+
+def detect_modality(text):
+    normalized = busca_hibrida.normalizar(text)
+    found = [name for name, pattern in MODALITIES.items() if pattern.search(normalized)]
+    # Both online and in-person mentioned: hybrid
+    if 'hibrido' in found or {'online', 'presencial'} <= set(found):
+        return 'hibrido'
+    return found[0] if found else None
+
+
+def entry_id(candidate):
+    key = (candidate.get('link') or '').rstrip('/').lower() or busca_hibrida.normalizar(candidate['titulo'])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class OpportunityCatalog:
+    """Deduplicated opportunities found by past crew runs, for every user.
+
+    Entries live in CatalogoOportunidades with their keywords and a float16
+    unit embedding. Queries run against an in-memory index built once per
+    process on first use: an inverted keyword index (token -> entry
+    positions, scored BM25-style) and an embedding matrix (cosine), fused by
+    reciprocal rank. Type, modality and location filters are applied before
+    scoring.
+    """
+
+    def __init__(self, db, embed=None):
+        self.collection = db[CATALOG_COLLECTION]
+        self.embed = embed
+        self._lock = threading.Lock()
+        self._index = None
+
+    # ---- writes ----
+
+    def register(self, candidates, model=None):
+        """Upserts candidates (reranking results) into the catalogue."""
+        from pymongo import UpdateOne
+        from bson.binary import Binary
+
+        now = datetime.datetime.utcnow()
+        operations = []
+        for candidate in candidates:
+            text = f"{candidate['titulo']} {candidate.get('descricao') or ''}"
+            fields = {
+                'titulo': candidate['titulo'],
+                'descricao': candidate.get('descricao') or '',
+                'link': candidate.get('link'),
+                'modalidade': detect_modality(text),
+                'palavras': sorted(set(keywords(text))),
+                'visto_em': now,
+            }
+            vector = candidate.get('_embedding')
+            if vector is not None and model:
+                fields['embedding_f16'] = Binary(np.asarray(vector, dtype=np.float16).tobytes())
+                fields['modelo_embedding'] = model
+            operations.append(UpdateOne(
+                {'_id': entry_id(candidate)},
+                {'$set': fields,
+                 '$addToSet': {'tipos': {'$each': candidate.get('tipos') or [candidate['tipo']]}},
+                 '$inc': {'vezes_encontrada': 1},
+                 '$setOnInsert': {'criado_em': now}},
+                upsert=True,
+            ))
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+            logging.info(f"Catalogue updated with {len(operations)} opportunities.")
+        with self._lock:
+            self._index = None  # rebuilt with the new entries on the next query
+        return len(operations)
+
+    # ---- in-memory index ----
+
+    def _load(self):
+        with self._lock:
+            if self._index is not None:
+                return self._index
+            cursor = self.collection.find(
+                {}, {'titulo': 1, 'descricao': 1, 'link': 1, 'tipos': 1, 'modalidade': 1, 'palavras': 1,
+                     'visto_em': 1, 'embedding_f16': 1, 'modelo_embedding': 1},
+            ).sort('visto_em', -1).limit(MAX_LOADED)
+            entries, postings, vectors, lengths = [], {}, [], []
+            model = getattr(self.embed, 'model', None)
+            for position, doc in enumerate(cursor):
+                words = doc.pop('palavras', [])
+                for word in words:
+                    postings.setdefault(word, []).append(position)
+                lengths.append(len(words))
+                raw = doc.pop('embedding_f16', None)
+                vectors.append(np.frombuffer(raw, dtype=np.float16) if raw and doc.get('modelo_embedding') == model else None)
+                entries.append(doc)
+
+            dimension = next((len(v) for v in vectors if v is not None), 0)
+            matrix = np.zeros((len(entries), dimension), dtype=np.float32)
+            has_vector = np.zeros(len(entries), dtype=bool)
+            for position, vector in enumerate(vectors):
+                if vector is not None and len(vector) == dimension:
+                    matrix[position] = vector
+                    has_vector[position] = True
+            self._index = {
+                'entries': entries,
+                'postings': {w: np.asarray(p) for w, p in postings.items()},
+                'lengths': np.asarray(lengths, dtype=np.float32),
+                'matrix': matrix,
+                'has_vector': has_vector,
+                'seen': np.asarray([d.get('visto_em') or datetime.datetime.min for d in entries], dtype='datetime64[s]'),
+                'types': [set(d.get('tipos') or []) for d in entries],
+                'modalities': np.asarray([d.get('modalidade') for d in entries], dtype=object),
+            }
+            logging.info(f"Catalogue index loaded: {len(entries)} entries, {int(has_vector.sum())} with embeddings.")
+            return self._index
+
+    def _keyword_scores(self, index, tokens):
+        scores = np.zeros(len(index['entries']), dtype=np.float32)
+        total = len(index['entries'])
+        if not total:
+            return scores
+        average = float(index['lengths'].mean())
+        for token in set(tokens):
+            positions = index['postings'].get(token)
+            if positions is None:
+                continue
+            # Same BM25 as the memory search; each keyword appears once per entry (tf = 1)
+            scores[positions] += busca_hibrida.idf(total, len(positions)) * busca_hibrida.peso_bm25(
+                index['lengths'][positions], average)
+        return scores
+
+    def search(self, query, kind=None, modality=None, location=None, limit=10):
+        """Fresh entries matching the filters, best first.
+
+        Returns (results, stale) where stale counts the matching entries
+        left out because no crew run has seen them for STALE_AFTER_DAYS.
+        """
+        index = self._load()
+        total = len(index['entries'])
+        if not total:
+            return [], 0
+        mask = np.ones(total, dtype=bool)
+        if kind:
+            mask &= np.fromiter((kind in t for t in index['types']), dtype=bool, count=total)
+        if modality:
+            mask &= index['modalities'] == modality
+        for token in keywords(location or ''):
+            # Location words must all appear in the entry
+            present = np.zeros(total, dtype=bool)
+            present[index['postings'].get(token, [])] = True
+            mask &= present
+
+        tokens = keywords(query)
+        keyword = self._keyword_scores(index, tokens)
+        vector = np.full(total, -np.inf, dtype=np.float32)
+        if self.embed is not None and index['has_vector'].any():
+            try:
+                q = np.asarray(self.embed([query], 'search_query'), dtype=np.float32)[0]
+                q /= np.linalg.norm(q) or 1.0
+                vector = np.where(index['has_vector'], index['matrix'] @ q, -np.inf)
+            except Exception as e:
+                logging.warning(f"Catalogue query embedding failed, keyword search only: {e}")
+
+        relevant = mask & ((keyword > 0) | (vector >= MIN_SIMILARITY))
+        if not tokens and not np.isfinite(vector).any():
+            # Filters only: most recently seen first (the index is loaded in that order)
+            relevant = mask
+        limit_date = np.datetime64(datetime.datetime.utcnow() - datetime.timedelta(days=STALE_AFTER_DAYS), 's')
+        fresh = index['seen'] >= limit_date
+        stale = int((relevant & ~fresh).sum())
+        candidates = np.flatnonzero(relevant & fresh)
+        if not len(candidates):
+            return [], stale
+
+        # Reciprocal rank fusion of the keyword and vector rankings
+        fused = np.zeros(len(candidates), dtype=np.float64)
+        for scores, floor in ((keyword[candidates], 0.0), (vector[candidates], -np.inf)):
+            ranked = np.argsort(-scores, kind='stable')
+            valid = scores[ranked] > floor
+            fused[ranked[valid]] += busca_hibrida.peso_rrf(np.flatnonzero(valid))
+        order = np.argsort(-fused, kind='stable')[:limit]
+        results = []
+        for i in order:
+            entry = dict(index['entries'][candidates[i]])
+            entry.pop('_id', None)
+            entry['pontuacao'] = round(float(fused[i]), 5)
+            results.append(entry)
+        return results, stale
@@ -0,0 +1,87 @@
+import os
+import uuid
+import hashlib
+import logging
+import datetime
+from types import SimpleNamespace
+
+CHECKPOINT_COLLECTION = 'CrewCheckpoints'
+# Without an explicit run id, an unfinished run of the same user and context
+# started less than this long ago is resumed instead of starting over
+RESUME_WITHIN_H = float(os.getenv('CREW_RETOMAR_H', 24))
+
+IN_PROGRESS, FAILED, DONE = 'em_andamento', 'falhou', 'concluida'
+
+
+def context_digest(text):
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+
+class CrewCheckpoints:
+    """Task outputs of OportunityFinderCrew runs, saved as each task completes.
+
+    One document per run in CrewCheckpoints:
+    {_id: run_id, user_id, contexto_hash, status, tentativas,
+     tarefas: {task name: {raw, agente, concluida_em}}, iniciada_em, atualizada_em}.
+    A rerun under the same id only executes the tasks missing from `tarefas`.
+    """
+
+    def __init__(self, db):
+        self.collection = db[CHECKPOINT_COLLECTION]
+
+    def start(self, user_id, context_text, run_id=None):
+        """Id of the run to execute: run_id (created if new), or else the
+        user's latest unfinished run with the same context, or a new run."""
+        from pymongo.errors import DuplicateKeyError
+
+        digest = context_digest(context_text)
+        now = datetime.datetime.utcnow()
+        if run_id is None:
+            previous = self.collection.find_one(
+                {'user_id': user_id, 'contexto_hash': digest, 'status': {'$ne': DONE},
+                 'atualizada_em': {'$gte': now - datetime.timedelta(hours=RESUME_WITHIN_H)}},
+                {'_id': 1}, sort=[('atualizada_em', -1)],
+            )
+            run_id = previous['_id'] if previous else uuid.uuid4().hex
+        try:
+            run = self.collection.find_one_and_update(
+                {'_id': run_id, 'user_id': user_id},
+                {'$set': {'status': IN_PROGRESS, 'atualizada_em': now},
+                 '$unset': {'erro': ''},
+                 '$inc': {'tentativas': 1},
+                 '$setOnInsert': {'contexto_hash': digest, 'tarefas': {}, 'iniciada_em': now}},
+                upsert=True, return_document=True,
+            )
+        except DuplicateKeyError:
+            raise ValueError(f"Run {run_id} belongs to another user.")
+        done = sorted(run.get('tarefas') or {})
+        if done:
+            logging.info(f"Resuming run {run_id} (attempt {run['tentativas']}), already done: {', '.join(done)}.")
+        else:
+            logging.info(f"Starting run {run_id} for user {user_id}.")
+        return run_id
+
+    def completed(self, run_id):
+        """{task name: raw output} of the run's finished tasks."""
+        run = self.collection.find_one({'_id': run_id}, {'tarefas': 1}) or {}
+        return {name: task['raw'] for name, task in (run.get('tarefas') or {}).items()}
+
+    def save_task(self, run_id, name, raw, agent=None):
+        now = datetime.datetime.utcnow()
+        self.collection.update_one(
+            {'_id': run_id},
+            {'$set': {f'tarefas.{name}': {'raw': raw, 'agente': agent, 'concluida_em': now},
+                      'atualizada_em': now}},
+        )
+        logging.info(f"Checkpoint saved: run {run_id}, task {name}.")
+
+    def task_outputs(self, run_id, order):
+        """The run's outputs as TaskOutput-like objects (name, raw), in task order."""
+        completed = self.completed(run_id)
+        return [SimpleNamespace(name=name, raw=completed[name]) for name in order if name in completed]
+
+    def finish(self, run_id, error=None):
+        fields = {'status': FAILED if error else DONE, 'atualizada_em': datetime.datetime.utcnow()}
+        if error:
+            fields['erro'] = str(error)[:2000]
+        self.collection.update_one({'_id': run_id}, {'$set': fields})
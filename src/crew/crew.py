@@ -1,22 +1,28 @@
 import logging
-from crewai_tools import (
-    SerperDevTool,
-    ScrapeWebsiteTool,
-    SerplyJobSearchTool,
-    SerplyNewsSearchTool,
-    SerplyWebSearchTool,
-)
 from crewai import Agent, Crew, Process, Task
 from crewai.project import CrewBase, agent, crew, task
 import os
-from pymongo import MongoClient
+import sys
 from dotenv import load_dotenv
-import urllib.parse
 import datetime
 
-from litellm import completion  # Use `chat_completion` instead of `completion`
 from crewai.llm import LLM  # Import LLM from crewai.llm
 
+# Run from a checkout (python src/crew/main.py, python telemetry.py), the
+# modules shared with aplicativo.py are in the repository root; the installed
+# package ships them next to this file
+_ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+if os.path.isfile(os.path.join(_ROOT_DIR, 'conexao_mongo.py')) and _ROOT_DIR not in sys.path:
+    sys.path.append(_ROOT_DIR)
+
+import conexao_mongo
+from user_context import UserContextAssembler
+from catalogo import OpportunityCatalog
+from reranking import CohereEmbedder
+from checkpoints import CrewCheckpoints
+import cassettes
+import telemetry
+
 # Inicialize o cliente Groq com a chave da API
 load_dotenv()
 
@@ -27,8 +33,25 @@ if not api_key:
 # Defina o modelo para o LiteLLM (Groq Llama)
 MODEL_NAME = "groq/llama-3.2-90b-text-preview"
 
+# Web search settings of the finders' Serply tools. The queries themselves are
+# written by the agents from the user context (keywords, modality, location)
+SEARCH_LIMIT = int(os.getenv('CREW_BUSCA_LIMITE', 10))
+SEARCH_COUNTRY = os.getenv('CREW_BUSCA_PAIS', 'BR')
+SEARCH_LANGUAGE = os.getenv('CREW_BUSCA_IDIOMA', 'pt')
+
+# Tasks in execution order; checkpoints are keyed by these names
+TASK_ORDER = [
+    'analyze_user_context_task',
+    'find_job_opportunities_task',
+    'find_event_opportunities_task',
+    'find_course_opportunities_task',
+    'find_professional_development_task',
+]
+
 # Função para gerar respostas usando o LiteLLM com o modelo da Groq
 def generate_response(messages):
+    from litellm import completion  # imported on first use; litellm is slow to import
+
     response = completion(
         model=MODEL_NAME,
         messages=messages,
@@ -40,24 +63,10 @@ class MongoDBApp:
     def __init__(self):
         logging.info("Initializing MongoDBApp...")
 
-        # Configure MongoDB connection
-        MONGODB_USERNAME = os.getenv('MONGODB_USERNAME')
-        MONGODB_PASSWORD = os.getenv('MONGODB_PASSWORD')
-
-        if not MONGODB_USERNAME or not MONGODB_PASSWORD:
-            raise ValueError("MongoDB username or password not found in .env file.")
-
-        # Encode credentials
-        username = urllib.parse.quote_plus(MONGODB_USERNAME)
-        password = urllib.parse.quote_plus(MONGODB_PASSWORD)
-
-        # Configure cluster URI
-        cluster_host = 'hackathonmeta.pvjrb.mongodb.net'
-        uri = f"mongodb+srv://{username}:{password}@{cluster_host}/?retryWrites=true&w=majority"
-
-        # Connect to MongoDB
-        self.client = MongoClient(uri)
-        self.db = self.client['DadosUsuários']
+        # Same connection as aplicativo.py: MONGODB_URI, or the Atlas cluster
+        # built from MONGODB_USERNAME and MONGODB_PASSWORD
+        self.client = conexao_mongo.conectar()
+        self.db = self.client[conexao_mongo.NOME_BANCO]
         logging.debug("MongoDB connection established.")
 
     def get_context_collection(self):
@@ -66,6 +75,9 @@ class MongoDBApp:
     def get_opportunities_collection(self):
         return self.db['Oportunidades']
 
+    def get_history_collection(self):
+        return self.db['HistoricoConversa']
+
 @CrewBase
 class OportunityFinderCrew:
     """Crew for finding and processing opportunities."""
@@ -73,23 +85,58 @@ class OportunityFinderCrew:
     agents_config = "config/agents.yaml"
     tasks_config = "config/tasks.yaml"
 
-    def __init__(self, user_id):
+    def __init__(self, user_id, persist=True):
         logging.info(f"Initializing OportunityFinderCrew for user_id: {user_id}")
         self.user_id = user_id
+        # persist=False (cassette replays) only reads the database
+        self.persist = persist
         self.app = MongoDBApp()
+        self.context_assembler = UserContextAssembler(self.app.db, persist=persist)
+        try:
+            embedder = CohereEmbedder.from_db(self.app.db)
+        except Exception as e:
+            logging.warning(f"Catalogue without embeddings (keyword search only): {e}")
+            embedder = None
+        # Shared by the finders' catalogue tools and the reranking stage
+        self.catalog = OpportunityCatalog(self.app.db, embed=embedder)
+        self._fetcher = None
+        # Task outputs are saved under run_id as each task completes (see main.py)
+        self.checkpoints = CrewCheckpoints(self.app.db)
+        self.run_id = None
+        # RunTelemetry of the current run, set by main.py
+        self.telemetry = None
         logging.debug("OportunityFinderCrew initialized.")
 
+    @property
+    def fetcher(self):
+        """Page fetcher shared by the finders' page tool and the enrichment stage."""
+        if self._fetcher is None:
+            from tools.paginas import PageFetcher
+
+            self._fetcher = PageFetcher()
+        return self._fetcher
+
+    def _pages_tool(self):
+        from tools.paginas_tool import PaginasOportunidadesTool
+
+        return PaginasOportunidadesTool(fetcher=self.fetcher)
+
+    def _catalog_tool(self, kind):
+        from tools.catalogo_tool import CatalogoOportunidadesTool
+
+        return CatalogoOportunidadesTool(catalog=self.catalog, kind=kind)
+
     @agent
     def user_context_analyzer(self) -> Agent:
         """Agent to analyze user context."""
 
         def analyze_context():
             logging.info("Agent 'user_context_analyzer' iniciado.")
-            collection_context = self.app.get_context_collection()
-            user_context = collection_context.find_one({"user_id": self.user_id})
+            # Compact precomputed document: user statements and profile, no embeddings
+            user_context = self.context_assembler.get(self.user_id)
             logging.debug(f"User context retrieved: {user_context}")
             logging.info("Agent 'user_context_analyzer' concluído.")
-            return user_context or {}
+            return user_context
 
         return Agent(
             role="Coletor de Contexto do Usuário",
@@ -99,33 +146,21 @@ class OportunityFinderCrew:
             analyze_context=analyze_context
         )
 
+    # crewai_tools is imported inside each agent so that importing this module
+    # (and building agents that need no tools) does not pay for it
     @agent
     def job_opportunity_finder(self) -> Agent:
         """Agent to find job opportunities."""
-        
-        def search_jobs(context):
-            logging.info("Agent 'job_opportunity_finder' iniciado.")
-            keywords = context.get("job_preferences", {}).get("keywords", [])
-            location = context.get("location", "global")
-            max_results = context.get("job_preferences", {}).get("max_results", 10)
-            logging.debug(f"Buscar empregos com keywords: {keywords}, location: {location}, max_results: {max_results}")
-            logging.info("Agent 'job_opportunity_finder' concluído.")
-            return {
-                "keywords": keywords,
-                "location": location,
-                "max_results": max_results
-            }
+        from crewai_tools import SerplyJobSearchTool
 
         return Agent(
             role="Encontrador de Oportunidades de Emprego",
             goal="Identificar e listar oportunidades de emprego que correspondam ao perfil e interesses do usuário.",
             backstory="Você é especialista em identificar oportunidades de emprego que correspondem ao perfil e interesses do usuário. Utilize o contexto fornecido para buscar oportunidades relevantes que se alinham aos objetivos do usuário.",
             tools=[
-                SerplyJobSearchTool(
-                    keywords=search_jobs,
-                    location=search_jobs,
-                    max_results=search_jobs
-                )
+                self._catalog_tool('trabalho'),
+                self._pages_tool(),
+                SerplyJobSearchTool(proxy_location=SEARCH_COUNTRY)
             ],
             verbose=True,
         )
@@ -133,30 +168,16 @@ class OportunityFinderCrew:
     @agent
     def event_opportunity_finder(self) -> Agent:
         """Agent to find event opportunities."""
-        
-        def search_events(context):
-            logging.info("Agent 'event_opportunity_finder' iniciado.")
-            event_types = context.get("event_preferences", {}).get("types", [])
-            location = context.get("location", "global")
-            limit = context.get("event_preferences", {}).get("limit", 10)
-            logging.debug(f"Buscar eventos com types: {event_types}, location: {location}, limit: {limit}")
-            logging.info("Agent 'event_opportunity_finder' concluído.")
-            return {
-                "event_types": event_types,
-                "location": location,
-                "limit": limit
-            }
+        from crewai_tools import SerplyNewsSearchTool
 
         return Agent(
             role="Encontrador de Oportunidades de Eventos",
             goal="Descobrir eventos que contribuam para o desenvolvimento pessoal e profissional do usuário.",
             backstory="Você identifica eventos que podem beneficiar o crescimento pessoal e profissional do usuário, utilizando o contexto coletado para encontrar eventos que correspondem aos interesses e objetivos do usuário.",
             tools=[
-                SerplyNewsSearchTool(
-                    event_types=search_events,
-                    location=search_events,
-                    limit=search_events
-                )
+                self._catalog_tool('evento'),
+                self._pages_tool(),
+                SerplyNewsSearchTool(limit=SEARCH_LIMIT, proxy_location=SEARCH_COUNTRY)
             ],
             verbose=True,
         )
@@ -164,30 +185,16 @@ class OportunityFinderCrew:
     @agent
     def course_opportunity_finder(self) -> Agent:
         """Agent to find course opportunities."""
-        
-        def search_courses(context):
-            logging.info("Agent 'course_opportunity_finder' iniciado.")
-            topics = context.get("course_preferences", {}).get("topics", [])
-            modality = context.get("course_preferences", {}).get("modality", "online")
-            limit = context.get("course_preferences", {}).get("limit", 10)
-            logging.debug(f"Buscar cursos com topics: {topics}, modality: {modality}, limit: {limit}")
-            logging.info("Agent 'course_opportunity_finder' concluído.")
-            return {
-                "topics": topics,
-                "modality": modality,
-                "limit": limit
-            }
+        from crewai_tools import SerplyWebSearchTool
 
         return Agent(
             role="Encontrador de Oportunidades de Cursos",
             goal="Encontrar cursos que atendam às necessidades educacionais e interesses do usuário.",
             backstory="Você busca cursos que correspondem ao perfil educacional e aos interesses do usuário, ajudando-o a adquirir novas habilidades e conhecimentos conforme seus objetivos.",
             tools=[
-                SerplyWebSearchTool(
-                    topics=search_courses,
-                    modality=search_courses,
-                    limit=search_courses
-                )
+                self._catalog_tool('educacao'),
+                self._pages_tool(),
+                SerplyWebSearchTool(limit=SEARCH_LIMIT, hl=SEARCH_LANGUAGE, proxy_location=SEARCH_COUNTRY)
             ],
             verbose=True,
         )
@@ -195,30 +202,16 @@ class OportunityFinderCrew:
     @agent
     def professional_development_finder(self) -> Agent:
         """Agent to find professional development opportunities."""
-        
-        def search_professional_development(context):
-            logging.info("Agent 'professional_development_finder' iniciado.")
-            development_types = context.get("professional_development_preferences", {}).get("types", [])
-            location = context.get("location", "global")
-            limit = context.get("professional_development_preferences", {}).get("limit", 10)
-            logging.debug(f"Buscar desenvolvimento profissional com types: {development_types}, location: {location}, limit: {limit}")
-            logging.info("Agent 'professional_development_finder' concluído.")
-            return {
-                "development_types": development_types,
-                "location": location,
-                "limit": limit
-            }
+        from crewai_tools import SerplyWebSearchTool
 
         return Agent(
             role="Encontrador de Desenvolvimento Profissional",
             goal="Identificar oportunidades de desenvolvimento profissional alinhadas com os objetivos do usuário.",
             backstory="Você procura por oportunidades que podem impulsionar a carreira do usuário, como programas de mentoria, workshops e outras atividades que promovem o crescimento profissional.",
             tools=[
-                SerplyWebSearchTool(
-                    development_types=search_professional_development,
-                    location=search_professional_development,
-                    limit=search_professional_development
-                )
+                self._catalog_tool('desenvolvimento'),
+                self._pages_tool(),
+                SerplyWebSearchTool(limit=SEARCH_LIMIT, hl=SEARCH_LANGUAGE, proxy_location=SEARCH_COUNTRY)
             ],
             verbose=True,
         )
@@ -267,6 +260,39 @@ class OportunityFinderCrew:
             inputs=["analyze_user_context_task"],  # Takes user context as input
         )
 
+    def _pending_tasks(self):
+        """Tasks the current run still has to execute. Tasks finished by an
+        earlier attempt get their saved output back and are passed to the
+        pending ones as context, as if they had just run."""
+        tasks = [getattr(self, name)() for name in TASK_ORDER]
+        completed = self.checkpoints.completed(self.run_id) if self.run_id else {}
+        if not completed:
+            return tasks
+        from crewai.tasks.task_output import TaskOutput
+
+        pending, earlier = [], []
+        for name, task in zip(TASK_ORDER, tasks):
+            if name in completed:
+                task.output = TaskOutput(description=task.description, name=name, agent=task.agent.role,
+                                         expected_output=task.expected_output, raw=completed[name])
+            else:
+                task.context = list(earlier)
+                pending.append(task)
+            earlier.append(task)
+        logging.info(f"Run {self.run_id}: skipping {len(completed)} completed tasks, {len(pending)} to run.")
+        return pending
+
+    def _task_completed(self, output):
+        if self.telemetry is not None:
+            self.telemetry.task_done(output.name)
+        if self.run_id is None:
+            return
+        try:
+            self.checkpoints.save_task(self.run_id, output.name, output.raw, getattr(output, 'agent', None))
+        except Exception as e:
+            # The run goes on; a rerun just repeats this task
+            logging.error(f"Could not save the checkpoint of task {output.name}: {e}")
+
     @crew
     def crew(self) -> Crew:
         # Create an instance of LLM with the correct model and API key
@@ -274,26 +300,25 @@ class OportunityFinderCrew:
             model=MODEL_NAME,
             api_key=api_key,
         )
+        agents = [
+            self.user_context_analyzer(),
+            self.job_opportunity_finder(),
+            self.event_opportunity_finder(),
+            self.course_opportunity_finder(),
+            self.professional_development_finder(),
+        ]
+        if self.telemetry is not None:
+            telemetry.instrument([tool for a in agents for tool in (a.tools or [])])
         return Crew(
-            agents=[
-                self.user_context_analyzer(),
-                self.job_opportunity_finder(),
-                self.event_opportunity_finder(),
-                self.course_opportunity_finder(),
-                self.professional_development_finder(),
-            ],
-            tasks=[
-                self.analyze_user_context_task(),
-                self.find_job_opportunities_task(),
-                self.find_event_opportunities_task(),
-                self.find_course_opportunities_task(),
-                self.find_professional_development_task(),
-            ],
+            agents=agents,
+            tasks=self._pending_tasks(),
+            task_callback=self._task_completed,
             # Use the llm_instance for manager_llm
             manager_llm=llm_instance,
             process=Process.hierarchical,
             respect_context_window=True,
-            memory=True,
+            # Memory carries state between runs: off when replaying (or recording) a cassette
+            memory=cassettes.installed() is None,
             planning=True,
         )
 
@@ -1,12 +1,28 @@
 #!/usr/bin/env python
 import sys
-from crew import OportunityFinderCrew
+import time
+import uuid
+import cassettes
+import telemetry
+from crew import OportunityFinderCrew, TASK_ORDER
+from user_context import format_for_prompt
+from reranking import rerank_and_store
 import logging  # Add import for logging if not present
 import os  # Ensure os is imported for path operations
 
+# Cassetes gravados por usuário (CASSETE_ARQUIVO escolhe outro arquivo)
+DIRETORIO_CASSETES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cassetes')
+
+
+def caminho_cassete(user_id):
+    return os.getenv('CASSETE_ARQUIVO') or os.path.join(DIRETORIO_CASSETES, f"{user_id}.json")
+
+
 def run():
     """
     Executa o crew.
+    Com CASSETE_MODO=record as chamadas ao LLM, à Serply e à Cohere são gravadas
+    em cassetes/<user_id>.json, que replay e test reproduzem sem rede.
     """
     # Add the 'src' directory to sys.path to resolve imports
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -16,48 +32,153 @@ def run():
         logging.debug(f"Adicionado ao sys.path: {src_dir}")
     
     user_id = sys.argv[1] if len(sys.argv) > 1 else 'user123'
-    crew_instance = OportunityFinderCrew(user_id=user_id)
-
-    logging.info("Iniciando a execução das tarefas do crew.")
-    # Executa todas as tarefas do crew
-    crew_instance.crew().kickoff()
-    logging.info("Execução das tarefas do crew concluída.")
+    # Id de uma execução a retomar; sem ele, retoma a última execução inacabada
+    # do usuário com o mesmo contexto (ver checkpoints.py)
+    run_id = sys.argv[2] if len(sys.argv) > 2 else None
+    cassettes.install_from_env(caminho_cassete(user_id))
+    executar(user_id, run_id)
 
     # Mostra as oportunidades salvas no MongoDB
     mostrar_oportunidades(user_id)
 
 
-def mostrar_oportunidades(user_id):
+def executar(user_id, run_id=None, gravar=True):
+    """
+    Executa (ou retoma) uma execução do crew para o usuário e retorna as saídas
+    das tarefas e as oportunidades ranqueadas.
+    Com gravar=False (replay e test) o MongoDB só é lido: não há checkpoints nem
+    registro em CrewRuns, e Oportunidades, o catálogo e o ContextoConsolidado
+    ficam como estavam.
+    """
+    crew_instance = OportunityFinderCrew(user_id=user_id, persist=gravar)
+
+    # Contexto consolidado do usuário, entregue aos agentes já no início
+    user_context = crew_instance.context_assembler.get(user_id)
+    contexto_prompt = format_for_prompt(user_context)
+
+    # Retoma a execução interrompida: as tarefas já concluídas não são repetidas
+    checkpoints = crew_instance.checkpoints
+    if gravar:
+        crew_instance.run_id = run_id = checkpoints.start(user_id, contexto_prompt, run_id)
+        completed = checkpoints.completed(run_id)
+    else:
+        run_id, completed = run_id or uuid.uuid4().hex, {}
+    pendentes = [nome for nome in TASK_ORDER if nome not in completed]
+
+    # Tempos, tokens e chamadas a ferramentas desta tentativa, gravados em CrewRuns
+    registro = telemetry.activate(telemetry.RunTelemetry(run_id, user_id, pendentes))
+    crew_instance.telemetry = registro
+    status = 'falhou'
+    try:
+        saida = None
+        if pendentes:
+            logging.info("Iniciando a execução das tarefas do crew.")
+            saida = crew_instance.crew().kickoff(inputs={'user_context': contexto_prompt})
+            logging.info("Execução das tarefas do crew concluída.")
+        if gravar:
+            # Saídas de todas as tarefas, inclusive as das tentativas anteriores
+            resultado = checkpoints.task_outputs(run_id, TASK_ORDER)
+        else:
+            resultado = [t for nome in TASK_ORDER for t in saida.tasks_output if t.name == nome]
+
+        # Ordena as oportunidades pela semelhança com o perfil, remove duplicatas, salva
+        # e alimenta o catálogo global usado pelas próximas execuções
+        with registro.stage('pos_processamento'):
+            oportunidades = rerank_and_store(crew_instance.app.db, user_id, resultado, contexto_prompt,
+                                             embed=crew_instance.catalog.embed, catalog=crew_instance.catalog,
+                                             fetcher=crew_instance.fetcher, persist=gravar)
+        status = 'concluida'
+    except Exception as e:
+        if gravar:
+            checkpoints.finish(run_id, error=e)
+        raise
+    finally:
+        telemetry.activate(None)
+        registro.save(crew_instance.app.db if gravar else None, status)
+    if gravar:
+        checkpoints.finish(run_id)
+    return resultado, oportunidades
+
+
+def train():
+    """
+    Treina o crew com feedback humano (Crew.train do CrewAI): depois de cada
+    tarefa o CrewAI pede uma avaliação no terminal e grava as sugestões em
+    <arquivo>, usadas pelos agentes nas execuções seguintes. Não grava
+    checkpoints, oportunidades nem CrewRuns.
+    Uso: train [n_iterations] [arquivo] [user_id]
+    """
+    n_iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    arquivo = sys.argv[2] if len(sys.argv) > 2 else 'trained_agents_data.pkl'
+    user_id = sys.argv[3] if len(sys.argv) > 3 else 'user123'
+    crew_instance = OportunityFinderCrew(user_id=user_id, persist=False)
+    contexto_prompt = format_for_prompt(crew_instance.context_assembler.get(user_id))
+    crew_instance.crew().train(n_iterations=n_iterations, filename=arquivo, inputs={'user_context': contexto_prompt})
+
+
+def replay():
+    """
+    Reproduz uma execução do crew a partir do cassete gravado, sem acessar LLM, Serply nem Cohere
+    e sem gravar nada no MongoDB.
+    Uso: replay <user_id> [latência], onde latência multiplica o tempo de resposta gravado (padrão 0).
+    """
+    user_id = sys.argv[1] if len(sys.argv) > 1 else 'user123'
+    latencia = float(sys.argv[2]) if len(sys.argv) > 2 else float(os.getenv('CASSETE_LATENCIA', 0))
+    cassettes.install(cassettes.Cassette(caminho_cassete(user_id), 'replay', latencia))
+    _, oportunidades = executar(user_id, gravar=False)
+    mostrar_oportunidades(user_id, oportunidades)
+
+
+def test():
+    """
+    Teste de regressão offline: reproduz o cassete n_iterations vezes e confere
+    que todas as execuções produzem as mesmas saídas. Mostra o tempo de cada uma,
+    que sem latência simulada é o custo da orquestração do próprio crew.
+    Como o replay, não grava nada no MongoDB.
+    Uso: test [n_iterations] [user_id]
+    """
+    n_iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    user_id = sys.argv[2] if len(sys.argv) > 2 else 'user123'
+    cassete = cassettes.install(cassettes.Cassette(caminho_cassete(user_id), 'replay',
+                                                   float(os.getenv('CASSETE_LATENCIA', 0))))
+    referencia, divergentes = None, 0
+    for iteracao in range(1, n_iterations + 1):
+        inicio = time.perf_counter()
+        saidas = [(saida.name, saida.raw) for saida in executar(user_id, gravar=False)[0]]
+        duracao = time.perf_counter() - inicio
+        if referencia is None:
+            referencia = saidas
+        elif saidas != referencia:
+            divergentes += 1
+        print(f"Execução {iteracao}: {duracao:.2f}s, {len(saidas)} tarefas"
+              f"{'' if saidas == referencia else ' (saídas diferentes da primeira)'}")
+    print(f"Cassete: {cassete.stats}")
+    if divergentes:
+        sys.exit(f"{divergentes} de {n_iterations} execuções divergiram da primeira.")
+
+
+def mostrar_oportunidades(user_id, oportunidades=None):
     """
-    Exibe as oportunidades salvas na coleção 'Oportunidades'.
+    Exibe as oportunidades informadas ou, sem elas, as salvas na coleção 'Oportunidades'.
     """
-    # Conecta ao banco de dados MongoDB
-    crew_instance = OportunityFinderCrew(user_id=user_id)
-    db = crew_instance.app.db  # Updated to access MongoDB instance
-    collection_opportunities = db['Oportunidades']
+    if oportunidades is None:
+        # Conecta ao banco de dados MongoDB
+        crew_instance = OportunityFinderCrew(user_id=user_id)
+        db = crew_instance.app.db  # Updated to access MongoDB instance
+        collection_opportunities = db['Oportunidades']
 
-    # Recupera as oportunidades do usuário
-    oportunidades = collection_opportunities.find_one({'user_id': user_id})
+        # Recupera as oportunidades do usuário, das mais relevantes para as menos
+        oportunidades = list(collection_opportunities.find({'user_id': user_id}).sort('relevancia', -1))
 
     if not oportunidades:
         print("\nNenhuma oportunidade encontrada no momento.")
         return
 
     print("\n\n--- Oportunidades Encontradas ---")
-    if 'trabalho' in oportunidades:
-        print("\n- **Oportunidades de Trabalho**:")
-        for trabalho in oportunidades['trabalho']:
-            print(f"  - {trabalho}")
-
-    if 'educacao' in oportunidades:
-        print("\n- **Oportunidades de Educação**:")
-        for curso in oportunidades['educacao']:
-            print(f"  - {curso}")
-
-    if 'evento' in oportunidades:
-        print("\n- **Oportunidades de Eventos**:")
-        for evento in oportunidades['evento']:
-            print(f"  - {evento}")
+    for oportunidade in oportunidades:
+        link = f" ({oportunidade['link']})" if oportunidade.get('link') else ""
+        print(f"  - [{oportunidade.get('tipo')}] {oportunidade.get('titulo')}{link} "
+              f"- relevância {oportunidade.get('relevancia', 0):.2f}")
 
 if __name__ == "__main__":
     run()
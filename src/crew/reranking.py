@@ -0,0 +1,265 @@
+import os
+import re
+import json
+import uuid
+import logging
+import datetime
+
+import numpy as np
+
+import embeddings_compactos
+
+# Finder task -> opportunity type stored in Oportunidades
+TASK_TYPES = {
+    'find_job_opportunities_task': 'trabalho',
+    'find_event_opportunities_task': 'evento',
+    'find_course_opportunities_task': 'educacao',
+    'find_professional_development_task': 'desenvolvimento',
+}
+# Candidates at least this similar to a better-scored one are dropped as duplicates
+DEDUP_THRESHOLD = float(os.getenv('OPORTUNIDADES_LIMIAR_DUPLICATA', 0.92))
+# Opportunities kept per user after ranking
+MAX_OPPORTUNITIES = int(os.getenv('OPORTUNIDADES_MAXIMO', 30))
+# Texts per Cohere embed call
+EMBED_BATCH = 96
+# Time budget for fetching the candidates' pages before ranking
+ENRICH_DEADLINE_S = float(os.getenv('RASPAGEM_PRAZO_S', 20))
+SUMMARY_CHARS = 300
+
+_URL = re.compile(r'https?://[^\s)\]>"\'}]+')
+_ITEM = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s+(.*)$')
+_BOLD = re.compile(r'\*\*(.+?)\*\*')
+_URL_LABEL = re.compile(r'\b(?:link|url|site|fonte)\s*:\s*(?=https?://)', re.I)
+
+
+def _clean(text):
+    return re.sub(r'\s+', ' ', text.replace('**', '').replace('__', '')).strip(' -:–|')
+
+
+def _from_json(raw, kind):
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        match = re.search(r'\[.*\]', raw, re.S)
+        if not match:
+            return None
+        try:
+            data = json.loads(match.group(0))
+        except ValueError:
+            return None
+    if isinstance(data, dict):
+        data = next((v for v in data.values() if isinstance(v, list)), [])
+    if not isinstance(data, list):
+        return None
+    candidates = []
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        title = item.get('titulo') or item.get('title') or item.get('nome') or item.get('name')
+        if not title:
+            continue
+        candidates.append({
+            'titulo': _clean(str(title)),
+            'descricao': _clean(str(item.get('descricao') or item.get('description') or '')),
+            'link': item.get('link') or item.get('url'),
+            'tipo': kind,
+        })
+    return candidates
+
+
+def parse_candidates(raw, kind):
+    """Extracts opportunities from a finder's output.
+
+    Accepts a JSON list (titulo/title, descricao/description, link/url) or
+    the markdown lists the agents usually write: one item per bullet, the
+    title in bold or before the first colon, and the first URL as the link.
+    Indented lines continue the previous item.
+    """
+    if not raw:
+        return []
+    candidates = _from_json(raw, kind)
+    if candidates is not None:
+        return candidates
+
+    candidates, current = [], None
+    for line in raw.splitlines():
+        item = _ITEM.match(line)
+        if item is None:
+            if current is not None and line.strip():
+                current['_rest'].append(line.strip())
+            continue
+        text = item.group(1)
+        bold = _BOLD.search(text)
+        if bold:
+            title, rest = bold.group(1), text[bold.end():]
+        else:
+            title, _, rest = text.partition(':')
+        current = {'titulo': title, '_rest': [rest], 'tipo': kind}
+        candidates.append(current)
+
+    parsed = []
+    for candidate in candidates:
+        rest = _URL_LABEL.sub('', ' '.join(candidate.pop('_rest')))
+        urls = _URL.findall(candidate['titulo'] + ' ' + rest)
+        title = _clean(_URL.sub('', candidate['titulo']))
+        if not title:
+            continue
+        candidate.update({
+            'titulo': title,
+            'descricao': _clean(re.sub(r'\[([^\]]*)\]\([^)]*\)', r'\1', _URL.sub('', rest)).replace('()', '')),
+            'link': urls[0].rstrip('.,;') if urls else None,
+        })
+        parsed.append(candidate)
+    return parsed
+
+
+def candidates_from_crew_output(output):
+    """Candidates of every finder task in a CrewOutput (or a list of TaskOutputs)."""
+    candidates = []
+    for task_output in getattr(output, 'tasks_output', output) or []:
+        kind = TASK_TYPES.get(getattr(task_output, 'name', None))
+        if kind is None:
+            continue  # context analysis
+        found = parse_candidates(getattr(task_output, 'raw', '') or '', kind)
+        logging.info(f"{task_output.name}: {len(found)} candidate opportunities.")
+        candidates.extend(found)
+    return candidates
+
+
+def enrich(candidates, fetcher, deadline_s=ENRICH_DEADLINE_S):
+    """Adds a 'resumo' from each candidate's page (meta description or the
+    start of its text). Pages not fetched within the deadline are skipped."""
+    pages = {p['url']: p for p in fetcher.fetch_many([c.get('link') for c in candidates], deadline_s)}
+    enriched = 0
+    for candidate in candidates:
+        page = pages.get(candidate.get('link'))
+        if not page or 'erro' in page:
+            continue
+        summary = page.get('descricao') or page.get('texto', '')
+        if summary:
+            candidate['resumo'] = ' '.join(summary.split())[:SUMMARY_CHARS]
+            enriched += 1
+    logging.info(f"Enrichment: {enriched} of {len(candidates)} candidates with page summaries ({fetcher.stats}).")
+    return candidates
+
+
+class CohereEmbedder:
+    """Batch embeddings with the model of the active Contexto configuration."""
+
+    def __init__(self, model):
+        # Same Cohere client setup as aplicativo.py and chatbot.py
+        self.client = embeddings_compactos.cliente_cohere()
+        self.model = model
+
+    @classmethod
+    def from_db(cls, db):
+        # Falls back to embeddings_compactos.MODELO_PADRAO before any migration
+        return cls(embeddings_compactos.configuracao_ativa(db)['modelo'])
+
+    def __call__(self, texts, input_type, truncate='END'):
+        vectors = []
+        for start in range(0, len(texts), EMBED_BATCH):
+            vectors.extend(embeddings_compactos.embedar(self.client, texts[start:start + EMBED_BATCH], self.model,
+                                                        input_type, truncate))
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def collapse_duplicates(unit_vectors, scores, links, threshold=DEDUP_THRESHOLD):
+    """Indices to keep, best score first: each kept candidate suppresses the
+    remaining ones at cosine >= threshold or with the same link."""
+    similarity = unit_vectors @ unit_vectors.T
+    normalized_links = np.array([(link or '').rstrip('/').lower() for link in links], dtype=object)
+    suppressed = np.zeros(len(scores), dtype=bool)
+    keep, merged = [], {}
+    for i in np.argsort(-scores, kind='stable'):
+        if suppressed[i]:
+            continue
+        duplicates = similarity[i] >= threshold
+        if normalized_links[i]:
+            duplicates |= normalized_links == normalized_links[i]
+        duplicates &= ~suppressed
+        suppressed |= duplicates
+        keep.append(int(i))
+        merged[int(i)] = np.flatnonzero(duplicates).tolist()
+    return keep, merged
+
+
+def rerank(candidates, profile_text, embed, threshold=DEDUP_THRESHOLD, limit=MAX_OPPORTUNITIES):
+    """Scores candidates against the user profile, collapses near-duplicates
+    and returns at most `limit` of them (all if None), best first, with 'relevancia' set.
+    Each result carries its unit vector under '_embedding' (not stored in
+    Oportunidades; the catalogue indexes it)."""
+    if not candidates:
+        return []
+    texts = [f"{c['titulo']}. {c['descricao']} {c.get('resumo', '')}".strip() for c in candidates]
+    documents = _normalize(embed(texts, 'search_document'))
+    # Long profiles keep their end: the statements are oldest first
+    profile = _normalize(embed([profile_text], 'search_query', truncate='START'))[0]
+    scores = documents @ profile
+
+    keep, merged = collapse_duplicates(documents, scores, [c.get('link') for c in candidates], threshold)
+    ranked = []
+    for i in keep[:limit]:
+        candidate = dict(candidates[i])
+        candidate['relevancia'] = round(float(scores[i]), 4)
+        candidate['_embedding'] = documents[i]
+        # Finders that returned the same opportunity
+        candidate['tipos'] = sorted({candidates[j]['tipo'] for j in merged[i]})
+        if not candidate.get('link'):
+            candidate['link'] = next((candidates[j]['link'] for j in merged[i] if candidates[j].get('link')), None)
+        ranked.append(candidate)
+    logging.info(f"Reranking: {len(candidates)} candidates, {len(keep)} after deduplication, {len(ranked)} kept.")
+    return ranked
+
+
+def store(collection, user_id, ranked):
+    """Replaces the user's opportunities with the ranked ones.
+
+    The new set is written first, tagged with a run marker, and only then are
+    the user's other documents deleted: a reader never finds the list empty,
+    and a failed write leaves the previous set in place."""
+    now = datetime.datetime.utcnow()
+    run = uuid.uuid4().hex
+    documents = [{k: v for k, v in c.items() if not k.startswith('_')}
+                 | {'user_id': user_id, 'criado_em': now, 'execucao': run}
+                 for c in ranked]
+    if documents:
+        try:
+            collection.insert_many(documents)
+        except Exception:
+            # A partial write must not stay mixed with the previous set
+            collection.delete_many({'user_id': user_id, 'execucao': run})
+            raise
+    collection.delete_many({'user_id': user_id, 'execucao': {'$ne': run}})
+    return len(documents)
+
+
+def rerank_and_store(db, user_id, crew_output, profile_text, embed=None, catalog=None, fetcher=None,
+                     persist=True):
+    """Post-processing stage run after OportunityFinderCrew.kickoff().
+    With a fetcher the candidates' pages are read first; the deduplicated
+    candidates also feed the global catalogue. With persist=False (cassette
+    replays) neither Oportunidades nor the catalogue are written."""
+    candidates = candidates_from_crew_output(crew_output)
+    if not candidates:
+        logging.warning(f"No opportunities could be parsed from the crew output for {user_id}.")
+        return []
+    if fetcher is not None:
+        enrich(candidates, fetcher)
+    embed = embed or CohereEmbedder.from_db(db)
+    # Every deduplicated candidate goes to the catalogue; the user keeps the best ones
+    ranked = rerank(candidates, profile_text, embed, limit=None)
+    if not persist:
+        return ranked[:MAX_OPPORTUNITIES]
+    store(db['Oportunidades'], user_id, ranked[:MAX_OPPORTUNITIES])
+    if catalog is not None:
+        try:
+            catalog.register(ranked, getattr(embed, 'model', None))
+        except Exception as e:
+            logging.error(f"Could not update the opportunity catalogue: {e}")
+    return ranked[:MAX_OPPORTUNITIES]
@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+import re
+import sys
+import time
+import logging
+import argparse
+import datetime
+import functools
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+RUNS_COLLECTION = 'CrewRuns'
+# Roles crewai gives its own agents
+PLANNER_ROLE = 'Task Execution Planner'
+MANAGER_ROLE = 'Crew Manager'
+DELEGATION_TOOLS = ('Delegate work to coworker', 'Ask question to coworker')
+# crewai system prompts start with "You are {role}. {backstory}"
+_ROLE = re.compile(r'^\s*You are (.+?)\.(?:\s|$)')
+
+_active = None
+_local = threading.local()
+_patched = set()
+_patch_lock = threading.Lock()
+
+
+def _agent_role(messages):
+    for message in messages or []:
+        if isinstance(message, dict) and message.get('role') == 'system':
+            match = _ROLE.match(str(message.get('content') or ''))
+            if match:
+                return match.group(1)
+    return 'desconhecido'
+
+
+class _Counters:
+    __slots__ = ('llm_calls', 'llm_s', 'prompt_tokens', 'completion_tokens', 'tool_calls', 'tool_s')
+
+    def __init__(self):
+        self.llm_calls = self.prompt_tokens = self.completion_tokens = self.tool_calls = 0
+        self.llm_s = self.tool_s = 0.0
+
+    def document(self):
+        return {'llm_chamadas': self.llm_calls, 'llm_s': round(self.llm_s, 3),
+                'tokens_prompt': self.prompt_tokens, 'tokens_resposta': self.completion_tokens,
+                'ferramentas_chamadas': self.tool_calls, 'ferramentas_s': round(self.tool_s, 3)}
+
+
+class RunTelemetry:
+    """Timings and usage of one crew run, saved to CrewRuns by save().
+
+    LLM calls are attributed to the agent whose system prompt they carry and
+    to the task in progress (tasks run one at a time; task_done() moves on to
+    the next). Tool calls go to the agent whose LLM call preceded them in the
+    same thread. The planner's calls count as planning, and the manager's
+    as delegation overhead; delegated work itself is timed separately.
+    """
+
+    def __init__(self, run_id, user_id, tasks):
+        self.run_id = run_id
+        self.user_id = user_id
+        self.tasks = list(tasks)
+        self._lock = threading.Lock()
+        self._task = 0
+        self._started = time.perf_counter()
+        self.started_at = datetime.datetime.utcnow()
+        self._boundaries = []
+        self._planning_end = None
+        self._task_counters = [_Counters() for _ in self.tasks]
+        self._agents = {}
+        self._tools = {}
+        self._stages = {}
+        self.totals = _Counters()
+
+    # ---- hooks ----
+
+    def llm_call(self, role, duration, usage):
+        prompt = getattr(usage, 'prompt_tokens', 0) or 0
+        completion = getattr(usage, 'completion_tokens', 0) or 0
+        with self._lock:
+            counters = [self.totals, self._agents.setdefault(role, _Counters())]
+            if role == PLANNER_ROLE:
+                self._planning_end = time.perf_counter()
+            elif self._task < len(self.tasks):
+                counters.append(self._task_counters[self._task])
+            for c in counters:
+                c.llm_calls += 1
+                c.llm_s += duration
+                c.prompt_tokens += prompt
+                c.completion_tokens += completion
+
+    def tool_call(self, name, role, duration, error):
+        with self._lock:
+            calls = self._tools.setdefault(name, [])
+            calls.append((duration, error))
+            if name in DELEGATION_TOOLS:
+                return  # the coworker's own calls are already counted
+            counters = [self.totals, self._agents.setdefault(role, _Counters())]
+            if self._task < len(self.tasks):
+                counters.append(self._task_counters[self._task])
+            for c in counters:
+                c.tool_calls += 1
+                c.tool_s += duration
+
+    def task_done(self, name=None):
+        with self._lock:
+            self._boundaries.append(time.perf_counter())
+            self._task += 1
+
+    @contextmanager
+    def stage(self, name):
+        """Times a stage outside the crew (e.g. post-processing)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stages[name] = round(time.perf_counter() - start, 3)
+
+    # ---- record ----
+
+    def document(self, status='concluida'):
+        now = time.perf_counter()
+        planning_end = self._planning_end or self._started
+        starts = [planning_end] + self._boundaries
+        tasks = []
+        for i, name in enumerate(self.tasks):
+            entry = {'nome': name, **self._task_counters[i].document()}
+            if i < len(self._boundaries):
+                entry['duracao_s'] = round(self._boundaries[i] - starts[i], 3)
+            else:
+                entry['concluida'] = False
+            tasks.append(entry)
+        tools = []
+        for name, calls in sorted(self._tools.items()):
+            durations = np.array([d for d, _ in calls])
+            tools.append({'nome': name, 'chamadas': len(calls), 'erros': sum(1 for _, e in calls if e),
+                          'duracao_s': round(float(durations.sum()), 3),
+                          'p50_s': round(float(np.percentile(durations, 50)), 3),
+                          'p95_s': round(float(np.percentile(durations, 95)), 3)})
+        manager = self._agents.get(MANAGER_ROLE, _Counters())
+        delegated = [d for name in DELEGATION_TOOLS for d, _ in self._tools.get(name, [])]
+        return {
+            'run_id': self.run_id,
+            'user_id': self.user_id,
+            'status': status,
+            'inicio': self.started_at,
+            'duracao_s': round(now - self._started, 3),
+            'planejamento': {'duracao_s': round(planning_end - self._started, 3),
+                             **self._agents.get(PLANNER_ROLE, _Counters()).document()},
+            'gerente': {'llm_chamadas': manager.llm_calls, 'llm_s': round(manager.llm_s, 3),
+                        'delegacoes': len(delegated), 'delegado_s': round(sum(delegated), 3)},
+            'tarefas': tasks,
+            'agentes': [{'papel': role, **c.document()} for role, c in sorted(self._agents.items())],
+            'ferramentas': tools,
+            'etapas': dict(self._stages),
+            'totais': self.totals.document(),
+        }
+
+    def save(self, db, status='concluida'):
+        """Stores the run's document in CrewRuns (only logs it without a db)."""
+        document = self.document(status)
+        if db is not None:
+            try:
+                db[RUNS_COLLECTION].insert_one(document)
+            except Exception as e:
+                logging.error(f"Could not save the telemetry of run {self.run_id}: {e}")
+        totals = document['totais']
+        logging.info(f"Run {self.run_id}: {document['duracao_s']}s, {totals['llm_chamadas']} LLM calls, "
+                     f"{totals['tokens_prompt']}+{totals['tokens_resposta']} tokens, "
+                     f"{totals['ferramentas_chamadas']} tool calls.")
+        return document
+
+
+# ---- hooks into litellm and the tools ----
+
+def _patch_litellm():
+    import litellm
+
+    original = litellm.completion
+
+    def completion(*args, **kwargs):
+        telemetry = _active
+        if telemetry is None:
+            return original(*args, **kwargs)
+        messages = kwargs.get('messages', args[1] if len(args) > 1 else None)
+        role = _local.agent = _agent_role(messages)
+        start = time.perf_counter()
+        response = original(*args, **kwargs)
+        telemetry.llm_call(role, time.perf_counter() - start, getattr(response, 'usage', None))
+        return response
+
+    litellm.completion = completion
+
+
+def _timed(original, tool_name):
+    """Wraps a tool's run function so each call is reported as tool_name.
+    functools.wraps keeps the signature StructuredTool reads the arguments from."""
+
+    @functools.wraps(original)
+    def run(*args, **kwargs):
+        telemetry = _active
+        if telemetry is None:
+            return original(*args, **kwargs)
+        role = getattr(_local, 'agent', 'desconhecido')
+        start, error = time.perf_counter(), False
+        try:
+            return original(*args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            # A delegated coworker's LLM calls changed the thread's agent
+            _local.agent = role
+            telemetry.tool_call(tool_name(args), role, time.perf_counter() - start, error)
+
+    return run
+
+
+def _patch_tool(tool_class):
+    tool_class._run = _timed(tool_class._run, lambda args: getattr(args[0], 'name', tool_class.__name__))
+
+
+def _patch_delegation():
+    """The delegation tools of crewai 0.76 are StructuredTools built by
+    AgentTools.tools() around its delegate_work and ask_question methods,
+    so the methods are wrapped (before tools() binds them)."""
+    try:
+        from crewai.tools.agent_tools import AgentTools
+    except ImportError:
+        return
+    for method, tool_name in zip(('delegate_work', 'ask_question'), DELEGATION_TOOLS):
+        setattr(AgentTools, method, _timed(getattr(AgentTools, method), lambda args, name=tool_name: name))
+
+
+def instrument(tools=()):
+    """Installs the hooks (once per process) for litellm, the delegation
+    tools and the classes of the given tool instances."""
+    with _patch_lock:
+        if 'litellm' not in _patched:
+            _patch_litellm()
+            _patched.add('litellm')
+        if 'delegation' not in _patched:
+            _patch_delegation()
+            _patched.add('delegation')
+        for tool_class in {type(t) for t in tools}:
+            if tool_class not in _patched:
+                _patch_tool(tool_class)
+                _patched.add(tool_class)
+
+
+def activate(telemetry):
+    """Makes telemetry the run the hooks report to (None stops reporting)."""
+    global _active
+    _active = telemetry
+    return telemetry
+
+
+# ---- report ----
+
+def _stats(values):
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return '-'
+    return f"média {values.mean():.1f}  p50 {np.percentile(values, 50):.1f}  p95 {np.percentile(values, 95):.1f}"
+
+
+def _grouped_lines(runs, key, name_key):
+    """Per task or per agent averages over the runs."""
+    grouped = {}
+    for run in runs:
+        for item in run.get(key, []):
+            grouped.setdefault(item[name_key], []).append(item)
+    lines = []
+    for name, items in grouped.items():
+        lines.append(f"  {name}")
+        durations = [i['duracao_s'] for i in items if 'duracao_s' in i]
+        if durations:
+            lines.append(f"    duração (s): {_stats(durations)}")
+        average = {field: sum(i[field] for i in items) / len(runs)
+                   for field in ('llm_chamadas', 'llm_s', 'tokens_prompt', 'tokens_resposta',
+                                 'ferramentas_chamadas', 'ferramentas_s')}
+        lines.append(f"    por execução: {average['llm_chamadas']:.1f} chamadas ao LLM ({average['llm_s']:.1f}s, "
+                     f"{average['tokens_prompt']:.0f}+{average['tokens_resposta']:.0f} tokens), "
+                     f"{average['ferramentas_chamadas']:.1f} chamadas a ferramentas ({average['ferramentas_s']:.1f}s)")
+    return lines
+
+
+def report(runs):
+    """Aggregates across CrewRuns documents, as printable lines."""
+    if not runs:
+        return ["Nenhuma execução registrada."]
+    lines = [f"{len(runs)} execuções ({sum(r['status'] == 'concluida' for r in runs)} concluídas)",
+             f"  duração (s): {_stats([r['duracao_s'] for r in runs])}",
+             f"  planejamento (s): {_stats([r['planejamento']['duracao_s'] for r in runs])}",
+             f"  gerente, LLM (s): {_stats([r['gerente']['llm_s'] for r in runs])}",
+             f"  tokens por execução: {_stats([r['totais']['tokens_prompt'] + r['totais']['tokens_resposta'] for r in runs])}"]
+    lines += ["", "Tarefas:"] + _grouped_lines(runs, 'tarefas', 'nome')
+    lines += ["", "Agentes:"] + _grouped_lines(runs, 'agentes', 'papel')
+    lines += ["", "Ferramentas:"]
+    tools = {}
+    for run in runs:
+        for tool in run.get('ferramentas', []):
+            total = tools.setdefault(tool['nome'], {'chamadas': 0, 'erros': 0, 'duracao_s': 0.0, 'p95_s': []})
+            total['chamadas'] += tool['chamadas']
+            total['erros'] += tool['erros']
+            total['duracao_s'] += tool['duracao_s']
+            total['p95_s'].append(tool['p95_s'])
+    for name, total in sorted(tools.items(), key=lambda item: -item[1]['duracao_s']):
+        lines.append(f"  {name}: {total['chamadas']} chamadas, {total['erros']} erros, "
+                     f"{total['duracao_s'] / max(total['chamadas'], 1):.2f}s em média, "
+                     f"p95 até {max(total['p95_s']):.2f}s")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Relatório das execuções do crew registradas em CrewRuns.")
+    parser.add_argument('--user-id', help="Só as execuções deste usuário.")
+    parser.add_argument('--dias', type=float, default=30, help="Execuções dos últimos N dias (padrão 30).")
+    parser.add_argument('--limite', type=int, default=500, help="No máximo N execuções, as mais recentes.")
+    args = parser.parse_args(argv)
+
+    from crew import MongoDBApp
+
+    query = {'inicio': {'$gte': datetime.datetime.utcnow() - datetime.timedelta(days=args.dias)}}
+    if args.user_id:
+        query['user_id'] = args.user_id
+    runs = list(MongoDBApp().db[RUNS_COLLECTION].find(query).sort('inicio', -1).limit(args.limite))
+    print("\n".join(report(runs)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
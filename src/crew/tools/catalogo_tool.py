@@ -0,0 +1,36 @@
+from typing import Any, Optional, Type
+
+from crewai_tools import BaseTool
+from pydantic import BaseModel, Field
+
+from catalogo import MIN_RESULTS
+
+
+class CatalogoInput(BaseModel):
+    consulta: str = Field(..., description="Palavras-chave da busca (área, tema, cargo, certificação).")
+    modalidade: Optional[str] = Field(None, description="online, presencial ou hibrido.")
+    localizacao: Optional[str] = Field(None, description="Cidade ou estado, se a oportunidade for presencial.")
+
+
+class CatalogoOportunidadesTool(BaseTool):
+    name: str = "Catálogo de oportunidades"
+    description: str = (
+        "Busca no catálogo de oportunidades já encontradas para outros usuários. Use antes da busca na web: "
+        "ela só é necessária se o catálogo indicar cobertura insuficiente."
+    )
+    args_schema: Type[BaseModel] = CatalogoInput
+    catalog: Any = None
+    kind: Optional[str] = None
+
+    def _run(self, consulta: str, modalidade: Optional[str] = None, localizacao: Optional[str] = None) -> str:
+        results, stale = self.catalog.search(consulta, kind=self.kind, modality=modalidade, location=localizacao)
+        lines = [
+            f"- **{r['titulo']}**: {r.get('descricao', '')} {r.get('link') or ''}".rstrip()
+            for r in results
+        ]
+        if len(results) < MIN_RESULTS:
+            gap = f"Cobertura insuficiente ({len(results)} resultados"
+            if stale:
+                gap += f", {stale} desatualizados omitidos"
+            lines.append(gap + "): complete com a busca na web.")
+        return "\n".join(lines)
@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import codecs
+import hashlib
+import logging
+import tempfile
+import threading
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_DIR = os.getenv('RASPAGEM_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'hackathon_meta_paginas'))
+# Concurrent requests to the same host, and in total
+PER_HOST = int(os.getenv('RASPAGEM_POR_HOST', 4))
+WORKERS = int(os.getenv('RASPAGEM_PARALELO', 16))
+# A page checked this recently is served from disk without a request
+FRESH_FOR_S = float(os.getenv('RASPAGEM_FRESCOR_S', 3600))
+MAX_BYTES = 2 * 1024 * 1024
+MAX_CHARS = 20000
+USER_AGENT = 'Mozilla/5.0 (compatible; HackathonMetaBot/0.1)'
+
+_SKIPPED = {'script', 'style', 'noscript', 'svg', 'template', 'iframe'}
+_BLOCKS = {'p', 'div', 'li', 'br', 'tr', 'section', 'article', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'footer'}
+
+
+class TextExtractor(HTMLParser):
+    """Incremental HTML to text: feed() it chunks as they arrive.
+
+    Keeps the <title>, the meta/og description and the visible text, up to
+    max_chars; `full` turns true once there is enough text to stop reading.
+    """
+
+    def __init__(self, max_chars=MAX_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.title = ''
+        self.description = ''
+        self._parts = []
+        self._size = 0
+        self._skipping = 0
+        self._in_title = False
+
+    @property
+    def full(self):
+        return self._size >= self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIPPED:
+            self._skipping += 1
+        elif tag == 'title':
+            self._in_title = True
+        elif tag == 'meta' and not self.description:
+            attrs = dict(attrs)
+            if (attrs.get('name') or attrs.get('property') or '').lower() in ('description', 'og:description'):
+                self.description = ' '.join((attrs.get('content') or '').split())
+        if tag in _BLOCKS:
+            self._parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in _SKIPPED and self._skipping:
+            self._skipping -= 1
+        elif tag == 'title':
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skipping and not self.full and data.strip():
+            self._parts.append(data)
+            self._size += len(data)
+
+    def text(self):
+        lines = (' '.join(line.split()) for line in ''.join(self._parts).splitlines())
+        return '\n'.join(line for line in lines if line)[:self.max_chars]
+
+
+class PageFetcher:
+    """Fetches pages concurrently through one pooled session.
+
+    Requests per host are bounded, pages are revalidated with conditional
+    GETs (ETag / Last-Modified) and the extracted text is kept on disk by
+    content hash, so an unchanged page costs a 304, or nothing at all
+    within FRESH_FOR_S of the last check.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, per_host=PER_HOST, workers=WORKERS, fresh_for_s=FRESH_FOR_S,
+                 timeout=(3.05, 10), max_bytes=MAX_BYTES, max_chars=MAX_CHARS):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.cache_dir = cache_dir
+        self.per_host = per_host
+        self.workers = workers
+        self.fresh_for_s = fresh_for_s
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        os.makedirs(os.path.join(cache_dir, 'meta'), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, 'texto'), exist_ok=True)
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=per_host)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='paginas')
+        self.stats = {'rede': 0, 'nao_modificadas': 0, 'cache': 0, 'erros': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    # ---- disk cache ----
+
+    def _meta_path(self, url):
+        return os.path.join(self.cache_dir, 'meta', hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+    def _text_path(self, digest):
+        return os.path.join(self.cache_dir, 'texto', digest + '.json')
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_json(path, data):
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temporary, path)
+
+    def _cached_page(self, url, meta, source):
+        content = self._read_json(self._text_path(meta['hash'])) if meta else None
+        if content is None:
+            return None
+        self._count('cache' if source == 'cache' else 'nao_modificadas')
+        return dict(content, url=url, origem=source)
+
+    # ---- network ----
+
+    def _host_semaphore(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self._hosts_lock:
+            semaphore = self._hosts.get(host)
+            if semaphore is None:
+                semaphore = self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+        return semaphore
+
+    def fetch(self, url):
+        """{'url', 'titulo', 'descricao', 'texto', 'origem'} or {'url', 'erro'}.
+        origem is 'rede', 'nao_modificada' (304) or 'cache'."""
+        meta_path = self._meta_path(url)
+        meta = self._read_json(meta_path)
+        if meta and time.time() - meta.get('verificado_em', 0) < self.fresh_for_s:
+            page = self._cached_page(url, meta, 'cache')
+            if page is not None:
+                return page
+
+        headers = {}
+        if meta and os.path.exists(self._text_path(meta['hash'])):
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        try:
+            with self._host_semaphore(url):
+                with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                    if response.status_code == 304 and headers:
+                        meta['verificado_em'] = time.time()
+                        self._write_json(meta_path, meta)
+                        page = self._cached_page(url, meta, 'nao_modificada')
+                        if page is not None:
+                            return page
+                    response.raise_for_status()
+                    digest, content = self._extract(response)
+                    validators = {'etag': response.headers.get('ETag'),
+                                  'last_modified': response.headers.get('Last-Modified')}
+        except Exception as e:
+            self._count('erros')
+            logging.warning(f"Could not fetch {url}: {e}")
+            return {'url': url, 'erro': str(e)}
+
+        # Same bytes as another URL, or as before the validators changed: reuse the text
+        if not os.path.exists(self._text_path(digest)):
+            self._write_json(self._text_path(digest), content)
+        self._write_json(meta_path, dict(validators, url=url, hash=digest, verificado_em=time.time()))
+        self._count('rede')
+        return dict(content, url=url, origem='rede')
+
+    def _extract(self, response):
+        """Hashes the body and extracts its text while it streams in."""
+        content_type = response.headers.get('Content-Type', 'text/html').lower()
+        decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        extractor = TextExtractor(self.max_chars)
+        hasher = hashlib.sha256()
+        size = 0
+        for chunk in response.iter_content(chunk_size=16384):
+            hasher.update(chunk)
+            size += len(chunk)
+            if 'html' in content_type or 'text' in content_type:
+                extractor.feed(decoder.decode(chunk))
+            # Enough text, or too large: the prefix read so far identifies the page
+            if extractor.full or size >= self.max_bytes:
+                break
+        extractor.close()
+        return hasher.hexdigest(), {
+            'titulo': ' '.join(extractor.title.split()),
+            'descricao': extractor.description,
+            'texto': extractor.text(),
+        }
+
+    def fetch_many(self, urls, deadline_s=None):
+        """Pages of the distinct URLs, in input order. URLs not done by
+        deadline_s come back with an 'erro'."""
+        distinct = list(dict.fromkeys(u for u in urls if u))
+        futures = {url: self._executor.submit(self.fetch, url) for url in distinct}
+        limit = time.monotonic() + deadline_s if deadline_s else None
+        pages = []
+        for url, future in futures.items():
+            try:
+                remaining = None if limit is None else max(0.0, limit - time.monotonic())
+                pages.append(future.result(timeout=remaining))
+            except Exception as e:
+                future.cancel()
+                pages.append({'url': url, 'erro': str(e) or 'timeout'})
+        return pages
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
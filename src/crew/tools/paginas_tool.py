@@ -0,0 +1,30 @@
+from typing import Any, List, Type
+
+from crewai_tools import BaseTool
+from pydantic import BaseModel, Field
+
+
+class PaginasInput(BaseModel):
+    links: List[str] = Field(..., description="Links das páginas de oportunidades a ler (até 20 por vez).")
+
+
+class PaginasOportunidadesTool(BaseTool):
+    name: str = "Leitor de páginas de oportunidades"
+    description: str = (
+        "Lê várias páginas de uma vez e devolve o título, a descrição e o início do texto de cada uma. "
+        "Use para confirmar datas, modalidade, local e requisitos de oportunidades encontradas."
+    )
+    args_schema: Type[BaseModel] = PaginasInput
+    fetcher: Any = None
+    max_chars: int = 1500
+
+    def _run(self, links: List[str]) -> str:
+        blocks = []
+        for page in self.fetcher.fetch_many(links[:20], deadline_s=30):
+            if 'erro' in page:
+                blocks.append(f"{page['url']}\nNão foi possível ler a página: {page['erro']}")
+                continue
+            header = page.get('titulo') or page['url']
+            body = page.get('descricao') or ''
+            blocks.append(f"{header} ({page['url']})\n{body}\n{page.get('texto', '')[:self.max_chars]}".strip())
+        return "\n\n".join(blocks)
@@ -0,0 +1,192 @@
+import os
+import re
+import json
+import logging
+import datetime
+import threading
+from collections import OrderedDict, Counter
+
+from busca_hibrida import tokenizar
+from catalogo import OPPORTUNITY_WORDS, detect_modality
+
+# Collection holding the precomputed context document of each user
+CONTEXT_COLLECTION = 'ContextoConsolidado'
+# Only the most recent user statements are kept in the compact context
+MAX_STATEMENTS = 40
+MAX_STATEMENT_CHARS = 500
+# Search hints derived from the statements for the finders' tools
+MAX_KEYWORDS = 10
+# Conversational words tokenizar() keeps but that make poor search terms
+_CHAT_WORDS = frozenset('''
+eu meu minha meus minhas voce quero queria gostaria gosto tenho estou sou fazer ter ser muito
+tambem mas nao sim ja ainda agora hoje ano anos area coisa algo alguma algum trabalhar estudar
+moro resido vivo online remoto presencial hibrido
+'''.split())
+# "moro em Campinas", "sou de Recife", "vivo no Rio de Janeiro"
+_LOCATION = re.compile(
+    r'\b(?i:moro|resido|vivo|sou|estou)\s+(?:em|de|no|na|do|da)\s+'
+    r'([A-ZÀ-Ú][\wÀ-ú]+(?:\s+(?:de|do|da|dos|das)?\s*[A-ZÀ-Ú][\wÀ-ú]+)*)'
+)
+USERS_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'usuarios.json'))
+
+
+class UserContextAssembler:
+    """Builds and caches one compact context document per user.
+
+    The document aggregates the user's own statements (from HistoricoConversa,
+    falling back to Contexto) and the profile from usuarios.json. Embedding
+    arrays are never fetched. A cached document is reused while its source
+    stamp (message count and last_updated of the conversation, or the count
+    and newest document of the Contexto fallback) matches, so any new message
+    invalidates it.
+    """
+
+    def __init__(self, db, users_file=USERS_FILE, cache_size=256, persist=True):
+        self.db = db
+        # Without persist the documents are only cached in memory
+        self.persist = persist
+        self.users_file = users_file
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _source_stamp(self, user_id):
+        # Reads just two scalar fields, never the messages array
+        conversa = self.db['HistoricoConversa'].aggregate([
+            {'$match': {'user_id': user_id}},
+            {'$project': {'_id': 0, 'last_updated': 1, 'message_count': {'$size': {'$ifNull': ['$messages', []]}}}},
+        ])
+        conversa = next(iter(conversa), None)
+        if conversa and conversa['message_count']:
+            return {'message_count': conversa['message_count'], 'last_updated': conversa.get('last_updated')}
+        # Without a conversation the statements come from the Contexto fallback,
+        # so the stamp follows its newest document and size
+        colecao = self._context_collection()
+        filtro = {'user_id': user_id, 'role': 'user'}
+        ultimo = colecao.find_one(filtro, {'_id': 1, 'criado_em': 1}, sort=[('_id', -1)])
+        if ultimo is None:
+            return None
+        return {'contexto': colecao.name, 'statement_count': colecao.count_documents(filtro),
+                'last_id': ultimo['_id'], 'last_created': ultimo.get('criado_em')}
+
+    def _context_collection(self):
+        # Active Contexto collection (it changes after an embedding migration)
+        config = self.db['Configuracao'].find_one({'_id': 'embeddings_contexto'}) or {}
+        return self.db[config.get('colecao', 'Contexto')]
+
+    def _load_profile(self, user_id):
+        try:
+            with open(self.users_file, 'r') as f:
+                users = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read users file {self.users_file}: {e}")
+            return {}
+        for email, record in users.items():
+            if isinstance(record, dict) and record.get('user_id') == user_id:
+                return {k: v for k, v in record.items() if k != 'password'} | {'email': email}
+        return {}
+
+    def _load_statements(self, user_id):
+        # Only the human messages leave the server, already truncated to the last MAX_STATEMENTS
+        resultado = self.db['HistoricoConversa'].aggregate([
+            {'$match': {'user_id': user_id}},
+            {'$project': {
+                '_id': 0,
+                'statements': {'$slice': [
+                    {'$filter': {'input': {'$ifNull': ['$messages', []]}, 'cond': {'$eq': ['$$this.type', 'human']}}},
+                    -MAX_STATEMENTS,
+                ]},
+            }},
+            {'$project': {'statements.content': 1, 'statements.timestamp': 1}},
+        ])
+        documento = next(iter(resultado), None)
+        if documento and documento.get('statements'):
+            return [s.get('content', '') for s in documento['statements']]
+
+        # CLI sessions without a stored conversation: fall back to the active
+        # Contexto collection, without the vectors
+        cursor = self._context_collection().find(
+            {'user_id': user_id, 'role': 'user'},
+            {'_id': 0, 'content': 1},
+        ).sort('_id', -1).limit(MAX_STATEMENTS)
+        return [d.get('content', '') for d in reversed(list(cursor))]
+
+    def build(self, user_id, stamp=None):
+        """Assembles the compact context document of a user and persists it."""
+        statements = [s[:MAX_STATEMENT_CHARS] for s in self._load_statements(user_id) if s]
+        context = {
+            'user_id': user_id,
+            'profile': self._load_profile(user_id),
+            'statements': statements,
+            'source': stamp if stamp is not None else self._source_stamp(user_id),
+            'assembled_at': datetime.datetime.utcnow(),
+        }
+        if self.persist:
+            self.db[CONTEXT_COLLECTION].replace_one({'user_id': user_id}, context, upsert=True)
+            context.pop('_id', None)
+        logging.info(f"Contexto consolidado montado para {user_id}: {len(statements)} declarações.")
+        return context
+
+    def get(self, user_id):
+        """Returns the cached context of a user, rebuilding it if stale."""
+        stamp = self._source_stamp(user_id)
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached is not None and cached['source'] == stamp:
+                self._cache.move_to_end(user_id)
+                return cached
+
+        stored = self.db[CONTEXT_COLLECTION].find_one({'user_id': user_id}, {'_id': 0})
+        if stored is None or stored.get('source') != stamp:
+            stored = self.build(user_id, stamp)
+
+        with self._lock:
+            self._cache[user_id] = stored
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return stored
+
+    def invalidate(self, user_id):
+        """Drops the cached context of a user, in memory and in MongoDB."""
+        with self._lock:
+            self._cache.pop(user_id, None)
+        self.db[CONTEXT_COLLECTION].delete_one({'user_id': user_id})
+
+
+def search_hints(context):
+    """Inputs for the finders' searches, derived from the user's statements:
+    {'keywords': most frequent terms, 'modality': online/presencial/hibrido or
+    None, 'location': last place the user said they live in, or None}."""
+    statements = context.get('statements') or []
+    places = [m.group(1) for s in statements for m in _LOCATION.finditer(s)]
+    location = places[-1] if places else None
+    excluded = _CHAT_WORDS | OPPORTUNITY_WORDS | set(tokenizar(' '.join(places)))
+    counts = Counter(t for s in statements for t in set(tokenizar(s)) if t not in excluded and not t.isdigit())
+    return {
+        'keywords': [t for t, _ in counts.most_common(MAX_KEYWORDS)],
+        'modality': detect_modality(' '.join(statements)) if statements else None,
+        'location': location,
+    }
+
+
+def format_for_prompt(context):
+    """Renders a context document as the text handed to the agents."""
+    linhas = []
+    profile = context.get('profile') or {}
+    if profile:
+        linhas.append("Perfil: " + ", ".join(f"{k}: {v}" for k, v in sorted(profile.items())))
+    statements = context.get('statements') or []
+    if statements:
+        linhas.append("Declarações do usuário (mais antigas primeiro):")
+        linhas.extend(f"- {s}" for s in statements)
+    else:
+        linhas.append("Nenhuma informação do usuário foi coletada ainda.")
+    hints = search_hints(context)
+    if hints['keywords']:
+        linhas.append("Palavras-chave para as buscas: " + ", ".join(hints['keywords']))
+    if hints['modality']:
+        linhas.append(f"Modalidade preferida: {hints['modality']}")
+    if hints['location']:
+        linhas.append(f"Localização: {hints['location']}")
+    return "\n".join(linhas)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Os módulos da raiz e os do crew (src/crew) se importam como módulos de topo
+sys.path[:0] = [RAIZ, os.path.join(RAIZ, 'src', 'crew')]
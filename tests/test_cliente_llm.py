@@ -0,0 +1,40 @@
+import types
+
+import pytest
+
+import cliente_llm
+
+
+class ErroHttp(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _provedor(nome, chamadas, status=None):
+    def criar(**parametros):
+        chamadas.append(nome)
+        if status is not None:
+            raise ErroHttp(status)
+        return nome
+
+    cliente = types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=criar)))
+    return cliente_llm.Provedor(nome, lambda: cliente, 'modelo')
+
+
+def test_erro_do_provedor_vai_ao_proximo():
+    chamadas = []
+    cliente = cliente_llm.ClienteCompletions([_provedor('a', chamadas, 503), _provedor('b', chamadas)])
+    assert cliente.completar([], 'teste') == 'b'
+    assert chamadas == ['a', 'b']
+    assert cliente.estatisticas['failovers'] == 1
+
+
+def test_requisicao_invalida_nao_faz_failover():
+    chamadas = []
+    cliente = cliente_llm.ClienteCompletions([_provedor('a', chamadas, 400), _provedor('b', chamadas)])
+    with pytest.raises(ErroHttp):
+        cliente.completar([], 'teste')
+    assert chamadas == ['a']
+    assert cliente.estatisticas['failovers'] == 0
+    assert cliente.provedores[0].disjuntor.estado == cliente_llm.FECHADO
@@ -0,0 +1,53 @@
+import os
+import re
+
+import mongomock
+
+import manutencao
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Coleções sem dados de um usuário específico, que a purga não percorre
+COLECOES_SEM_USUARIO = {'Configuracao', 'CatalogoOportunidades'}
+
+# Nomes de coleção no código: db['X'], obter_colecao('X'), constantes *_COLLECTION/COLECAO_*
+# e a coleção padrão do Contexto em .get('colecao', 'X')
+_NOME_COLECAO = re.compile(
+    r"""(?:db\[\s*|obter_colecao\(\s*|_COLLECTION\s*=\s*|COLECAO_\w+\s*=\s*|get\('colecao',\s*)'([A-Z]\w+)'"""
+)
+
+
+def _colecoes_no_codigo():
+    nomes = set()
+    for pasta, subpastas, arquivos in os.walk(RAIZ):
+        subpastas[:] = [d for d in subpastas if not d.startswith('.') and d not in ('tests', '__pycache__')]
+        for arquivo in arquivos:
+            if arquivo.endswith('.py'):
+                with open(os.path.join(pasta, arquivo), encoding='utf-8') as f:
+                    nomes.update(_NOME_COLECAO.findall(f.read()))
+    return nomes
+
+
+def test_toda_colecao_do_codigo_esta_classificada():
+    # Uma coleção nova com dados do usuário precisa entrar em COLECOES_USUARIO
+    # (ou, sem eles, em COLECOES_SEM_USUARIO) para a purga não deixá-la para trás
+    nomes = _colecoes_no_codigo()
+    assert {'HistoricoConversa', 'CrewRuns', 'TravasUsuario'} <= nomes
+    esquecidas = nomes - set(manutencao.COLECOES_USUARIO) - COLECOES_SEM_USUARIO
+    assert not esquecidas, f"Coleções fora de COLECOES_USUARIO: {sorted(esquecidas)}"
+
+
+def test_purgar_usuario_remove_de_todas_as_colecoes(monkeypatch):
+    db = mongomock.MongoClient()['DadosUsuários']
+    for colecao, campo in manutencao.COLECOES_USUARIO.items():
+        db[colecao].insert_many([{campo: 'u1'}, {campo: 'u2'}])
+    db['Contexto_embed-v4'].insert_many([{'user_id': 'u1'}, {'user_id': 'u2'}])
+    monkeypatch.setattr(manutencao.conexao_mongo, 'conectar', lambda: {'DadosUsuários': db})
+    monkeypatch.setattr(manutencao.conexao_mongo, 'NOME_BANCO', 'DadosUsuários')
+    monkeypatch.setattr(manutencao, 'load_dotenv', lambda: None)
+
+    assert manutencao.main(['--sim', '--pausa-ms', '0', 'purgar-usuario', '--user-id', 'u1']) == 0
+
+    for colecao, campo in manutencao.colecoes_usuario(db).items():
+        assert db[colecao].count_documents({campo: 'u1'}) == 0, colecao
+        assert db[colecao].count_documents({campo: 'u2'}) == 1, colecao
@@ -0,0 +1,27 @@
+import pytest
+
+crewai = pytest.importorskip('crewai')
+
+import telemetry  # noqa: E402
+from crewai import Agent  # noqa: E402
+from crewai.tools.agent_tools import AgentTools  # noqa: E402
+
+
+def test_delegacao_do_crewai_instalado_e_medida(monkeypatch):
+    coworker = Agent(role='Pesquisador', goal='Pesquisar', backstory='Pesquisa oportunidades.', llm='gpt-4o-mini')
+    monkeypatch.setattr(type(coworker), 'execute_task', lambda self, task, context=None, tools=None: 'feito',
+                        raising=False)
+    telemetry.instrument()
+    tools = {tool.name: tool for tool in AgentTools(agents=[coworker]).tools()}
+    assert set(telemetry.DELEGATION_TOOLS) <= set(tools)
+
+    registro = telemetry.activate(telemetry.RunTelemetry('run', 'u1', []))
+    try:
+        argumentos = {'context': 'contexto', 'coworker': 'Pesquisador'}
+        assert tools['Delegate work to coworker'].run({'task': 'buscar vagas', **argumentos}) == 'feito'
+        assert tools['Ask question to coworker'].run({'question': 'qual curso?', **argumentos}) == 'feito'
+    finally:
+        telemetry.activate(None)
+
+    documento = registro.document()
+    assert documento['gerente']['delegacoes'] == 2
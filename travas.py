@@ -0,0 +1,102 @@
+"""
+Travas por usuário para serializar o ciclo ler-alterar-gravar da conversa.
+
+    travas = TravasLocais()                       # threads do mesmo processo
+    travas = TravasMongo(db['TravasUsuario'])     # workers e máquinas diferentes
+
+    with travas.trava(user_id, espera_s=30) as obtida:
+        ...
+
+trava() espera até espera_s pela vez e devolve se a trava foi obtida; quem
+chama decide se segue sem ela. As travas são só uma fila: a garantia contra
+escritas perdidas é a versão do documento (ver salvar_memoria em aplicativo.py).
+"""
+import os
+import time
+import uuid
+import socket
+import logging
+import datetime
+import threading
+from contextlib import contextmanager
+
+
+class TravasLocais:
+    """
+    Uma threading.Lock por chave, criada na primeira espera e descartada
+    quando ninguém mais a segura nem espera por ela.
+    """
+
+    def __init__(self):
+        self._travas = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def trava(self, chave, espera_s=30.0):
+        with self._lock:
+            entrada = self._travas.get(chave)
+            if entrada is None:
+                entrada = self._travas[chave] = [threading.Lock(), 0]
+            entrada[1] += 1
+        obtida = entrada[0].acquire(timeout=espera_s)
+        try:
+            yield obtida
+        finally:
+            if obtida:
+                entrada[0].release()
+            with self._lock:
+                entrada[1] -= 1
+                if entrada[1] == 0:
+                    del self._travas[chave]
+
+
+class TravasMongo:
+    """
+    Trava consultiva numa coleção do MongoDB, válida entre processos.
+
+    Cada trava é um documento {_id: chave, dono, expira_em}. Obter é um upsert
+    que só casa com uma trava vencida: se outra estiver valendo, o upsert
+    colide no _id e a tentativa se repete até espera_s. A trava vence sozinha
+    após prazo_s, para um worker que morreu segurando-a não bloquear o usuário.
+    """
+
+    def __init__(self, colecao, prazo_s=300.0, intervalo_s=0.05, intervalo_max_s=0.5):
+        self.colecao = colecao
+        self.prazo_s = prazo_s
+        self.intervalo_s = intervalo_s
+        self.intervalo_max_s = intervalo_max_s
+        self._identificacao = f"{socket.gethostname()}:{os.getpid()}"
+
+    def _tentar(self, chave, dono):
+        from pymongo.errors import DuplicateKeyError
+
+        agora = datetime.datetime.utcnow()
+        try:
+            self.colecao.update_one(
+                {'_id': chave, 'expira_em': {'$lt': agora}},
+                {'$set': {'dono': dono, 'expira_em': agora + datetime.timedelta(seconds=self.prazo_s)}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    @contextmanager
+    def trava(self, chave, espera_s=30.0):
+        dono = f"{self._identificacao}:{threading.get_ident()}:{uuid.uuid4().hex[:8]}"
+        limite = time.monotonic() + espera_s
+        intervalo = self.intervalo_s
+        obtida = self._tentar(chave, dono)
+        while not obtida and time.monotonic() < limite:
+            time.sleep(min(intervalo, max(0.0, limite - time.monotonic())))
+            intervalo = min(intervalo * 2, self.intervalo_max_s)
+            obtida = self._tentar(chave, dono)
+        try:
+            yield obtida
+        finally:
+            if obtida:
+                try:
+                    # Só remove se ainda for nossa (pode ter vencido e sido tomada)
+                    self.colecao.delete_one({'_id': chave, 'dono': dono})
+                except Exception as e:
+                    logging.warning(f"Falha ao liberar a trava de {chave}; ela vence em {self.prazo_s:.0f}s: {e}")
@@ -0,0 +1,42 @@
+"""
+Ponto de entrada WSGI para produção.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+APP_MODULO escolhe o backend: aplicativo (padrão, MongoDB) ou app__ (arquivos
+locais). Os clientes de Groq, Cohere e MongoDB não são criados aqui: cada
+worker os cria depois do fork, em aquecer() (ver gunicorn.conf.py).
+"""
+import os
+import importlib
+
+APP_MODULO = os.getenv('APP_MODULO', 'aplicativo')
+# Bibliotecas que os apps só importam no primeiro uso. Num mestre pré-fork
+# vale importá-las uma vez aqui (importar não abre conexões): os workers as
+# herdam já carregadas em vez de cada um pagar o tempo de importação
+PRECARREGAR = ('groq', 'cohere', 'pymongo')
+
+for _nome in PRECARREGAR:
+    try:
+        importlib.import_module(_nome)
+    except ImportError:
+        pass
+
+modulo = importlib.import_module(APP_MODULO)
+app = modulo.app
+
+
+def descartar_clientes():
+    if hasattr(modulo, 'descartar_clientes'):
+        modulo.descartar_clientes()
+
+
+def aquecer():
+    if hasattr(modulo, 'aquecer'):
+        modulo.aquecer()
+
+
+def encerrar():
+    # Grava as conversas ainda pendentes no cache antes de o worker sair
+    if hasattr(modulo, 'descarregar_conversas'):
+        modulo.descarregar_conversas()